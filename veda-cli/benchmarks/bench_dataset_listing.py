@@ -0,0 +1,49 @@
+"""
+Times listing a registered output tree through MFT resourceMetadata calls and building its manifest, with
+one listing worker and with the default pool, against the fake MFT server.
+
+    python benchmarks/bench_dataset_listing.py --dirs 50 --files-per-dir 200 --delay 0.005
+"""
+import argparse
+import os
+import tempfile
+import time
+from fake_mft import FakeMFTServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirs", type=int, default=50)
+    parser.add_argument("--files-per-dir", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.005, help="Seconds the fake server takes per listing")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    os.environ["HOME"] = tempfile.mkdtemp()
+    from veda_cli.datasets import listing
+    from veda_cli.datasets import manifest
+
+    server = FakeMFTServer(metadata_delay=args.delay).start()
+    server.configure_cli()
+    server.add_storage("bench-storage")
+    server.add_files("bench-storage", {f"/run/diags/d{d:03d}/f{f:05d}.data": 1024 * (f + 1)
+                                       for d in range(args.dirs) for f in range(args.files_per_dir)})
+    calls = server.transfer_service.calls
+    try:
+        for workers in args.workers:
+            calls.clear()
+            start = time.perf_counter()
+            files = list(listing.walk("bench-storage", "/run/diags", workers))
+            listed = time.perf_counter() - start
+            start = time.perf_counter()
+            manifest.write(files)
+            written = time.perf_counter() - start
+            print(f"{workers:>2} workers: listed {len(files)} files in {listed:.2f}s "
+                  f"({len(files) / listed:,.0f} files/s, {calls.get('resourceMetadata', 0)} RPCs), "
+                  f"manifest {written * 1000:.0f} ms")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Times the critical path of launching an ECCO run on EC2, from provisioning to mpirun running, against a
+moto EC2 mock with an injected per call latency, a local SSH server that takes boot_delay seconds to come up
+and the fake MFT server. Prints the traced phases so a regression in one step shows up on its own.
+
+    pip install moto
+    python benchmarks/bench_launch.py --latency 0.1 --boot-delay 2 --handshake-delay 0.2
+"""
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+import boto3
+from moto import mock_aws
+from fake_mft import FakeMFTServer
+from fake_ssh import FakeSSHServer
+from bench_provision import add_latency
+
+NAMELIST = " &PARM01\n tRef=20.,\n &\n &PARM03\n nIter0=1,\n nTimeSteps=227903,\n deltaT=3600.,\n &\n"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds added to every EC2 API call")
+    parser.add_argument("--boot-delay", type=float, default=2.0, help="Seconds until the instance answers SSH")
+    parser.add_argument("--handshake-delay", type=float, default=0.2)
+    parser.add_argument("--mft-delay", type=float, default=0.0, help="Seconds added to every MFT call")
+    args = parser.parse_args()
+
+    os.environ["HOME"] = tempfile.mkdtemp()
+    from veda_cli import ssh
+    from veda_cli import trace
+    from veda_cli.applications.ecco import ecco_app
+
+    trace.enable(os.devnull)
+    run_dir = tempfile.mkdtemp()
+    with open(os.path.join(run_dir, "data"), "w") as f:
+        f.write(NAMELIST)
+
+    mft_server = FakeMFTServer(metadata_delay=args.mft_delay).start()
+    mft_server.configure_cli()
+    ssh_server = FakeSSHServer(handshake_delay=args.handshake_delay, boot_delay=args.boot_delay)
+
+    def create_ec2_client(access_key, secret_key, region):
+        client = boto3.client("ec2", region_name=region, aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        add_latency(client, args.latency, calls)
+        return client
+
+    calls = []
+    with mock_aws(), \
+            mock.patch.object(ecco_app, "RUN_DIR", run_dir), \
+            mock.patch.object(ecco_app, "create_ec2_client", create_ec2_client), \
+            mock.patch.object(ecco_app, "create_ssh_connection",
+                              lambda user, ip, key_file: ssh.connect(user, "127.0.0.1", key_file, port=ssh_server.port)), \
+            mock.patch("typer.prompt", return_value="test"):
+        # moto loads its EC2 backend on the first call, keep that out of the measurement
+        boto3.client("ec2", region_name="us-west-2", aws_access_key_id="test",
+                     aws_secret_access_key="test").describe_key_pairs()
+
+        # The instance starts booting when it is requested, which is close enough to when the launch starts
+        ssh_server.start()
+        start = time.perf_counter()
+        ecco_app.run_ecco_on_ec2("bench", {}, test_steps=5)
+        elapsed = time.perf_counter() - start
+
+    ssh_server.stop()
+    mft_server.stop()
+    print()
+    print(f"launch returned after {elapsed:.2f}s, {len(calls)} EC2 calls")
+    print(trace.format_report(trace.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
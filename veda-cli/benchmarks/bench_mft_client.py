@@ -0,0 +1,49 @@
+"""
+Compares building a new MFTClient per call against the pooled client on a local stub gRPC server.
+
+    python benchmarks/bench_mft_client.py --calls 500
+"""
+import argparse
+import time
+from airavata_mft_cli import config as configcli
+from airavata_mft_sdk import mft_client
+from airavata_mft_sdk.common import StorageCommon_pb2
+from fake_mft import FakeMFTServer
+from veda_cli import mft
+
+
+def new_client():
+    return mft_client.MFTClient(transfer_api_port = configcli.transfer_api_port,
+                                transfer_api_secured = configcli.transfer_api_secured,
+                                resource_service_host = configcli.resource_service_host,
+                                resource_service_port = configcli.resource_service_port,
+                                resource_service_secured = configcli.resource_service_secured,
+                                secret_service_host = configcli.secret_service_host,
+                                secret_service_port = configcli.secret_service_port)
+
+
+def run(get_client, calls):
+    search_req = StorageCommon_pb2.StorageSearchRequest(storageName="local-agent")
+    start = time.perf_counter()
+    for _ in range(calls):
+        get_client().common_api.searchStorages(search_req)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    server = FakeMFTServer().start()
+    server.configure_cli()
+    try:
+        print(f"client per call: {run(new_client, args.calls) * 1000:.3f} ms/call")
+        print(f"pooled client:   {run(mft.get_client, args.calls) * 1000:.3f} ms/call")
+    finally:
+        mft.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Downloads a tree of small diagnostic files and a few larger ones from a local paramiko server that adds a
+delay to every SFTP file open. Compares a one file at a time SFTP fetch with the parallel pipelined engine
+and with packing the files into compressed shards on the server first.
+
+    python benchmarks/bench_output_download.py --files 400 --open-delay 0.02
+"""
+import os
+import time
+import argparse
+import tempfile
+from fake_ssh import FakeSSHServer
+from veda_cli import ssh
+from veda_cli.executions import sftp
+from veda_cli.executions import ouput
+
+
+def field(size):
+    """
+    Model output where land points are written as zeros, which is what makes real diagnostics compress well
+    """
+    ocean = os.urandom(size // 2)
+    return bytes(b if i % 4 < 2 else 0 for i, b in enumerate(ocean + ocean))[:size]
+
+
+def sequential(client, root, files, destination):
+    session = client.open_sftp()
+    try:
+        for path, size, mtime in files:
+            local_path = os.path.join(destination, path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            session.get(root + "/" + path, local_path, prefetch=False)
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--large-files", type=int, default=2)
+    parser.add_argument("--large-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--open-delay", type=float, default=0.02)
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--shard-size", type=int, default=4 * 1024 * 1024)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    root = os.path.join(work_dir, "diags")
+    for i in range(args.files):
+        path = os.path.join(root, "state_2d_set1" if i % 2 else "state_3d_set1", f"day.{i:010d}.data")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(field(args.size))
+    for i in range(args.large_files):
+        with open(os.path.join(root, f"pickup.{i:010d}.data"), "wb") as f:
+            f.write(field(args.large_size))
+
+    server = FakeSSHServer(open_delay=args.open_delay).start()
+    client = ssh.connect("ubuntu", "127.0.0.1", server.write_client_key(work_dir), port=server.port)
+    try:
+        start = time.perf_counter()
+        files = sftp.walk(client, root)
+        print(f"listed {len(files)} files in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        sequential(client, root, files, tempfile.mkdtemp())
+        print(f"sequential sftp:          {time.perf_counter() - start:.2f} s")
+
+        progress = sftp.download(client, root, files, tempfile.mkdtemp(), args.streams)
+        print(f"parallel sftp, {args.streams} streams: {progress.summary()}")
+
+        execution = {"executionId": "bench", "loginUser": "ubuntu", "publicIp": "127.0.0.1", "sshPort": server.port,
+                     "keyPath": os.path.join(work_dir, "fake_ssh_key"), "outputDir": root}
+        start = time.perf_counter()
+        ouput.download_packed(execution, root, tempfile.mkdtemp(), args.streams, args.shard_size)
+        print(f"packed shards:            {time.perf_counter() - start:.2f} s")
+    finally:
+        ssh.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Times ECCO infrastructure provisioning against a moto EC2 mock with an injected per call latency.
+
+    pip install moto
+    python benchmarks/bench_provision.py --latency 0.2
+"""
+import argparse
+import os
+import tempfile
+import time
+import boto3
+from moto import mock_aws
+
+
+def add_latency(ec2_client, latency, calls):
+    def on_call(**kwargs):
+        calls.append(kwargs.get("model").name if kwargs.get("model") else "")
+        time.sleep(latency)
+    ec2_client.meta.events.register("before-call.ec2", on_call)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every EC2 API call")
+    args = parser.parse_args()
+
+    os.environ["HOME"] = tempfile.mkdtemp()
+    os.makedirs(os.path.join(os.environ["HOME"], ".veda", "credentials", "ssh"))
+    from veda_cli.applications.ecco import provision
+
+    with mock_aws():
+        ec2_client = boto3.client("ec2", region_name="us-west-2", aws_access_key_id="test",
+                                  aws_secret_access_key="test")
+        # moto loads its EC2 backend on the first call, keep that out of the measurement
+        ec2_client.describe_key_pairs()
+        calls = []
+        add_latency(ec2_client, args.latency, calls)
+
+        for run, cache_key in (("cold", None), ("warm", None), ("cached", "bench/us-west-2"),
+                               ("cached again", "bench/us-west-2")):
+            calls.clear()
+            start = time.perf_counter()
+            provision.provision_infrastructure(ec2_client, cache_key)
+            elapsed = time.perf_counter() - start
+            print(f"{run}: {elapsed:.2f}s for {len(calls)} calls "
+                  f"({len(calls) * args.latency:.2f}s if issued one at a time)")
+
+
+if __name__ == "__main__":
+    main()
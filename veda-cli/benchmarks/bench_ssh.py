@@ -0,0 +1,69 @@
+"""
+Compares a fresh SSH connection per remote command against the shared connection and the control socket
+daemon, on a local paramiko server with an emulated handshake delay.
+
+    python benchmarks/bench_ssh.py --commands 20 --handshake-delay 0.5
+"""
+import os
+import time
+import argparse
+import tempfile
+from fake_ssh import FakeSSHServer
+from veda_cli import ssh
+
+
+def run(fn, commands):
+    start = time.perf_counter()
+    for _ in range(commands):
+        exit_status, stdout, stderr = fn()
+        assert exit_status == 0 and stdout.strip() == "ok", (exit_status, stdout, stderr)
+    return (time.perf_counter() - start) / commands
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--handshake-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    ssh.store.VEDA_HOME = home
+    server = FakeSSHServer(handshake_delay=args.handshake_delay).start()
+    key_file = server.write_client_key(home)
+    execution = {"executionId": "bench", "loginUser": "ubuntu", "publicIp": "127.0.0.1",
+                 "sshPort": server.port, "keyPath": key_file}
+
+    def fresh_connection():
+        client = ssh.connect_execution(execution)
+        try:
+            return ssh.run_on(client, "echo ok")
+        finally:
+            ssh.close(client)
+
+    def control_socket():
+        # Drops the in-process connection so every call has to go through the daemon, like a new CLI invocation
+        ssh.close()
+        return ssh.run(execution, "echo ok")
+
+    try:
+        print(f"connection per command: {run(fresh_connection, args.commands) * 1000:.1f} ms/command")
+        ssh.connect_execution(execution)
+        print(f"shared connection:      {run(lambda: ssh.run_on(ssh.connect_execution(execution), 'echo ok'), args.commands) * 1000:.1f} ms/command")
+
+        ssh.close()
+        ssh.run(execution, "echo ok")
+        deadline = time.monotonic() + 30
+        while not os.path.exists(ssh.socket_path("bench")) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        # Give the daemon time to finish its own handshake before timing it
+        time.sleep(args.handshake_delay + 1)
+        print(f"control socket:         {run(control_socket, args.commands) * 1000:.1f} ms/command")
+        print(f"connections opened on the server: {server.connections}")
+    finally:
+        ssh.stop_daemon("bench")
+        ssh.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures the wall time of fresh interpreter startups: importing the CLI the way the veda entry point does,
+running a cheap command, and importing every sub app up front the way main.py used to.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "veda entry point": "import typer.main, veda_cli.main; typer.main.get_command(veda_cli.main.app)",
+    "veda execution list": "import veda_cli.main; veda_cli.main.app(['execution', 'list'], standalone_mode=False)",
+    "eager sub app imports": "import veda_cli.applications, veda_cli.datasets, veda_cli.executions, "
+                             "veda_cli.executions.ouput, veda_cli.executions.monitor",
+}
+
+HEAVY_MODULES = ["boto3", "paramiko", "grpc", "airavata_mft_sdk.MFTTransferApi_pb2"]
+
+
+def run(code, env):
+    report = "; import sys; print(len(sys.modules), '|', ','.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code + report], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules, heavy = result.stdout.strip().splitlines()[-1].split("|")
+    return elapsed, int(modules), heavy.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ, HOME=tempfile.mkdtemp(), PYTHONPATH=ROOT)
+    for name, code in CASES.items():
+        run(code, env)
+        times = []
+        for _ in range(args.runs):
+            elapsed, modules, heavy = run(code, env)
+            times.append(elapsed)
+        print(f"{name:24s} median {statistics.median(times) * 1000:6.0f} ms, {modules:4d} modules, heavy: {heavy or '-'}")
+
+
+if __name__ == "__main__":
+    main()
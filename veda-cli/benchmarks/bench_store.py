@@ -0,0 +1,72 @@
+"""
+Compares dataset lookup latency of the json store and the sqlite store.
+
+    python benchmarks/bench_store.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from veda_cli import store
+
+
+def make_records(count):
+    for i in range(count):
+        yield {
+            "type": "Dataset" if i % 2 == 0 else "Execution",
+            "storageId": "storage-" + str(i % 50),
+            "name": "dataset-" + str(i),
+            "executionId": "exec-" + str(i),
+            "base_path": "/data/run/" + str(i),
+            "createdTime": "01/01/2023, 00:00:00",
+            "files": ["file-" + str(j) + ".data" for j in range(10)]}
+
+
+def write_json(path, count):
+    records = []
+    for i, record in enumerate(make_records(count)):
+        record["id"] = i + 1
+        records.append(record)
+    with open(path, "w") as f:
+        json.dump({"data": records}, f)
+
+
+def time_lookups(db_conn, count, lookups):
+    names = ["dataset-" + str(random.randrange(0, count, 2)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for name in names:
+        assert len(db_conn.getBy({"type": "Dataset", "name": name})) == 1
+    return (time.perf_counter() - start) / lookups
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--skip-json-above", type=int, default=100000,
+                        help="the json store reparses the whole file per lookup, so skip it for very large stores")
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'backend':>8} {'open (s)':>10} {'lookup (ms)':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as home:
+            write_json(os.path.join(home, "ds.json"), size)
+
+            start = time.perf_counter()
+            sqlite_db = store.open_store("ds", backend="sqlite", home=home)
+            opened = time.perf_counter() - start
+            latency = time_lookups(sqlite_db, size, args.lookups)
+            print(f"{size:>10} {'sqlite':>8} {opened:>10.2f} {latency * 1000:>12.3f}")
+
+            if size <= args.skip_json_above:
+                start = time.perf_counter()
+                json_db = store.open_store("ds", backend="json", home=home)
+                opened = time.perf_counter() - start
+                latency = time_lookups(json_db, size, max(1, args.lookups // 10))
+                print(f"{size:>10} {'json':>8} {opened:>10.2f} {latency * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
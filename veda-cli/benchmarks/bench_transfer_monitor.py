@@ -0,0 +1,66 @@
+"""
+Compares fixed one second polling against the adaptive TransferMonitor using the fake MFT server.
+
+    python benchmarks/bench_transfer_monitor.py --transfers 20 --files 50
+"""
+import argparse
+import time
+from airavata_mft_sdk import mft_client
+from airavata_mft_sdk import MFTTransferApi_pb2
+from fake_mft import FakeMFTServer
+from veda_cli import transfers
+
+
+def submit(client, files):
+    request = MFTTransferApi_pb2.TransferApiRequest(sourceStorageId="local-agent", destinationStorageId="local-agent")
+    request.endpointPaths.extend([MFTTransferApi_pb2.EndpointPaths(sourcePath=f"/src/{i}", destinationPath=f"/dst/{i}")
+                                  for i in range(files)])
+    return client.transfer_api.submitTransfer(request).transferId
+
+
+def fixed_polling(client, transfer_ids):
+    rpcs = 0
+    active = list(transfer_ids)
+    while active:
+        for transfer_id in list(active):
+            state_request = MFTTransferApi_pb2.TransferStateApiRequest(transferId=transfer_id)
+            state_resp = client.transfer_api.getTransferStateSummary(state_request)
+            rpcs += 1
+            if state_resp.percentage == 1.0:
+                active.remove(transfer_id)
+        if active:
+            time.sleep(1)
+    return rpcs
+
+
+def adaptive_monitor(client, transfer_ids, files):
+    monitor = transfers.TransferMonitor(client)
+    for transfer_id in transfer_ids:
+        monitor.add(transfer_id, total_files=files)
+    monitor.wait()
+    return monitor.rpc_count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=20)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--seconds-per-file", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = FakeMFTServer(seconds_per_file=args.seconds_per_file).start()
+    client = mft_client.MFTClient(transfer_api_port=server.port, resource_service_port=server.port,
+                                  secret_service_port=server.port)
+    try:
+        for name, run in [("fixed 1s polling", lambda ids: fixed_polling(client, ids)),
+                          ("adaptive monitor", lambda ids: adaptive_monitor(client, ids, args.files))]:
+            transfer_ids = [submit(client, args.files) for _ in range(args.transfers)]
+            start = time.perf_counter()
+            rpcs = run(transfer_ids)
+            print(f"{name:>18}: {time.perf_counter() - start:6.2f}s wall, {rpcs} state RPCs")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
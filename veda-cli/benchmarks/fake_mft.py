@@ -0,0 +1,193 @@
+"""
+In-process fake of the MFT gRPC services so transfer submission and monitoring can run offline.
+
+    server = FakeMFTServer(seconds_per_file=0.01).start()
+    server.configure_cli()  # points airavata_mft_cli.config at the fake server
+"""
+import threading
+import time
+import uuid
+from concurrent import futures
+import grpc
+from airavata_mft_sdk import MFTAgentStubs_pb2
+from airavata_mft_sdk import MFTTransferApi_pb2
+from airavata_mft_sdk import MFTTransferApi_pb2_grpc
+from airavata_mft_sdk.common import StorageCommon_pb2
+from airavata_mft_sdk.common import StorageCommon_pb2_grpc
+from airavata_mft_sdk.scp import SCPStorage_pb2
+from airavata_mft_sdk.scp import SCPStorageService_pb2_grpc
+from airavata_mft_sdk.scp import SCPCredential_pb2
+from airavata_mft_sdk.scp import SCPSecretService_pb2_grpc
+
+
+class FakeTransferService(MFTTransferApi_pb2_grpc.MFTTransferServiceServicer):
+
+    def __init__(self, seconds_per_file, failing_paths, fail_once, metadata_delay=0.0):
+        self.seconds_per_file = seconds_per_file
+        self.metadata_delay = metadata_delay
+        self.failing_paths = failing_paths
+        self.fail_once = fail_once
+        self.transfers = {}
+        self.files = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def _count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def submitTransfer(self, request, context):
+        self._count("submitTransfer")
+        transfer_id = str(uuid.uuid4())
+        paths = [p.sourcePath for p in request.endpointPaths]
+        self.transfers[transfer_id] = (time.monotonic(), paths)
+        return MFTTransferApi_pb2.TransferApiResponse(transferId=transfer_id)
+
+    def getTransferStateSummary(self, request, context):
+        self._count("getTransferStateSummary")
+        started, paths = self.transfers[request.transferId]
+        duration = max(len(paths), 1) * self.seconds_per_file
+        percentage = min(1.0, (time.monotonic() - started) / duration) if duration > 0 else 1.0
+        done = int(len(paths) * percentage)
+        finished = paths[:done]
+        failed = [p for p in finished if p in self.failing_paths]
+        completed = [p for p in finished if p not in self.failing_paths]
+
+        state = "RUNNING"
+        if percentage == 1.0:
+            state = "FAILED" if failed else "COMPLETED"
+            if self.fail_once:
+                self.failing_paths.difference_update(failed)
+        return MFTTransferApi_pb2.TransferStateSummaryResponse(
+            state=state, percentage=percentage, completed=completed, failed=failed,
+            processing=paths[done:], updateTimeMils=int(time.time() * 1000))
+
+    def resourceMetadata(self, request, context):
+        self._count("resourceMetadata")
+        time.sleep(self.metadata_delay)
+        files = self.files.get(request.idRequest.storageId, {})
+        path = request.idRequest.resourcePath.rstrip("/")
+        if path in files:
+            return MFTAgentStubs_pb2.ResourceMetadata(file=self._file(path, files[path]))
+
+        directory = self._directory(files, path, request.idRequest.recursiveSearch)
+        if not directory.directories and not directory.files:
+            return MFTAgentStubs_pb2.ResourceMetadata(error="No such file or directory " + path)
+        return MFTAgentStubs_pb2.ResourceMetadata(directory=directory)
+
+    def _directory(self, files, path, recursive):
+        prefix = path + "/"
+        directory = MFTAgentStubs_pb2.DirectoryMetadata(friendlyName=path.split("/")[-1], resourcePath=path)
+        children = set()
+        for file_path, size in files.items():
+            if not file_path.startswith(prefix):
+                continue
+            name = file_path[len(prefix):].split("/")[0]
+            if "/" in file_path[len(prefix):]:
+                children.add(name)
+            else:
+                directory.files.append(self._file(file_path, size))
+
+        for name in sorted(children):
+            if recursive:
+                directory.directories.append(self._directory(files, prefix + name, recursive))
+            else:
+                directory.directories.append(MFTAgentStubs_pb2.DirectoryMetadata(friendlyName=name,
+                                                                                 resourcePath=prefix + name))
+        return directory
+
+    def _file(self, path, size):
+        return MFTAgentStubs_pb2.FileMetadata(friendlyName=path.split("/")[-1], resourcePath=path,
+                                              resourceSize=size, updateTime=1)
+
+    def removeTransfer(self, request, context):
+        self._count("removeTransfer")
+        success = self.transfers.pop(request.transferId, None) is not None
+        return MFTTransferApi_pb2.TransferRemoveResponse(success=success)
+
+
+class FakeStorageCommonService(StorageCommon_pb2_grpc.StorageCommonServiceServicer):
+
+    def __init__(self, storages):
+        self.storages = storages
+        self.secrets = {}
+
+    def searchStorages(self, request, context):
+        matches = [StorageCommon_pb2.StorageListEntry(storageId=storage_id, storageName=name, storageType=storage_type)
+                   for storage_id, (name, storage_type) in self.storages.items()
+                   if request.storageName and request.storageName == name
+                   or request.storageId and request.storageId == storage_id]
+        return StorageCommon_pb2.StorageListResponse(storageList=matches)
+
+    def getSecretForStorage(self, request, context):
+        return StorageCommon_pb2.SecretForStorage(storageId=request.storageId,
+                                                  secretId=self.secrets.get(request.storageId, "secret-" + request.storageId))
+
+    def registerSecretForStorage(self, request, context):
+        self.secrets[request.storageId] = request.secretId
+        return request
+
+    def deleteSecretsForStorage(self, request, context):
+        self.secrets.pop(request.storageId, None)
+        return StorageCommon_pb2.SecretForStorageDeleteResponse(status=True)
+
+
+class FakeSCPStorageService(SCPStorageService_pb2_grpc.SCPStorageServiceServicer):
+
+    def __init__(self, storages):
+        self.storages = storages
+
+    def createSCPStorage(self, request, context):
+        storage_id = str(uuid.uuid4())
+        self.storages[storage_id] = (request.name, StorageCommon_pb2.StorageType.SCP)
+        return SCPStorage_pb2.SCPStorage(storageId=storage_id, host=request.host, port=request.port, name=request.name)
+
+    def deleteSCPStorage(self, request, context):
+        success = self.storages.pop(request.storageId, None) is not None
+        return SCPStorage_pb2.SCPStorageDeleteResponse(status=success)
+
+
+class FakeSCPSecretService(SCPSecretService_pb2_grpc.SCPSecretServiceServicer):
+
+    def createSCPSecret(self, request, context):
+        return SCPCredential_pb2.SCPSecret(secretId=str(uuid.uuid4()), user=request.user)
+
+    def deleteSCPSecret(self, request, context):
+        return SCPCredential_pb2.SCPSecretDeleteResponse(status=True)
+
+
+class FakeMFTServer:
+
+    def __init__(self, seconds_per_file=0.0, failing_paths=None, fail_once=False, metadata_delay=0.0):
+        self.storages = {"local-agent": ("local-agent", StorageCommon_pb2.StorageType.LOCAL)}
+        self.transfer_service = FakeTransferService(seconds_per_file, set(failing_paths or []), fail_once,
+                                                    metadata_delay)
+        self.common_service = FakeStorageCommonService(self.storages)
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+        MFTTransferApi_pb2_grpc.add_MFTTransferServiceServicer_to_server(self.transfer_service, self.server)
+        StorageCommon_pb2_grpc.add_StorageCommonServiceServicer_to_server(self.common_service, self.server)
+        SCPStorageService_pb2_grpc.add_SCPStorageServiceServicer_to_server(FakeSCPStorageService(self.storages), self.server)
+        SCPSecretService_pb2_grpc.add_SCPSecretServiceServicer_to_server(FakeSCPSecretService(), self.server)
+        self.port = self.server.add_insecure_port("localhost:0")
+
+    def add_storage(self, storage_id, storage_type=StorageCommon_pb2.StorageType.SCP):
+        self.storages[storage_id] = (storage_id, storage_type)
+
+    def add_files(self, storage_id, files):
+        """
+        files maps absolute paths to sizes. Directories are implied by the paths
+        """
+        self.transfer_service.files.setdefault(storage_id, {}).update(files)
+
+    def configure_cli(self):
+        from airavata_mft_cli import config as configcli
+        configcli.transfer_api_port = self.port
+        configcli.resource_service_port = self.port
+        configcli.secret_service_port = self.port
+
+    def start(self):
+        self.server.start()
+        return self
+
+    def stop(self):
+        self.server.stop(0)
@@ -0,0 +1,192 @@
+"""
+Local paramiko SSH server for offline runs of the SSH, SFTP and monitoring code. Commands are executed by
+the local shell and SFTP is served from the local file system.
+
+    server = FakeSSHServer(handshake_delay=0.5).start()
+    key_file = server.write_client_key(tmp_dir)
+    client = ssh.connect("ubuntu", "127.0.0.1", key_file, port=server.port)
+"""
+import os
+import logging
+import socket
+import threading
+import subprocess
+import time
+import paramiko
+from paramiko import SFTPServer, SFTPServerInterface, SFTPAttributes, SFTPHandle, SFTP_OK
+
+# Banner probes that disconnect right after the banner are expected, keep paramiko from logging each one
+logging.getLogger("paramiko.transport").setLevel(logging.CRITICAL)
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        self.owner.commands.append(command.decode("utf-8"))
+        threading.Thread(target=self.owner._execute, args=(channel, command.decode("utf-8")), daemon=True).start()
+        return True
+
+
+class _Handle(SFTPHandle):
+
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _LocalSFTP(SFTPServerInterface):
+
+    def __init__(self, server, *args, open_delay=0.0, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.open_delay = open_delay
+
+    def _error(self, e):
+        return SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        try:
+            return [SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name) for name in os.listdir(path)]
+        except OSError as e:
+            return self._error(e)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return self._error(e)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return self._error(e)
+        mode = "rb"
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        time.sleep(self.open_delay)
+        handle = _Handle(flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return self._error(e)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.replace(oldpath, newpath)
+        except OSError as e:
+            return self._error(e)
+        return SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return self._error(e)
+        return SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.abspath(path)
+
+
+class FakeSSHServer:
+
+    def __init__(self, handshake_delay=0.0, boot_delay=0.0, open_delay=0.0):
+        """
+        handshake_delay is added before the banner of every connection to mimic a remote handshake. For the first
+        boot_delay seconds the port accepts connections but closes them without a banner, like a booting instance.
+        open_delay is added to every SFTP file open, the per file cost of a remote fetch.
+        """
+        self.handshake_delay = handshake_delay
+        self.open_delay = open_delay
+        self.boot_delay = boot_delay
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.client_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.commands = []
+        self.connections = 0
+        self.started = None
+        self.transports = []
+
+    def write_client_key(self, directory):
+        path = os.path.join(directory, "fake_ssh_key")
+        self.client_key.write_private_key_file(path)
+        return path
+
+    def _execute(self, channel, command):
+        process = subprocess.Popen(["/bin/sh", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        reader.start()
+        try:
+            for chunk in iter(lambda: process.stdout.read1(65536), b""):
+                channel.sendall(chunk)
+            reader.join()
+            channel.sendall_stderr(stderr[0])
+            channel.send_exit_status(process.wait())
+        except (OSError, EOFError):
+            process.kill()
+        finally:
+            channel.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            if time.monotonic() - self.started < self.boot_delay:
+                conn.close()
+                continue
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        time.sleep(self.handshake_delay)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", SFTPServer, _LocalSFTP, open_delay=self.open_delay)
+        self.transports.append(transport)
+        try:
+            transport.start_server(server=_Server(self))
+        except (paramiko.SSHException, EOFError):
+            pass
+
+    def start(self):
+        self.started = time.monotonic()
+        self.sock.listen(64)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
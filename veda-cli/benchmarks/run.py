@@ -0,0 +1,87 @@
+"""
+Runs every benchmark against the local stand-ins (fake MFT server, moto EC2 mock, local SSH server) and prints
+their output followed by a summary. Each benchmark runs in its own process so imports and servers do not leak
+from one into the next.
+
+    python benchmarks/run.py                # full sizes
+    python benchmarks/run.py --quick        # small sizes, about a minute in total
+    python benchmarks/run.py --only store launch --trace traces.ndjson
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# (name, script, modules it needs beyond the package dependencies, full arguments, quick arguments)
+BENCHMARKS = [
+    ("startup", "bench_startup.py", [], ["--runs", "10"], ["--runs", "3"]),
+    ("store", "bench_store.py", [], ["--sizes", "10000", "100000", "1000000"], ["--sizes", "10000"]),
+    ("dataset-listing", "bench_dataset_listing.py", [], ["--dirs", "50", "--files-per-dir", "200"],
+     ["--dirs", "10", "--files-per-dir", "100"]),
+    ("mft-client", "bench_mft_client.py", [], ["--calls", "500"], ["--calls", "100"]),
+    ("transfer-monitor", "bench_transfer_monitor.py", [], ["--transfers", "20", "--files", "50"],
+     ["--transfers", "5", "--files", "20"]),
+    ("ssh", "bench_ssh.py", [], ["--commands", "20", "--handshake-delay", "0.5"],
+     ["--commands", "5", "--handshake-delay", "0.1"]),
+    ("output-download", "bench_output_download.py", [], ["--files", "400", "--open-delay", "0.02"],
+     ["--files", "50", "--large-files", "1", "--large-size", str(1024 * 1024)]),
+    ("provision", "bench_provision.py", ["moto"], ["--latency", "0.2"], ["--latency", "0.05"]),
+    ("launch", "bench_launch.py", ["moto"], ["--latency", "0.1", "--boot-delay", "2"],
+     ["--latency", "0.02", "--boot-delay", "0.5", "--handshake-delay", "0.05"]),
+]
+
+
+def run(script, arguments, trace_file=None, timeout=None):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([PACKAGE_DIR, BENCHMARK_DIR] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    env.pop("VEDA_TRACE", None)
+    if trace_file:
+        env["VEDA_TRACE"] = os.path.abspath(trace_file)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, script)] + arguments, env=env,
+                                cwd=PACKAGE_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                timeout=timeout)
+        return result.returncode, result.stdout, time.perf_counter() - start
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout.decode("utf-8", "replace") if isinstance(e.stdout, bytes) else e.stdout or ""
+        return "timeout", output, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Small sizes, for a check that nothing regressed badly")
+    parser.add_argument("--only", nargs="+", choices=[b[0] for b in BENCHMARKS], help="Benchmarks to run")
+    parser.add_argument("--trace", help="Collect VEDA_TRACE json lines of the benchmark processes in this file")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds after which a benchmark is stopped")
+    args = parser.parse_args()
+
+    summary = []
+    for name, script, needs, full, quick in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        missing = [module for module in needs if importlib.util.find_spec(module) is None]
+        if missing:
+            summary.append((name, "skipped, needs " + ", ".join(missing), 0.0))
+            continue
+
+        print(f"== {name}: {script} {' '.join(quick if args.quick else full)}", flush=True)
+        status, output, elapsed = run(script, quick if args.quick else full, args.trace, args.timeout)
+        print(output.rstrip(), flush=True)
+        summary.append((name, "ok" if status == 0 else f"failed ({status})", elapsed))
+
+    print()
+    print(f"{'benchmark':18s} {'status':24s} {'wall (s)':>9}")
+    for name, status, elapsed in summary:
+        print(f"{name:18s} {status:24s} {elapsed:>9.1f}")
+    if any(status.startswith("failed") for name, status, elapsed in summary):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
+import os
 import typer
+from typing import List, Optional
 from rich.table import Table
 from rich.console import Console
 from pick import pick
 import veda_cli.applications.ecco as ecco
+from veda_cli import output
 
 app = typer.Typer()
 
@@ -32,3 +35,42 @@ def run():
     if option == 'ECCO':
         ecco.run_ecco()
 
+
+@app.command("ensemble")
+def ensemble(name: str = typer.Option(..., help="Name prefix of the ensemble executions"),
+             sweep: List[str] = typer.Option([], help="Parameter sweep as key=v1,v2,... Can be repeated. Keys: time_step, total_time_steps, gravity, rhonil"),
+             access_key: str = typer.Option(None, help="AWS access key id. Defaults to AWS_ACCESS_KEY_ID"),
+             secret_key: str = typer.Option(None, help="AWS secret access key. Defaults to AWS_SECRET_ACCESS_KEY"),
+             region: str = typer.Option("us-west-2", help="AWS region"),
+             ranks: int = typer.Option(None, help="MPI ranks, one per tile of the model domain decomposition. Defaults to 96"),
+             instance_type: str = typer.Option(None, help="EC2 instance type. Picked from the rank count when not given"),
+             test_steps: int = typer.Option(None, help="Only run this many time steps as a short test run"),
+             dry_run: bool = typer.Option(False, "--dry-run", help="Only print the ensemble members")):
+    """
+    Non interactive ECCO ensemble launch on EC2. One run is started for every combination of the swept values
+    """
+    access_key = access_key or os.environ.get("AWS_ACCESS_KEY_ID")
+    secret_key = secret_key or os.environ.get("AWS_SECRET_ACCESS_KEY")
+    if not dry_run and (not access_key or not secret_key):
+        raise typer.BadParameter("AWS credentials are required. Pass --access-key/--secret-key or set AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY")
+    ecco.run_ecco_ensemble(name, sweep, access_key, secret_key, region, ranks, instance_type, test_steps, dry_run)
+
+@app.command("place")
+def place(name: str = typer.Option("ecco", help="Execution name used with --launch"),
+          sweep: List[str] = typer.Option([], help="ECCO parameters as key=value. Can be repeated"),
+          ranks: int = typer.Option(None, help="MPI ranks. Defaults to 96"),
+          objective: str = typer.Option("time", help="time or cost"),
+          deadline_hours: float = typer.Option(None, help="Only accept runs that finish within this many hours"),
+          budget: float = typer.Option(None, help="Only accept runs that cost at most this many USD"),
+          runtime: List[str] = typer.Option([], help="Only consider these runtimes. Can be repeated"),
+          simulate: bool = typer.Option(False, "--simulate", help="Use the simulated backend of every runtime"),
+          launch: bool = typer.Option(False, "--launch", help="Launch the best feasible placement"),
+          format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    """
+    Estimates time to solution and cost of an ECCO run on every runtime and instance type from recorded throughput
+    """
+    members = ecco.ensemble_members(sweep)
+    if len(members) != 1:
+        raise typer.BadParameter("place takes a single value per parameter")
+    ecco.place_ecco(name, members[0], ranks, objective, deadline_hours, budget, runtime or None, simulate, launch,
+                    format, fields)
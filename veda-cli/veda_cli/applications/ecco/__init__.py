@@ -1,10 +1,17 @@
 from pick import pick
+import itertools
 import typer
 import veda_cli.applications.ecco.ecco_app as ecco_app
+from veda_cli.applications.ecco import run_config
+from veda_cli import output
+from veda_cli import runtimes
+from veda_cli.runtimes import placement
+
+ECCO_PARAMETERS = {"time_step": 3600, "total_time_steps": 227903, "gravity": 9.81, "rhonil": 1029}
 
     
 def run_ecco():
-    options = ["Amazon EC2", "Jetstream 2" ]
+    options = ["Best placement", "Amazon EC2", "Jetstream 2" ]
     server_option, index = pick(options, "Where Do you want to run ECCO Application?", indicator="=>")
 
     options = ['ECCO-NASA-V4 : NASA Hosted ECCO V4 Dataset', 'Custom']
@@ -21,14 +28,92 @@ def run_ecco():
         ecco_configs['gravity'] = typer.prompt("Gravity", 9.81)
         ecco_configs['rhonil']=typer.prompt("Rhonil", 1029)
 
-    if server_option == 'Amazon EC2':
-        ecco_app.run_ecco_on_ec2(execution_name, ecco_configs)
+    # mitgcmuv of the ECCO image only runs with the tile count it was built for
+    ranks = run_config.DEFAULT_RANKS
+
+    test_steps = None
+    if typer.confirm("Do a short test run first?", False):
+        test_steps = typer.prompt("Test run time steps", 10)
+
+    if server_option == 'Best placement':
+        objective, index = pick(placement.OBJECTIVES, "Optimize for run time or for cost?", indicator="=>")
+        total_time_steps = int(ecco_configs.get("total_time_steps", ECCO_PARAMETERS["total_time_steps"]))
+        plans = [p for p in placement.plan(ranks, total_time_steps, objective) if p["feasible"]][:5]
+        labels = [f"{p['runtime']} {p['instanceType']} : {p['hours']:.1f} h, {p['cost']:.2f} USD ({p['basis']} throughput)"
+                  for p in plans]
+        label, index = pick(labels, "Estimated time to solution and cost", indicator="=>")
+        runtimes.get_runtime(plans[index]["runtime"]).launch(execution_name, ecco_configs, ranks,
+                                                              plans[index]["instanceType"], test_steps)
+    elif server_option == 'Amazon EC2':
+        spot = typer.confirm("Run on spot instances with checkpoint/restart?", False)
+        checkpoint_interval = None
+        if spot:
+            checkpoint_interval = typer.prompt("Pickup interval (model seconds)", run_config.DEFAULT_CHECKPOINT_INTERVAL)
+        runtimes.get_runtime("EC2").launch(execution_name, ecco_configs, ranks, test_steps=test_steps, spot=spot,
+                                           checkpoint_interval=checkpoint_interval)
     elif server_option == 'Jetstream 2':
-        ecco_app.run_ecco_on_jetstream2(execution_name, ecco_configs)
+        runtimes.get_runtime("Jetstream2").launch(execution_name, ecco_configs, ranks, test_steps=test_steps)
     else:
         print("Error: Unknow server selection")
 
+def parse_sweep(sweeps):
+    """
+    Parses key=v1,v2,... sweep options into the list of values for every ECCO parameter.
+    Parameters that are not swept keep their default value.
+    """
+    values = {k: [v] for k, v in ECCO_PARAMETERS.items()}
+    for sweep in sweeps:
+        key, _, raw_values = sweep.partition("=")
+        key = key.strip()
+        if key not in ECCO_PARAMETERS:
+            raise typer.BadParameter("Unknown ECCO parameter " + key + ". Expected one of " + ", ".join(ECCO_PARAMETERS))
+        parameter_type = type(ECCO_PARAMETERS[key])
+        try:
+            values[key] = [parameter_type(v) for v in raw_values.split(",") if v.strip()]
+        except ValueError:
+            raise typer.BadParameter("Invalid value in sweep " + sweep)
+        if not values[key]:
+            raise typer.BadParameter("No values given for " + key)
+    return values
 
+def ensemble_members(sweeps):
+    """
+    Cartesian product of all swept parameter values. Each member is an ecco_configs dict
+    """
+    values = parse_sweep(sweeps)
+    return [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
 
+def run_ecco_ensemble(execution_name, sweeps, access_key, secret_key, region, ranks=None, instance_type=None,
+                      test_steps=None, dry_run=False):
+    members = ensemble_members(sweeps)
+    print(f"Ensemble {execution_name} has {len(members)} members")
+    if dry_run:
+        for member in members:
+            run_cfg = run_config.build(member, ranks, instance_type, test_steps)
+            print(run_cfg["instanceType"] + " : " + run_cfg["mpiCommand"] + " " + str(member))
+        return members
+    return ecco_app.run_ecco_ensemble_on_ec2(execution_name, members, access_key, secret_key, region, ranks,
+                                             instance_type, test_steps)
 
+def place_ecco(execution_name, ecco_configs, ranks=None, objective="time", deadline_hours=None, budget=None,
+               runtime_names=None, simulate=False, launch=False, format="table", fields=None):
+    """
+    Prints the estimated time to solution and cost of the run on every runtime and instance type, best first,
+    and optionally launches the best feasible one
+    """
+    ranks = ranks or run_config.DEFAULT_RANKS
+    total_time_steps = int(ecco_configs.get("total_time_steps", ECCO_PARAMETERS["total_time_steps"]))
+    run_config.check_ranks(ranks)
+    try:
+        plans = placement.plan(ranks, total_time_steps, objective, deadline_hours, budget, runtime_names, simulate)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    output.emit(iter(plans), format, fields, placement.PLAN_COLUMNS)
+    if not launch:
+        return plans
 
+    if not plans or not plans[0]["feasible"]:
+        print("No runtime can finish the run within the deadline and budget")
+        raise typer.Exit(1)
+    return runtimes.get_runtime(plans[0]["runtime"], simulate).launch(execution_name, ecco_configs, ranks,
+                                                                       plans[0]["instanceType"])
@@ -1,146 +1,66 @@
 import boto3
-from botocore.exceptions import ClientError
 import os
-import string
-import random
 import stat
 import paramiko
-import socket
+import string
+import random
 import time
 import typer
-from pysondb import db
+import botocore.exceptions
+from concurrent.futures import ThreadPoolExecutor
+from veda_cli import store
+from veda_cli import mft
+from veda_cli import ssh
+from veda_cli import jobs
+from veda_cli import trace
+from veda_cli.applications.ecco import provision
+from veda_cli.applications.ecco import run_config
 from datetime import datetime
 from rich import print
-from airavata_mft_cli import config as configcli
-from airavata_mft_sdk import mft_client
 from airavata_mft_sdk.scp import SCPCredential_pb2
 from airavata_mft_sdk.scp import SCPStorage_pb2
 from airavata_mft_sdk.common import StorageCommon_pb2
 
 def get_db():
-    return db.getDb(os.path.join(os.path.expanduser('~'), ".veda", "db.json"))
+    return store.get_execution_db()
 
 def register_execution_endpoint(storage_name, private_key, user_name, host_name, port):
-    client = mft_client.MFTClient(transfer_api_port = configcli.transfer_api_port,
-                                    transfer_api_secured = configcli.transfer_api_secured,
-                                    resource_service_host = configcli.resource_service_host,
-                                    resource_service_port = configcli.resource_service_port,
-                                    resource_service_secured = configcli.resource_service_secured,
-                                    secret_service_host = configcli.secret_service_host,
-                                    secret_service_port = configcli.secret_service_port)
-    
-    secret_create_req = SCPCredential_pb2.SCPSecretCreateRequest(privateKey=private_key, 
-                                                                 user=user_name)
-    created_secret = client.scp_secret_api.createSCPSecret(secret_create_req)
-
-    scp_storage_create_req = SCPStorage_pb2.SCPStorageCreateRequest(
-        host=host_name, port=port, name=storage_name)
-    
-    created_storage = client.scp_storage_api.createSCPStorage(scp_storage_create_req)
+    with trace.phase("register storage"):
+        client = mft.get_client()
 
-    secret_for_storage_req = StorageCommon_pb2.SecretForStorage(storageId = created_storage.storageId,
-                                       secretId = created_secret.secretId,
-                                       storageType = StorageCommon_pb2.StorageType.SCP)
+        secret_create_req = SCPCredential_pb2.SCPSecretCreateRequest(privateKey=private_key,
+                                                                     user=user_name)
+        created_secret = client.scp_secret_api.createSCPSecret(secret_create_req)
 
-    client.common_api.registerSecretForStorage(secret_for_storage_req)
+        scp_storage_create_req = SCPStorage_pb2.SCPStorageCreateRequest(
+            host=host_name, port=port, name=storage_name)
 
-    return created_storage.storageId
+        created_storage = client.scp_storage_api.createSCPStorage(scp_storage_create_req)
 
+        secret_for_storage_req = StorageCommon_pb2.SecretForStorage(storageId = created_storage.storageId,
+                                           secretId = created_secret.secretId,
+                                           storageType = StorageCommon_pb2.StorageType.SCP)
 
-    
-def describe_vpcs(tag, tag_values, max_items, ec2_client):
-    """
-    Describes one or more VPCs.
-    """
-    try:
-        # creating paginator object for describe_vpcs() method
-        paginator = ec2_client.get_paginator('describe_vpcs')
-        # creating a PageIterator from the paginator
-        response_iterator = paginator.paginate(
-            Filters=[{
-                'Name': f'tag:{tag}',
-                'Values': tag_values
-            }],
-            PaginationConfig={'MaxItems': max_items})
-        full_result = response_iterator.build_full_result()
-        vpc_list = []
-        for page in full_result['Vpcs']:
-            vpc_list.append(page)
-    except ClientError:
-        print('Could not describe VPCs.')
-        raise
-    else:
-        return vpc_list
+        client.common_api.registerSecretForStorage(secret_for_storage_req)
 
-def describe_sgs(tag, tag_values, max_items, ec2_client):
-    """
-    Describes one or more security groups.
-    """
-    try:
-        # creating paginator object for describe_vpcs() method
-        paginator = ec2_client.get_paginator('describe_security_groups')
-        # creating a PageIterator from the paginator
-        response_iterator = paginator.paginate(
-            Filters=[{
-                'Name': f'tag:{tag}',
-                'Values': tag_values
-            }],
-            PaginationConfig={'MaxItems': max_items})
-        full_result = response_iterator.build_full_result()
-        sg_list = []
-        for page in full_result['SecurityGroups']:
-            sg_list.append(page)
-    except ClientError:
-        print('Could not describe SecurityGroups.')
-        raise
-    else:
-        return sg_list
+    return created_storage.storageId
 
-def describe_subnets(tag, tag_values, max_items, ec2_client):
+def deregister_execution_endpoint(storage_id):
     """
-    Describes one or more subnets.
+    Removes the SCP storage of an execution and the secret holding its private key from MFT
     """
-    try:
-        # creating paginator object for describe_vpcs() method
-        paginator = ec2_client.get_paginator('describe_subnets')
-        # creating a PageIterator from the paginator
-        response_iterator = paginator.paginate(
-            Filters=[{
-                'Name': f'tag:{tag}',
-                'Values': tag_values
-            }],
-            PaginationConfig={'MaxItems': max_items})
-        full_result = response_iterator.build_full_result()
-        subnets = []
-        for page in full_result['Subnets']:
-            subnets.append(page)
-    except ClientError:
-        print('Could not describe Subnets.')
-        raise
-    else:
-        return subnets
+    client = mft.get_client()
 
+    secret = client.common_api.getSecretForStorage(StorageCommon_pb2.SecretForStorageGetRequest(storageId=storage_id))
+    if secret.secretId:
+        client.scp_secret_api.deleteSCPSecret(SCPCredential_pb2.SCPSecretDeleteRequest(secretId=secret.secretId))
+    client.common_api.deleteSecretsForStorage(StorageCommon_pb2.SecretForStorageDeleteRequest(storageId=storage_id))
+    client.scp_storage_api.deleteSCPStorage(SCPStorage_pb2.SCPStorageDeleteRequest(storageId=storage_id))
 
-def wait_for_ssh(host, ssh_timeout: float = 60.0):
-    start_time = time.perf_counter()
-    while True:
-        try:
-            with socket.create_connection((host, 22), timeout=ssh_timeout):
-                break
-        except OSError as ex:
-            time.sleep(0.1)
-            if time.perf_counter() - start_time >= ssh_timeout:
-                raise TimeoutError('Connection timed out') from ex
 
 def create_ssh_connection(user, ip, key_file):
     print("Waiting for SSH to come up")
-    wait_for_ssh(host=ip)
-    print("Port 22 is open. Trying to SSH into the vm")
-    ssh = paramiko.SSHClient()
-    k = paramiko.RSAKey.from_private_key_file(key_file)
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(hostname=ip, username=user, pkey=k)
-    return ssh
+    return ssh.connect(user, ip, key_file)
 
 def init_local():
     
@@ -152,196 +72,335 @@ def init_local():
     if not os.path.exists(veda_ssh_credentials):
         os.makedirs(veda_ssh_credentials)
     
-def run_ecco_on_ec2(execution_name, ecco_configs):
-    print("Running the ECCO simulation on EC2")
-
-    init_local()
-
-    access_key = typer.prompt("AWS Access Key Id", hide_input=True)
-    secret_key = typer.prompt("AWS Secret Access Key", hide_input=True)
-
-    region = "us-west-2"
-    ecco_ami = 'ami-01b3a8d8f90f3fd3c'
-    instance_size = 'c5.24xlarge'
-    vpc_name = 'veda_ecco_vpc'
-    security_group_name = 'veda_ecco_sg'
-    subnet_name = 'veda_ecco_subnet'
-    route_table_name = 'veda_ecco_rt'
-    internet_gateway_name = 'veda_ecco_ig'
-    instance_name = 'VEDA ECCO Run'
-
-    ec2_client = boto3.client(
+ECCO_AMI = 'ami-01b3a8d8f90f3fd3c'
+INSTANCE_NAME = 'VEDA ECCO Run'
+LOGIN_USER = 'ubuntu'
+RUN_DIR = '/home/ubuntu/MITgcm/ECCOV4/release4/run'
+DEFAULT_REGION = 'us-west-2'
+
+def create_ec2_client(access_key, secret_key, region):
+    return boto3.client(
         'ec2', 
         aws_access_key_id=access_key, 
         aws_secret_access_key=secret_key,
         region_name=region)
 
-    key_files = os.listdir(os.path.join(os.path.expanduser('~'), ".veda", "credentials", "ssh"))
-    all_keys = ec2_client.describe_key_pairs()['KeyPairs']
-    available_keys = []
-    for k in all_keys:
-        if k['KeyName'] in key_files:
-            available_keys.append(k['KeyName'])
-
-    if len(available_keys) == 0:
-
-        key_name = 'ecco_key_' + ''.join(random.choices(string.ascii_lowercase +
-                                string.digits, k=5))
-
-        keypair = ec2_client.create_key_pair(KeyName=key_name)
-        key_path = os.path.join(os.path.expanduser('~'), ".veda", "credentials", "ssh", key_name)
-        with open(key_path, "w") as key_file:
-            key_file.write(keypair['KeyMaterial'])
+def request_instances(ec2_client, infra, count, instance_size, spot=False):
+    """
+    Requests count instances in a single run_instances call and returns their ids without waiting for them.
+    With spot the instances are one time spot instances that terminate when they are interrupted.
+    """
+    options = {}
+    if spot:
+        options["InstanceMarketOptions"] = {"MarketType": "spot", "SpotOptions": {
+            "SpotInstanceType": "one-time", "InstanceInterruptionBehavior": "terminate"}}
 
-        os.chmod(key_path, stat.S_IRUSR);
+    instances = ec2_client.run_instances(
+        ImageId=ECCO_AMI,
+        MinCount=count,
+        MaxCount=count,
+        InstanceType=instance_size,
+        KeyName=infra["key_name"],
+        NetworkInterfaces=[{'SubnetId': infra["subnet_id"],'Groups': [infra["security_group_id"]], 'AssociatePublicIpAddress': True, 'DeleteOnTermination': True, 'DeviceIndex': 0}],
+        TagSpecifications=provision.name_tag("instance", INSTANCE_NAME),
+        **options
+    )
 
-        print("Created key : ", key_name)
-    else:
-        key_name = available_keys[0]
-        print("Reusing existing key : ", key_name)
+    instance_ids = [i['InstanceId'] for i in instances['Instances']]
 
-    vpcs = describe_vpcs("Name", [vpc_name], 1, ec2_client)
+    print("Instance ids " + ", ".join(instance_ids))
+    return instance_ids
 
-    
-    if len(vpcs) == 0:
-        print("Creating VPC for ECCO VEDA")
-        vpc = ec2_client.create_vpc(CidrBlock='172.16.0.0/16')
-        vpc_id = vpc['Vpc']['VpcId']
+def wait_for_public_ips(ec2_client, instance_ids, timeout=600, initial_delay=1.0, max_delay=5.0):
+    """
+    Polls until every instance has a public ip and returns (instance id, public ip) pairs. EC2 assigns the
+    address while the instance is still pending, so SSH probing can start well before the instance_running
+    waiter with its 15 second polls would return.
+    """
+    print("Waiting for the instances to get their public ips")
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    public_ips = {}
+    while True:
+        try:
+            reservations = ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
+        except botocore.exceptions.ClientError as e:
+            # New instance ids take a moment to become visible to describe_instances
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+            reservations = []
+        for reservation in reservations:
+            for instance in reservation['Instances']:
+                if instance['State']['Name'] in ('shutting-down', 'terminated'):
+                    raise RuntimeError("Instance " + instance['InstanceId'] + " terminated while starting: "
+                                       + instance.get('StateReason', {}).get('Message', 'unknown reason'))
+                if instance.get('PublicIpAddress'):
+                    public_ips[instance['InstanceId']] = instance['PublicIpAddress']
+
+        if len(public_ips) == len(instance_ids):
+            return [(instance_id, public_ips[instance_id]) for instance_id in instance_ids]
+        if time.monotonic() > deadline:
+            raise TimeoutError("Instances did not get public ips in " + str(timeout) + " seconds")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+def launch_instances(ec2_client, infra, count, instance_size, spot=False):
+    """
+    Launches count instances in a single run_instances request and returns (instance id, public ip) pairs
+    as soon as all of them have an address
+    """
+    instance_ids = request_instances(ec2_client, infra, count, instance_size, spot)
+    return wait_for_public_ips(ec2_client, instance_ids)
+
+def start_model(public_ip, local_key_file, run_cfg):
+    with trace.phase("wait for ssh"):
+        client = create_ssh_connection(LOGIN_USER, public_ip, local_key_file)
+    with trace.phase("apply configs"):
+        run_config.apply_configs(client, RUN_DIR, run_cfg["eccoConfigs"], run_cfg["testSteps"],
+                                 run_cfg.get("checkpointInterval"), run_cfg.get("startIteration"))
+    # With every stream of mpirun redirected the channel closes as soon as it is in the background
+    with trace.phase("start mpirun"):
+        ssh.run_on(client, "cd " + RUN_DIR + "; nohup " + run_cfg["mpiCommand"] + " >> mpi.out 2>&1 < /dev/null &",
+                   timeout=60)
+    return client
+
+def new_execution_id():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
+
+def execution_record(execution_id, instance_id, public_ip, access_key, secret_key, region, local_key_file, storage_id, run_cfg,
+                     runtime="EC2"):
+    return {
+        "type": "Execution", 
+        "runtime": runtime, 
+        "application": "ECCO", 
+        "executionId": execution_id, 
+        "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
+        "instanceId": instance_id,
+        "publicIp": public_ip,
+        "loginUser": LOGIN_USER,
+        "accessKey":access_key,
+        "secretKey": secret_key,
+        "region": region,
+        "keyPath": local_key_file,
+        "storageId": storage_id,
+        "eccoConfigs": run_cfg["eccoConfigs"],
+        "instanceType": run_cfg["instanceType"],
+        "ranks": run_cfg["ranks"],
+        "testSteps": run_cfg["testSteps"],
+        "checkpointInterval": run_cfg.get("checkpointInterval"),
+        "outputDir": RUN_DIR + "/diags"}
 
-        ec2_client.create_tags(Resources=[vpc_id], Tags=[{"Key": "Name", "Value": vpc_name}])
+def run_ecco_on_ec2(execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None, region=DEFAULT_REGION,
+                    spot=False, checkpoint_interval=None):
+    print("Running the ECCO simulation on " + ("EC2 spot instances" if spot else "EC2"))
 
-        print("Waiting until the VPC is available")
-        waiter = ec2_client.get_waiter('vpc_available')
-        waiter.wait(VpcIds=[vpc_id])
+    if spot and not checkpoint_interval:
+        checkpoint_interval = run_config.DEFAULT_CHECKPOINT_INTERVAL
+    run_cfg = run_config.build(ecco_configs, ranks, instance_type, test_steps, checkpoint_interval=checkpoint_interval)
 
-    else:
-        vpc = vpcs[0]
-        vpc_id = vpc['VpcId']
-        print("Reusing existing vpc : " + vpc_name)
+    init_local()
 
-    subnets = describe_subnets("Name", [subnet_name], 1, ec2_client)
+    access_key = typer.prompt("AWS Access Key Id", hide_input=True)
+    secret_key = typer.prompt("AWS Secret Access Key", hide_input=True)
 
-    if len(subnets) == 0:
+    ec2_client = create_ec2_client(access_key, secret_key, region)
 
-        route_table = ec2_client.create_route_table(VpcId=vpc_id)
-        internet_gateway = ec2_client.create_internet_gateway()
+    with trace.phase("provision"):
+        infra = provision.provision_infrastructure(ec2_client, provision.get_cache_key(access_key, region))
 
-        route_table_id = route_table['RouteTable']['RouteTableId']
-        ec2_client.create_tags(Resources=[route_table_id], Tags=[{"Key": "Name", "Value": route_table_name}])
+    local_key_file = os.path.join(provision.get_ssh_key_dir(), infra["key_name"])
+    with trace.phase("request instances"):
+        instance_id = request_instances(ec2_client, infra, 1, run_cfg["instanceType"], spot)[0]
 
-        internet_gateway_id = internet_gateway['InternetGateway']['InternetGatewayId']
-        ec2_client.create_tags(Resources=[internet_gateway_id], Tags=[{"Key": "Name", "Value": internet_gateway_name}])
+    # The record exists from here on so the instance can be found and killed whatever happens next
+    execution_id = new_execution_id()
+    record = execution_record(execution_id, instance_id, None, access_key, secret_key, region,
+                              local_key_file, None, run_cfg)
+    record["state"] = "LAUNCHING"
+    if spot:
+        record.update({"spot": True, "restarts": 0, "pickupIteration": 0})
+    db_conn = get_db()
+    record_id = db_conn.add(record)
+    print("Execution Id: " + execution_id)
 
-        #print(route_table)
-        #print(internet_gateway)
+    try:
+        with trace.phase("wait for public ip"):
+            public_ip = wait_for_public_ips(ec2_client, [instance_id])[0][1]
+        db_conn.updateById(record_id, {"publicIp": public_ip, "state": "STARTING"})
+
+        print("You can log in to the ECCO running instance using following SSH command")
+        print('[bold red]ssh -i ' + local_key_file + ' ' + LOGIN_USER + '@' + public_ip + '[/bold red]')
+
+        with open(local_key_file, 'r') as key_file:
+            private_key = key_file.read()
+
+        # MFT only needs the address, so the storage is registered while the instance boots and the model starts
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            registration = pool.submit(register_execution_endpoint, execution_name + " storage", private_key,
+                                       LOGIN_USER, public_ip, 22)
+            start = pool.submit(start_model, public_ip, local_key_file, run_cfg)
+            storage_id = registration.result()
+            db_conn.updateById(record_id, {"storageId": storage_id})
+            start.result()
+    except BaseException as e:
+        db_conn.updateById(record_id, {"state": "FAILED", "error": str(e) or type(e).__name__})
+        raise
 
-        response = ec2_client.attach_internet_gateway(
-            InternetGatewayId=internet_gateway_id,
-            VpcId=vpc_id
-        )
+    db_conn.updateById(record_id, {"state": "RUNNING", "startedTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S")})
+    print("[bold blue]Started the ECCO Model run. Execution Id: " + execution_id + "[/bold blue]")
+    if spot:
+        job_id = jobs.submit("execution-supervise", {"execution_id": execution_id}, label="supervise " + execution_id,
+                             transfers=0, max_attempts=10)
+        print("Job " + job_id + " syncs pickups and relaunches the run when the spot instance is interrupted")
+    return execution_id
+
+def run_ecco_ensemble_on_ec2(execution_name, members, access_key, secret_key, region=DEFAULT_REGION, ranks=None,
+                             instance_type=None, test_steps=None, parallelism=16):
+    """
+    Launches one instance per ensemble member in a single request and starts every member over SSH in
+    parallel. Each member gets its execution record as soon as its instance is requested, so a member
+    that fails to start is left FAILED and can be killed like any other execution.
+    """
+    print(f"Running an ECCO ensemble of {len(members)} members on EC2")
 
-        ec2_client.create_route(
-            DestinationCidrBlock='0.0.0.0/0',
-            GatewayId=internet_gateway_id,
-            RouteTableId=route_table_id,
-        )
+    run_cfgs = [run_config.build(member, ranks, instance_type, test_steps) for member in members]
 
-        subnet = ec2_client.create_subnet(CidrBlock = '172.16.2.0/24', VpcId= vpc_id)
-        subnet_id = subnet['Subnet']['SubnetId']
-        ec2_client.create_tags(Resources=[subnet_id], Tags=[{"Key": "Name", "Value": subnet_name}])
+    init_local()
 
-        route_table = boto3.resource('ec2', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region).RouteTable(route_table_id)
-        route_table.associate_with_subnet(SubnetId=subnet_id)
+    ec2_client = create_ec2_client(access_key, secret_key, region)
+    infra = provision.provision_infrastructure(ec2_client, provision.get_cache_key(access_key, region))
+    instance_ids = request_instances(ec2_client, infra, len(members), run_cfgs[0]["instanceType"])
+
+    local_key_file = os.path.join(provision.get_ssh_key_dir(), infra["key_name"])
+    ensemble_id = new_execution_id()
+    records = []
+    for instance_id, run_cfg in zip(instance_ids, run_cfgs):
+        record = execution_record(new_execution_id(), instance_id, None, access_key, secret_key, region,
+                                  local_key_file, None, run_cfg)
+        record["state"] = "LAUNCHING"
+        record["ensembleId"] = ensemble_id
+        records.append(record)
+    db_conn = get_db()
+    record_ids = db_conn.addMany(records)
+    print("Ensemble Id: " + ensemble_id)
 
+    try:
+        public_ips = dict(wait_for_public_ips(ec2_client, instance_ids))
+    except BaseException as e:
+        for record_id in record_ids:
+            db_conn.updateById(record_id, {"state": "FAILED", "error": str(e) or type(e).__name__})
+        raise
 
-    else:
-        print("Reusing existing subnet")
-        subnet_id = subnets[0]['SubnetId']
+    with open(local_key_file, 'r') as key_file:
+        private_key = key_file.read()
 
-    sgs = describe_sgs("Name", [security_group_name], 1, ec2_client)
-    
-    if len(sgs) == 0:
-        secrity_group = ec2_client.create_security_group(GroupName=security_group_name,
-                                            Description=security_group_name,
-                                            VpcId=vpc_id)
-
-        security_group_id = secrity_group['GroupId']
-
-        ec2_client.create_tags(Resources=[security_group_id], Tags=[{"Key": "Name", "Value": security_group_name}])
-
-        sg_ingress = ec2_client.authorize_security_group_ingress(
-            GroupId=security_group_id,
-            IpPermissions=[
-                {'IpProtocol': 'tcp',
-                'FromPort': 22,
-                'ToPort': 22,
-                'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
-            ])
-        
-        print(secrity_group)
-    else:
-        print("Using existing security group : " + security_group_name)
-        security_group_id = sgs[0]['GroupId']
-
-    print("Security group id ", security_group_id)
-    
-    instances = ec2_client.run_instances(
-        ImageId=ecco_ami,
-        MinCount=1,
-        MaxCount=1,
-        InstanceType=instance_size,
-        KeyName=key_name,
-        NetworkInterfaces=[{'SubnetId': subnet_id,'Groups': [security_group_id], 'AssociatePublicIpAddress': True, 'DeleteOnTermination': True, 'DeviceIndex': 0}]
-    )
+    def start_member(index):
+        record, record_id = records[index], record_ids[index]
+        try:
+            public_ip = public_ips[record["instanceId"]]
+            record.update({"publicIp": public_ip, "state": "STARTING"})
+            db_conn.updateById(record_id, {"publicIp": public_ip, "state": "STARTING"})
+            start_model(public_ip, local_key_file, run_cfgs[index])
+            record["storageId"] = register_execution_endpoint(f"{execution_name} {index} storage", private_key,
+                                                              LOGIN_USER, public_ip, 22)
+            db_conn.updateById(record_id, {"storageId": record["storageId"]})
+        except Exception as e:
+            record.update({"state": "FAILED", "error": str(e) or type(e).__name__})
+            db_conn.updateById(record_id, {"state": "FAILED", "error": record["error"]})
+            return record
+        record.update({"state": "RUNNING", "startedTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S")})
+        db_conn.updateById(record_id, {"state": "RUNNING", "startedTime": record["startedTime"]})
+        return record
+
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(members))) as pool:
+        records = list(pool.map(start_member, range(len(members))))
+
+    for record in records:
+        print(record["executionId"] + " : " + record["instanceId"] + " " + record["state"] + " "
+              + str(record.get("error", record["eccoConfigs"])))
+    started = sum(1 for record in records if record["state"] == "RUNNING")
+    print("[bold blue]Started " + str(started) + " of " + str(len(records)) + " ECCO Model runs. Ensemble Id: "
+          + ensemble_id + "[/bold blue]")
+    if started < len(records):
+        print("[bold red]Failed members keep their instances until they are killed with "
+              "veda execution kill --ensemble " + ensemble_id + "[/bold red]")
+    return records
+
+
+# Jetstream 2 runs need an image with the same ECCO build and layout as ECCO_AMI
+JETSTREAM2_IMAGE = os.environ.get("VEDA_JETSTREAM2_IMAGE", "veda-ecco-v4r4")
+JETSTREAM2_NETWORK = os.environ.get("VEDA_JETSTREAM2_NETWORK", "auto_allocated_network")
+JETSTREAM2_SECURITY_GROUP = os.environ.get("VEDA_JETSTREAM2_SECURITY_GROUP", "veda_ecco_sg")
+JETSTREAM2_KEY_NAME = 'ecco_js2_key'
+
+def create_openstack_connection(cloud=None):
+    try:
+        import openstack
+    except ImportError:
+        print("Running on Jetstream 2 needs the openstacksdk package (pip install veda-cli[jetstream2]) and a "
+              "clouds.yaml entry selected with OS_CLOUD")
+        raise typer.Exit(1)
+    return openstack.connect(cloud=cloud or os.environ.get("OS_CLOUD", "openstack"))
+
+def find_or_create_openstack_key(conn):
+    key_path = os.path.join(provision.get_ssh_key_dir(), JETSTREAM2_KEY_NAME)
+    if not os.path.exists(key_path):
+        key = paramiko.RSAKey.generate(3072)
+        key.write_private_key_file(key_path)
+        os.chmod(key_path, stat.S_IRUSR)
+        if conn.get_keypair(JETSTREAM2_KEY_NAME) is not None:
+            conn.delete_keypair(JETSTREAM2_KEY_NAME)
+        conn.create_keypair(JETSTREAM2_KEY_NAME, public_key=key.get_name() + " " + key.get_base64())
+        print("Created key : ", JETSTREAM2_KEY_NAME)
+    elif conn.get_keypair(JETSTREAM2_KEY_NAME) is None:
+        key = paramiko.RSAKey.from_private_key_file(key_path)
+        conn.create_keypair(JETSTREAM2_KEY_NAME, public_key=key.get_name() + " " + key.get_base64())
+    return key_path
+
+def find_or_create_openstack_security_group(conn):
+    if conn.get_security_group(JETSTREAM2_SECURITY_GROUP) is None:
+        conn.create_security_group(JETSTREAM2_SECURITY_GROUP, "SSH access to VEDA ECCO runs")
+        conn.create_security_group_rule(JETSTREAM2_SECURITY_GROUP, port_range_min=22, port_range_max=22,
+                                        protocol="tcp", remote_ip_prefix="0.0.0.0/0")
+
+def run_ecco_on_jetstream2(execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None):
+    print("Running the ECCO simulation on Jetstream 2")
 
-    instance_id = instances['Instances'][0]['InstanceId']
+    from veda_cli.runtimes import jetstream2
+    run_cfg = run_config.build(ecco_configs, ranks, instance_type, test_steps, jetstream2.FLAVORS)
 
-    print("Instance id " + instance_id)
+    init_local()
 
-    ec2_client.create_tags(Resources=[instance_id], Tags=[{"Key": "Name", "Value": instance_name}])
+    conn = create_openstack_connection()
+    local_key_file = find_or_create_openstack_key(conn)
+    find_or_create_openstack_security_group(conn)
 
-    print("Waiting until the instance " + instance_id + " is up and running")
-    waiter = ec2_client.get_waiter('instance_running')
-    waiter.wait(InstanceIds=[instance_id])
-    print('Instance is running')
+    print("Waiting until the instance is up and running")
+    server = conn.create_server(INSTANCE_NAME, image=JETSTREAM2_IMAGE, flavor=run_cfg["instanceType"],
+                                key_name=JETSTREAM2_KEY_NAME, network=JETSTREAM2_NETWORK,
+                                security_groups=[JETSTREAM2_SECURITY_GROUP], auto_ip=True, wait=True, timeout=1800)
+    public_ip = server.public_v4 or server.access_ipv4
+    print("Instance id " + server.id)
+    if not public_ip:
+        conn.delete_server(server.id)
+        raise RuntimeError("Server " + server.id + " got no public address on network " + JETSTREAM2_NETWORK)
 
-    public_ip = ec2_client.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]['PublicIpAddress']
     print("You can log in to the ECCO running instance using following SSH command")
-    local_key_file = os.path.join(os.path.expanduser('~'), ".veda", "credentials", "ssh", key_name)
-    print('[bold red]ssh -i ' + local_key_file + ' ubuntu@' + public_ip + '[/bold red]')
-    ssh = create_ssh_connection('ubuntu', public_ip, local_key_file)
-
-    ssh_stdin, ssh_stdout, ssh_stderr = ssh.exec_command("cd /home/ubuntu/MITgcm/ECCOV4/release4/run; nohup mpirun -np 96 ./mitgcmuv >> mpi.out 2>&1 &")
-    stdout = ssh_stdout.readlines()
+    print('[bold red]ssh -i ' + local_key_file + ' ' + LOGIN_USER + '@' + public_ip + '[/bold red]')
+    start_model(public_ip, local_key_file, run_cfg)
 
     with open(local_key_file, 'r') as key_file:
         private_key = key_file.read()
 
-    storage_id = register_execution_endpoint(execution_name + " storage",  private_key, "ubuntu", public_ip, 22)
+    storage_id = register_execution_endpoint(execution_name + " storage",  private_key, LOGIN_USER, public_ip, 22)
 
-    execution_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
-    db_conn = get_db()
-    db_conn.add({
-        "type": "Execution", 
-        "runtime": "EC2", 
-        "application": "ECCO", 
-        "executionId": execution_id, 
-        "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
-        "instanceId": instance_id,
-        "publicIp": public_ip,
-        "loginUser": "ubuntu",
-        "accessKey":access_key,
-        "secretKey": secret_key,
-        "region": region,
-        "keyPath": local_key_file,
-        "storageId": storage_id,
-        "outputDir": "/home/ubuntu/MITgcm/ECCOV4/release4/run/diags"})
+    execution_id = new_execution_id()
+    record = execution_record(execution_id, server.id, public_ip, None, None, None, local_key_file, storage_id,
+                              run_cfg, runtime="Jetstream2")
+    record["cloud"] = os.environ.get("OS_CLOUD", "openstack")
+    get_db().add(record)
 
     print("[bold blue]Started the ECCO Model run. Execution Id: " + execution_id + "[/bold blue]")
-
-
-def run_ecco_on_jetstream2(execution_name, ecco_configs):
-    print("Running the ECCO simulation on Jetstream 2")
-    print("This is not yet supported...")
+    return execution_id
     
 
@@ -0,0 +1,302 @@
+import os
+import stat
+import string
+import random
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from botocore.exceptions import ClientError
+from rich import print
+from veda_cli import store
+
+VPC_NAME = 'veda_ecco_vpc'
+SECURITY_GROUP_NAME = 'veda_ecco_sg'
+SUBNET_NAME = 'veda_ecco_subnet'
+ROUTE_TABLE_NAME = 'veda_ecco_rt'
+INTERNET_GATEWAY_NAME = 'veda_ecco_ig'
+
+INFRASTRUCTURE_FIELDS = ("key_name", "vpc_id", "subnet_id", "security_group_id")
+
+
+def get_ssh_key_dir():
+    return os.path.join(os.path.expanduser('~'), ".veda", "credentials", "ssh")
+
+
+def name_tag(resource_type, name):
+    return [{"ResourceType": resource_type, "Tags": [{"Key": "Name", "Value": name}]}]
+
+
+def describe_vpcs(tag, tag_values, max_items, ec2_client):
+    """
+    Describes one or more VPCs.
+    """
+    try:
+        # creating paginator object for describe_vpcs() method
+        paginator = ec2_client.get_paginator('describe_vpcs')
+        # creating a PageIterator from the paginator
+        response_iterator = paginator.paginate(
+            Filters=[{
+                'Name': f'tag:{tag}',
+                'Values': tag_values
+            }],
+            PaginationConfig={'MaxItems': max_items})
+        full_result = response_iterator.build_full_result()
+        vpc_list = []
+        for page in full_result['Vpcs']:
+            vpc_list.append(page)
+    except ClientError:
+        print('Could not describe VPCs.')
+        raise
+    else:
+        return vpc_list
+
+def describe_sgs(tag, tag_values, max_items, ec2_client):
+    """
+    Describes one or more security groups.
+    """
+    try:
+        # creating paginator object for describe_vpcs() method
+        paginator = ec2_client.get_paginator('describe_security_groups')
+        # creating a PageIterator from the paginator
+        response_iterator = paginator.paginate(
+            Filters=[{
+                'Name': f'tag:{tag}',
+                'Values': tag_values
+            }],
+            PaginationConfig={'MaxItems': max_items})
+        full_result = response_iterator.build_full_result()
+        sg_list = []
+        for page in full_result['SecurityGroups']:
+            sg_list.append(page)
+    except ClientError:
+        print('Could not describe SecurityGroups.')
+        raise
+    else:
+        return sg_list
+
+def describe_subnets(tag, tag_values, max_items, ec2_client):
+    """
+    Describes one or more subnets.
+    """
+    try:
+        # creating paginator object for describe_vpcs() method
+        paginator = ec2_client.get_paginator('describe_subnets')
+        # creating a PageIterator from the paginator
+        response_iterator = paginator.paginate(
+            Filters=[{
+                'Name': f'tag:{tag}',
+                'Values': tag_values
+            }],
+            PaginationConfig={'MaxItems': max_items})
+        full_result = response_iterator.build_full_result()
+        subnets = []
+        for page in full_result['Subnets']:
+            subnets.append(page)
+    except ClientError:
+        print('Could not describe Subnets.')
+        raise
+    else:
+        return subnets
+
+
+def run_graph(tasks, max_workers=8):
+    """
+    Runs a dependency graph of tasks on a thread pool. tasks maps a name to (function, dependency names).
+    Each function is called with the results of its dependencies as keyword arguments and starts as soon
+    as all of them have finished. Returns the results of all tasks by name.
+    """
+    results = {}
+    remaining = dict(tasks)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while remaining or running:
+            for name, (fn, deps) in list(remaining.items()):
+                if all(dep in results for dep in deps):
+                    del remaining[name]
+                    running[pool.submit(fn, **{dep: results[dep] for dep in deps})] = name
+
+            if not running:
+                raise ValueError("Unresolvable task dependencies: " + ", ".join(remaining))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+
+    return results
+
+
+def find_or_create_key(ec2_client):
+    key_files = os.listdir(get_ssh_key_dir())
+    all_keys = ec2_client.describe_key_pairs()['KeyPairs']
+    available_keys = []
+    for k in all_keys:
+        if k['KeyName'] in key_files:
+            available_keys.append(k['KeyName'])
+
+    if len(available_keys) > 0:
+        print("Reusing existing key : ", available_keys[0])
+        return available_keys[0]
+
+    key_name = 'ecco_key_' + ''.join(random.choices(string.ascii_lowercase +
+                            string.digits, k=5))
+
+    keypair = ec2_client.create_key_pair(KeyName=key_name)
+    key_path = os.path.join(get_ssh_key_dir(), key_name)
+    with open(key_path, "w") as key_file:
+        key_file.write(keypair['KeyMaterial'])
+
+    os.chmod(key_path, stat.S_IRUSR)
+
+    print("Created key : ", key_name)
+    return key_name
+
+
+def find_or_create_vpc(ec2_client):
+    vpcs = describe_vpcs("Name", [VPC_NAME], 1, ec2_client)
+    if len(vpcs) > 0:
+        print("Reusing existing vpc : " + VPC_NAME)
+        return vpcs[0]['VpcId']
+
+    print("Creating VPC for ECCO VEDA")
+    vpc = ec2_client.create_vpc(CidrBlock='172.16.0.0/16', TagSpecifications=name_tag("vpc", VPC_NAME))
+    vpc_id = vpc['Vpc']['VpcId']
+
+    print("Waiting until the VPC is available")
+    waiter = ec2_client.get_waiter('vpc_available')
+    waiter.wait(VpcIds=[vpc_id])
+    return vpc_id
+
+
+def create_subnet(ec2_client, vpc_id):
+    # The route table, internet gateway and subnet only need the VPC, so they are created together
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        route_table_future = pool.submit(ec2_client.create_route_table, VpcId=vpc_id,
+                                         TagSpecifications=name_tag("route-table", ROUTE_TABLE_NAME))
+        internet_gateway_future = pool.submit(ec2_client.create_internet_gateway,
+                                              TagSpecifications=name_tag("internet-gateway", INTERNET_GATEWAY_NAME))
+        subnet_future = pool.submit(ec2_client.create_subnet, CidrBlock='172.16.2.0/24', VpcId=vpc_id,
+                                    TagSpecifications=name_tag("subnet", SUBNET_NAME))
+
+        route_table_id = route_table_future.result()['RouteTable']['RouteTableId']
+        internet_gateway_id = internet_gateway_future.result()['InternetGateway']['InternetGatewayId']
+        subnet_id = subnet_future.result()['Subnet']['SubnetId']
+
+    ec2_client.attach_internet_gateway(InternetGatewayId=internet_gateway_id, VpcId=vpc_id)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        route_future = pool.submit(ec2_client.create_route, DestinationCidrBlock='0.0.0.0/0',
+                                   GatewayId=internet_gateway_id, RouteTableId=route_table_id)
+        association_future = pool.submit(ec2_client.associate_route_table, RouteTableId=route_table_id,
+                                         SubnetId=subnet_id)
+        route_future.result()
+        association_future.result()
+
+    return subnet_id
+
+
+def create_security_group(ec2_client, vpc_id):
+    secrity_group = ec2_client.create_security_group(GroupName=SECURITY_GROUP_NAME,
+                                                     Description=SECURITY_GROUP_NAME,
+                                                     VpcId=vpc_id,
+                                                     TagSpecifications=name_tag("security-group", SECURITY_GROUP_NAME))
+    security_group_id = secrity_group['GroupId']
+
+    ec2_client.authorize_security_group_ingress(
+        GroupId=security_group_id,
+        IpPermissions=[
+            {'IpProtocol': 'tcp',
+            'FromPort': 22,
+            'ToPort': 22,
+            'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
+        ])
+
+    return security_group_id
+
+
+def get_cache_key(access_key, region):
+    return hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:16] + "/" + region
+
+
+def get_cache_ttl():
+    return float(os.environ.get("VEDA_INFRA_CACHE_TTL", 24 * 3600))
+
+
+def load_cached_infrastructure(cache_key):
+    records = store.get_execution_db().getBy({"type": "InfrastructureCache", "name": cache_key})
+    if len(records) == 0 or time.time() - records[0]["cachedAt"] > get_cache_ttl():
+        return None
+    return records[0]
+
+
+def save_cached_infrastructure(cache_key, infra):
+    db_conn = store.get_execution_db()
+    for record in db_conn.getBy({"type": "InfrastructureCache", "name": cache_key}):
+        db_conn.deleteById(record["id"])
+    db_conn.add({"type": "InfrastructureCache", "name": cache_key, "cachedAt": time.time(), **infra})
+
+
+def validate_infrastructure(ec2_client, infra):
+    """
+    Confirms that cached resource ids still exist and belong together, with one describe call per
+    resource issued concurrently.
+    """
+    if not os.path.exists(os.path.join(get_ssh_key_dir(), infra["key_name"])):
+        return False
+
+    try:
+        results = run_graph({
+            "keys": (lambda: ec2_client.describe_key_pairs(KeyNames=[infra["key_name"]])['KeyPairs'], []),
+            "subnets": (lambda: ec2_client.describe_subnets(SubnetIds=[infra["subnet_id"]])['Subnets'], []),
+            "sgs": (lambda: ec2_client.describe_security_groups(GroupIds=[infra["security_group_id"]])['SecurityGroups'], []),
+        })
+    except ClientError:
+        return False
+
+    return (len(results["keys"]) == 1
+            and len(results["subnets"]) == 1 and results["subnets"][0]['VpcId'] == infra["vpc_id"]
+            and len(results["sgs"]) == 1 and results["sgs"][0]['VpcId'] == infra["vpc_id"])
+
+
+def provision_infrastructure(ec2_client, cache_key=None):
+    """
+    Finds or creates the key pair, VPC, subnet and security group for an ECCO run. The lookups run
+    concurrently and creates only wait on the resources they actually need. When a cache_key is given,
+    ids discovered by an earlier run for the same account and region are reused after a quick validation.
+    """
+    if cache_key is not None:
+        cached = load_cached_infrastructure(cache_key)
+        if cached is not None:
+            infra = {k: cached[k] for k in INFRASTRUCTURE_FIELDS}
+            if validate_infrastructure(ec2_client, infra):
+                print("Reusing cached infrastructure in vpc " + infra["vpc_id"])
+                return infra
+            print("Cached infrastructure is stale. Discovering again")
+
+    def subnet(vpc_id, subnet_lookup):
+        if len(subnet_lookup) > 0:
+            print("Reusing existing subnet")
+            return subnet_lookup[0]['SubnetId']
+        return create_subnet(ec2_client, vpc_id)
+
+    def security_group(vpc_id, sg_lookup):
+        if len(sg_lookup) > 0:
+            print("Using existing security group : " + SECURITY_GROUP_NAME)
+            return sg_lookup[0]['GroupId']
+        return create_security_group(ec2_client, vpc_id)
+
+    results = run_graph({
+        "key_name": (lambda: find_or_create_key(ec2_client), []),
+        "vpc_id": (lambda: find_or_create_vpc(ec2_client), []),
+        "subnet_lookup": (lambda: describe_subnets("Name", [SUBNET_NAME], 1, ec2_client), []),
+        "sg_lookup": (lambda: describe_sgs("Name", [SECURITY_GROUP_NAME], 1, ec2_client), []),
+        "subnet_id": (subnet, ["vpc_id", "subnet_lookup"]),
+        "security_group_id": (security_group, ["vpc_id", "sg_lookup"]),
+    })
+
+    print("Security group id ", results["security_group_id"])
+    infra = {k: results[k] for k in INFRASTRUCTURE_FIELDS}
+    if cache_key is not None:
+        save_cached_infrastructure(cache_key, infra)
+    return infra
@@ -0,0 +1,205 @@
+import re
+import posixpath
+import typer
+
+# ECCO V4 release 4 is built with a 96 tile domain decomposition (nPx * nPy in SIZE.h), one MPI rank per tile
+DEFAULT_RANKS = 96
+
+# nTimeSteps of the shipped namelist, the full 1992-2017 state estimate
+DEFAULT_TOTAL_TIME_STEPS = 227903
+
+# Permanent pickups of spot runs are written every 30 model days. With one hour time steps that is 720
+# steps, a few minutes of wall time on the default instance
+DEFAULT_CHECKPOINT_INTERVAL = 30 * 86400
+
+# Instance type the ECCO AMI was set up and run on. Its 48 cores run the 96 ranks on hyperthreads. Types with
+# a physical core per rank cost more per hour and are only used when asked for with --instance-type or
+# picked by the placement engine
+DEFAULT_INSTANCE_TYPE = "c5.24xlarge"
+
+# Instance types the ECCO AMI runs on as (vCPUs, physical cores), smallest first within each family
+INSTANCE_TYPES = {
+    "c5.4xlarge": (16, 8),
+    "c5.9xlarge": (36, 18),
+    "c5.12xlarge": (48, 24),
+    "c5.18xlarge": (72, 36),
+    "c5.24xlarge": (96, 48),
+    "c6i.16xlarge": (64, 32),
+    "c6i.24xlarge": (96, 48),
+    "c6i.32xlarge": (128, 64),
+    "c6a.32xlarge": (128, 64),
+    "c6a.48xlarge": (192, 96),
+}
+
+# MITgcm namelist parameters set from ecco_configs as (namelist group, parameters)
+NAMELIST_PARAMETERS = {
+    "time_step": ("PARM03", ["deltaTmom", "deltaTtracer", "deltaTClock", "deltaTfreesurf"]),
+    "total_time_steps": ("PARM03", ["nTimeSteps"]),
+    "gravity": ("PARM01", ["gravity"]),
+    "rhonil": ("PARM01", ["rhonil"]),
+}
+
+
+def select_instance_type(ranks, instance_type=None, instance_types=INSTANCE_TYPES,
+                         default_instance_type=DEFAULT_INSTANCE_TYPE):
+    """
+    Returns the instance type for a run with the given rank count and whether the ranks have to share
+    physical cores. Uses default_instance_type when it is one of instance_types. Otherwise prefers the
+    smallest instance with a physical core per rank and only falls back to hyperthreads when no instance has
+    enough cores. instance_types maps names to (vCPUs, physical cores).
+    """
+    if instance_type is None and default_instance_type in instance_types \
+            and instance_types[default_instance_type][0] >= ranks:
+        instance_type = default_instance_type
+    if instance_type is not None:
+        if instance_type not in instance_types:
+            raise ValueError("Unknown instance type " + instance_type + ". Expected one of " + ", ".join(instance_types))
+        vcpus, cores = instance_types[instance_type]
+        if ranks > vcpus:
+            raise ValueError(f"{instance_type} has {vcpus} vCPUs which is not enough for {ranks} ranks")
+        return instance_type, ranks > cores
+
+    by_size = sorted(instance_types.items(), key=lambda item: (item[1][1], item[1][0]))
+    for name, (vcpus, cores) in by_size:
+        if cores >= ranks:
+            return name, False
+    for name, (vcpus, cores) in by_size:
+        if vcpus >= ranks:
+            return name, True
+    raise ValueError(f"No instance type has enough vCPUs for {ranks} ranks")
+
+
+def check_ranks(ranks):
+    """
+    MITgcm fixes nPx * nPy when mitgcmuv is compiled and aborts at startup when mpirun starts a different
+    number of ranks, so a run can only use the decomposition the ECCO image was built with
+    """
+    if ranks != DEFAULT_RANKS:
+        raise typer.BadParameter(f"mitgcmuv of the ECCO image is built for {DEFAULT_RANKS} tiles and needs "
+                                 f"exactly {DEFAULT_RANKS} MPI ranks, not {ranks}", param_hint="--ranks")
+
+
+def mpi_command(ranks, hyperthreads=False):
+    if hyperthreads:
+        pinning = "--use-hwthread-cpus --bind-to hwthread --map-by hwthread"
+    else:
+        pinning = "--bind-to core --map-by core"
+    return f"mpirun -np {ranks} {pinning} ./mitgcmuv"
+
+
+def namelist_values(ecco_configs, test_steps=None):
+    """
+    Maps ecco_configs to MITgcm namelist values grouped by namelist group
+    """
+    configs = dict(ecco_configs)
+    if test_steps:
+        configs["total_time_steps"] = test_steps
+
+    groups = {}
+    for key, value in configs.items():
+        if key not in NAMELIST_PARAMETERS:
+            continue
+        group, parameters = NAMELIST_PARAMETERS[key]
+        for parameter in parameters:
+            groups.setdefault(group, {})[parameter] = value
+    return groups
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return ".TRUE." if value else ".FALSE."
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def patch_namelist(text, group, values):
+    """
+    Sets parameters inside one namelist group of a MITgcm data file. Existing assignments are replaced
+    and missing ones are added before the end of the group. Everything else is left untouched.
+    """
+    match = re.search(r"^\s*&" + group + r"\b.*?^\s*[&/]\s*$", text, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+    if match is None:
+        raise ValueError("Namelist group " + group + " was not found")
+
+    body = match.group(0)
+    end = re.search(r"^\s*[&/]\s*$(?![\s\S]*^\s*[&/]\s*$)", body, re.MULTILINE)
+    head, tail = body[:end.start()], body[end.start():]
+
+    for parameter, value in values.items():
+        assignment = re.compile(r"^(\s*)" + parameter + r"\s*=\s*[^,\n]*,?", re.IGNORECASE | re.MULTILINE)
+        replacement = parameter + "=" + format_value(value) + ","
+        if assignment.search(head):
+            head = assignment.sub(lambda m: m.group(1) + replacement, head)
+        else:
+            head = head.rstrip("\n") + "\n " + replacement + "\n"
+
+    return text[:match.start()] + head + tail + text[match.end():]
+
+
+def namelist_iteration(text, parameter="nIter0"):
+    match = re.search(r"^\s*" + parameter + r"\s*=\s*(\d+)", text, re.IGNORECASE | re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def render_data(text, ecco_configs, test_steps=None, checkpoint_interval=None, start_iteration=None):
+    """
+    Renders the data namelist. checkpoint_interval writes permanent pickups every that many model seconds
+    (pChkptFreq). start_iteration restarts the run from the pickup of that iteration and shortens nTimeSteps
+    so the run still ends at the same iteration.
+    """
+    groups = namelist_values(ecco_configs, test_steps)
+    if checkpoint_interval:
+        groups.setdefault("PARM03", {})["pChkptFreq"] = float(checkpoint_interval)
+    if start_iteration:
+        total_time_steps = test_steps or int(ecco_configs.get("total_time_steps", 0)) \
+            or namelist_iteration(text, "nTimeSteps") or DEFAULT_TOTAL_TIME_STEPS
+        end_iteration = namelist_iteration(text) + total_time_steps
+        groups.setdefault("PARM03", {}).update({"nIter0": start_iteration,
+                                                "nTimeSteps": max(end_iteration - start_iteration, 0)})
+    for group, values in groups.items():
+        text = patch_namelist(text, group, values)
+    return text
+
+
+def apply_configs(ssh, run_dir, ecco_configs, test_steps=None, checkpoint_interval=None, start_iteration=None):
+    """
+    Renders the data namelist of the run directory over the open SSH session. The shipped namelist is
+    kept as data.orig and every run is rendered from it, so applying configs twice gives the same file.
+    """
+    sftp = ssh.open_sftp()
+    try:
+        data_path = posixpath.join(run_dir, "data")
+        template_path = data_path + ".orig"
+        try:
+            sftp.stat(template_path)
+        except IOError:
+            sftp.rename(data_path, template_path)
+
+        with sftp.open(template_path, "r") as template:
+            text = template.read().decode("utf-8")
+
+        with sftp.open(data_path, "w") as data:
+            data.write(render_data(text, ecco_configs, test_steps, checkpoint_interval, start_iteration).encode("utf-8"))
+    finally:
+        sftp.close()
+
+
+def build(ecco_configs, ranks=None, instance_type=None, test_steps=None, instance_types=INSTANCE_TYPES,
+          checkpoint_interval=None):
+    """
+    Resolves the instance type, rank count and mpirun command of a run
+    """
+    ranks = ranks or DEFAULT_RANKS
+    check_ranks(ranks)
+    instance_type, hyperthreads = select_instance_type(ranks, instance_type, instance_types)
+    if hyperthreads and instance_type != DEFAULT_INSTANCE_TYPE:
+        print(f"Warning: {instance_type} does not have a physical core for each of the {ranks} ranks")
+    return {
+        "instanceType": instance_type,
+        "ranks": ranks,
+        "mpiCommand": mpi_command(ranks, hyperthreads),
+        "eccoConfigs": dict(ecco_configs),
+        "testSteps": test_steps,
+        "checkpointInterval": checkpoint_interval,
+    }
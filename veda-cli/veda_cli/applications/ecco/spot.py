@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import posixpath
+import typer
+import paramiko
+import botocore.exceptions
+from datetime import datetime
+from rich import print
+from veda_cli import store
+from veda_cli import ssh
+from veda_cli.executions import sftp
+from veda_cli.applications.ecco import ecco_app
+from veda_cli.applications.ecco import provision
+from veda_cli.applications.ecco import run_config
+
+# Permanent pickups are named <prefix>.<iteration>.data/.meta, e.g. pickup.0000008761.data and
+# pickup_seaice.0000008761.meta. MITgcm writes the .meta file after the .data file is complete
+PICKUP_PATTERN = re.compile(r"^(pickup\w*)\.(\d{10})\.(data|meta)$")
+
+# Answers 404 until EC2 schedules the instance for interruption, about two minutes before it happens
+INTERRUPTION_COMMAND = ("TOKEN=$(curl -s -m 2 -X PUT http://169.254.169.254/latest/api/token "
+                        "-H 'X-aws-ec2-metadata-token-ttl-seconds: 60'); "
+                        "curl -s -m 2 -o /dev/null -w '%{http_code}' -H \"X-aws-ec2-metadata-token: $TOKEN\" "
+                        "http://169.254.169.254/latest/meta-data/spot/instance-action")
+
+STATUS_COMMAND = ("cd {0} && if pgrep -x mitgcmuv >/dev/null; then echo RUNNING; "
+                  "elif grep -qs 'Execution ended Normally' STDOUT.0000; then echo COMPLETED; else echo STOPPED; fi")
+
+GONE_STATES = ["shutting-down", "terminated", "stopping", "stopped"]
+
+DEFAULT_INTERVAL = 60
+
+
+def get_pickup_dir(execution_id):
+    return os.path.join(store.VEDA_HOME, "pickups", execution_id)
+
+
+def latest_pickup(names):
+    """
+    Returns the highest iteration with a complete set of pickup files among the file names, or None. A set is
+    complete when every pickup prefix written at any iteration has both its .data and .meta file.
+    """
+    found = {}
+    for name in names:
+        match = PICKUP_PATTERN.match(name)
+        if match:
+            found.setdefault(int(match.group(2)), set()).add((match.group(1), match.group(3)))
+
+    prefixes = {prefix for files in found.values() for prefix, kind in files}
+    for iteration in sorted(found, reverse=True):
+        if all((prefix, kind) in found[iteration] for prefix in prefixes for kind in ("data", "meta")):
+            return iteration
+    return None
+
+
+def pickup_files(names, iteration):
+    suffix = "." + str(iteration).zfill(10) + "."
+    return [name for name in names if PICKUP_PATTERN.match(name) and suffix in name]
+
+
+def update(execution, **fields):
+    execution.update(fields)
+    ecco_app.get_db().updateById(execution["id"], fields)
+
+
+def model_status(execution, wait=False, persist=True):
+    exit_status, stdout, stderr = ssh.run(execution, STATUS_COMMAND.format(ecco_app.RUN_DIR), timeout=30,
+                                          persist=persist, wait=wait)
+    return stdout.strip()
+
+
+def interruption_noticed(execution, wait=False):
+    exit_status, stdout, stderr = ssh.run(execution, INTERRUPTION_COMMAND, timeout=30, wait=wait)
+    return stdout.strip() == "200"
+
+
+def sync_pickups(execution, client):
+    """
+    Downloads the newest complete pickup set from the instance if it is newer than the last one synced, and
+    drops older local sets. Returns the iteration of the newest local pickup.
+    """
+    listing = sftp.list_dir(client, ecco_app.RUN_DIR)
+    iteration = latest_pickup([name for name, is_dir, size, mtime in listing])
+    if iteration is None or iteration <= execution.get("pickupIteration", 0):
+        return execution.get("pickupIteration", 0)
+
+    names = pickup_files([name for name, is_dir, size, mtime in listing], iteration)
+    files = [(name, size, int(mtime)) for name, is_dir, size, mtime in listing if name in names]
+    pickup_dir = get_pickup_dir(execution["executionId"])
+    progress = sftp.download(client, ecco_app.RUN_DIR, files, pickup_dir)
+
+    for name in os.listdir(pickup_dir):
+        if PICKUP_PATTERN.match(name) and name not in names:
+            os.remove(os.path.join(pickup_dir, name))
+    update(execution, pickupIteration=iteration, pickupTime=time.time())
+    print(f"Synced pickup {iteration} of {execution['executionId']}: {progress.summary()}")
+    return iteration
+
+
+def instance_state(ec2_client, instance_id):
+    try:
+        reservations = ec2_client.describe_instances(InstanceIds=[instance_id])["Reservations"]
+    except botocore.exceptions.ClientError as e:
+        # Terminated instances drop out of describe_instances after a while
+        if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+            raise
+        return "terminated"
+    for reservation in reservations:
+        for instance in reservation["Instances"]:
+            return instance["State"]["Name"]
+    return "terminated"
+
+
+def release(execution):
+    """
+    Stops the control socket daemon and deregisters the MFT storage of the interrupted instance
+    """
+    ssh.stop_daemon(execution["executionId"])
+    if execution.get("storageId"):
+        try:
+            ecco_app.deregister_execution_endpoint(execution["storageId"])
+        except Exception as e:
+            print(f"Could not deregister storage {execution['storageId']} of {execution['executionId']}: {e}")
+        update(execution, storageId=None)
+
+
+def relaunch(execution, ec2_client):
+    """
+    Starts a new spot instance for the execution, uploads the latest synced pickup and resumes the model from
+    it. The execution keeps its id, only the instance fields change. The new instance is terminated again if
+    the model could not be resumed on it.
+    """
+    iteration = execution.get("pickupIteration", 0)
+    print(f"Relaunching {execution['executionId']} from pickup {iteration or 'none, starting over'}")
+    release(execution)
+
+    infra = provision.provision_infrastructure(ec2_client, provision.get_cache_key(execution["accessKey"],
+                                                                                   execution["region"]))
+    instance_id = None
+    storage_id = None
+    try:
+        instance_id = ecco_app.request_instances(ec2_client, infra, 1, execution["instanceType"], spot=True)[0]
+        # Recorded right away so kill and reconcile find the new instance whatever happens next. Fails if the
+        # execution was killed meanwhile, which terminates the instance below
+        update(execution, instanceId=instance_id, publicIp=None)
+
+        public_ip = ecco_app.wait_for_public_ips(ec2_client, [instance_id])[0][1]
+        update(execution, publicIp=public_ip)
+
+        client = ecco_app.create_ssh_connection(execution["loginUser"], public_ip, execution["keyPath"])
+        pickup_dir = get_pickup_dir(execution["executionId"])
+        if iteration:
+            session = client.open_sftp()
+            try:
+                for name in pickup_files(os.listdir(pickup_dir), iteration):
+                    session.put(os.path.join(pickup_dir, name), posixpath.join(ecco_app.RUN_DIR, name))
+            finally:
+                session.close()
+
+        run_cfg = run_config.build(execution["eccoConfigs"], execution["ranks"], execution["instanceType"],
+                                   execution.get("testSteps"), checkpoint_interval=execution.get("checkpointInterval"))
+        run_cfg["startIteration"] = iteration or None
+        ecco_app.start_model(public_ip, execution["keyPath"], run_cfg)
+
+        with open(execution["keyPath"], "r") as key_file:
+            private_key = key_file.read()
+        storage_id = ecco_app.register_execution_endpoint(execution["executionId"] + " storage", private_key,
+                                                          execution["loginUser"], public_ip, 22)
+
+        update(execution, storageId=storage_id, state="RUNNING", restarts=execution.get("restarts", 0) + 1,
+               resumedFrom=iteration, resumedTime=datetime.now().strftime("%m/%d/%Y, %H:%M:%S"))
+    except BaseException:
+        if instance_id is None:
+            raise
+        print(f"Could not resume {execution['executionId']} on {instance_id}, terminating it")
+        try:
+            ec2_client.terminate_instances(InstanceIds=[instance_id])
+        except Exception as e:
+            print(f"Could not terminate {instance_id}: {e}")
+        if storage_id:
+            try:
+                ecco_app.deregister_execution_endpoint(storage_id)
+            except Exception as e:
+                print(f"Could not deregister storage {storage_id} of {execution['executionId']}: {e}")
+        raise
+    print(f"Resumed {execution['executionId']} on {instance_id} ({public_ip})")
+
+
+def check(execution, ec2_client):
+    """
+    One supervision round. Returns the state of the execution afterwards
+    """
+    # A relaunch that failed on the previous attempt of the job is retried right away
+    if execution.get("state") == "INTERRUPTED":
+        relaunch(execution, ec2_client)
+        return "RUNNING"
+
+    try:
+        status = model_status(execution)
+        if status == "COMPLETED":
+            sync_pickups(execution, ssh.connect_execution(execution, wait=False))
+            update(execution, state="COMPLETED")
+            return "COMPLETED"
+        if status == "STOPPED":
+            # Model died without the instance going away. Restarting on the same host would fail the same way
+            update(execution, state="FAILED")
+            return "FAILED"
+
+        noticed = interruption_noticed(execution)
+        client = ssh.connect_execution(execution, wait=False)
+        sync_pickups(execution, client)
+        if not noticed:
+            return "RUNNING"
+        print(f"Spot interruption notice for {execution['instanceId']}")
+        ssh.close(client)
+    except (OSError, EOFError, paramiko.SSHException) as e:
+        if instance_state(ec2_client, execution["instanceId"]) not in GONE_STATES:
+            print(f"Could not reach {execution['publicIp']}: {e}")
+            return "RUNNING"
+        print(f"Instance {execution['instanceId']} is gone")
+
+    # The instance may be gone because the execution was killed while this round ran
+    if ecco_app.get_db().getById(execution["id"]) is None:
+        return "KILLED"
+    update(execution, state="INTERRUPTED")
+    relaunch(execution, ec2_client)
+    return "RUNNING"
+
+
+def supervise(execution_id, interval=DEFAULT_INTERVAL, concurrency=None):
+    """
+    Watches a spot execution until the model finishes. Pickups are synced off the instance as they are
+    written, and when the instance is interrupted the run is relaunched from the latest one. The record is
+    read again before every round, so killing the execution stops the supervisor.
+    """
+    db_conn = ecco_app.get_db()
+    executions = db_conn.getBy({"type": "Execution", "executionId": execution_id})
+    if len(executions) == 0:
+        raise ValueError("No execution with id " + execution_id)
+    record_id = executions[0]["id"]
+    os.makedirs(get_pickup_dir(execution_id), exist_ok=True)
+    ec2_client = ecco_app.create_ec2_client(executions[0]["accessKey"], executions[0]["secretKey"],
+                                            executions[0]["region"])
+
+    while True:
+        execution = db_conn.getById(record_id)
+        if execution is None:
+            state = "KILLED"
+            break
+        state = execution.get("state", "RUNNING")
+        if state not in ("RUNNING", "INTERRUPTED"):
+            break
+        state = check(execution, ec2_client)
+        if state != "RUNNING":
+            break
+        time.sleep(interval)
+    print(f"Execution {execution_id} {state}")
+
+
+def supervise_command(executionid: str,
+                      interval: int = typer.Option(DEFAULT_INTERVAL, help="Seconds between checks of the instance")):
+    """
+    Syncs the pickups of a spot execution and relaunches it from the latest one whenever its instance is
+    interrupted. Spot launches start this as a background job
+    """
+    supervise(executionid, interval)
@@ -1,69 +1,96 @@
 import typer
-from rich.table import Table
-from rich.console import Console
-from pysondb import db
 import os
+import shutil
+import posixpath
 from datetime import datetime
-from airavata_mft_cli import operations as ops
-from airavata_mft_cli import config as configcli
-from airavata_mft_sdk import mft_client
-from airavata_mft_sdk.scp import SCPCredential_pb2
-from airavata_mft_sdk.scp import SCPStorage_pb2
-from airavata_mft_sdk.common import StorageCommon_pb2
-from airavata_mft_sdk.common import StorageCommon_pb2
 from airavata_mft_sdk import MFTTransferApi_pb2
-import time
+from veda_cli import lazy
+from veda_cli import store
+from veda_cli import output
+from typing import Optional
+from veda_cli.datasets import listing
+from veda_cli.datasets import manifest
 
-app = typer.Typer()
+# Transfers, SSH, jobs, packing and the cache are imported by the commands that use them, so listing and
+# inspecting datasets does not load grpc or paramiko
+app = lazy.Typer({"cache": ("veda_cli.datasets.cache:app", "Show or clear the local dataset cache")})
 
 def get_db():
-    return db.getDb(os.path.join(os.path.expanduser('~'), ".veda", "ds.json"))
+    db_conn = store.get_dataset_db()
+    manifest.externalize(db_conn)
+    return db_conn
 
 def get_exec_db():
-    return db.getDb(os.path.join(os.path.expanduser('~'), ".veda", "db.json"))
+    return store.get_execution_db()
 
-@app.command("list")
-def list_datasets():
-    console = Console()
-    table = Table()
-
-    table.add_column('Dataset Name', justify='left')
-    table.add_column('Description', justify='left')
-    table.add_column('Tags', justify='left')
-
-    table.add_row('ECCO-NASA-V4', 'NASA Hosted ECCO V4 Dataset', 'OCEAN, CLIMATE')
-
-    db_conn = get_db()
-    dss = db_conn.getBy({"type":"Dataset"})
+DATASET_COLUMNS = [("name", "Dataset Name"), ("description", "Description"), ("tags", "Tags")]
 
-    for ds in dss:
-        table.add_row(ds["name"], "Replica available in storage " + ds["storageId"], 'CUSTOM')
+def iter_datasets(db_conn):
+    yield {"name": "ECCO-NASA-V4", "description": "NASA Hosted ECCO V4 Dataset", "tags": "OCEAN, CLIMATE"}
+    for ds in db_conn.iterBy({"type":"Dataset"}):
+        yield {**ds, "description": "Replica available in storage " + ds["storageId"], "tags": "CUSTOM"}
 
-    console.print(table)
+@app.command("list")
+def list_datasets(format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    output.emit(iter_datasets(get_db()), format, fields, DATASET_COLUMNS)
 
 @app.command("info")
-def dataset_info(dataset_name):
-    print("Printing dataset info")
+def dataset_info(dataset_name, format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    if format == "table":
+        print("Printing dataset info")
     db_conn = get_db()
-    datasets = db_conn.getBy({"type":"Dataset",  "name": dataset_name})
-    for ds in datasets:
-        print(ds)
+    output.emit(db_conn.iterBy({"type":"Dataset",  "name": dataset_name}), format, fields)
 
 def get_file_list(storage_id, root_dir):
-
-    metadata_resp = ops.get_resource_metadata(storage_id + "/" + root_dir)
-
-    file_metadata = metadata_resp.directory.files
-
-    files = []
-    for f in file_metadata:
-        files.append(f.friendlyName)
-
-    return files
+    return listing.walk(storage_id, root_dir)
+
+def sync_dataset(db_conn, storage_id, dataset_name, base_path, files):
+    """
+    Updates the file list of an already registered dataset in place with only what changed since the
+    last registration. Registers it as a new dataset if it does not exist yet.
+    """
+    datasets = db_conn.getBy({"type":"Dataset", "name": dataset_name, "storageId": storage_id})
+    if len(datasets) == 0:
+        print("No existing registration of " + dataset_name + " in storage " + storage_id + ". Registering all files")
+        db_conn.add({
+            "type": "Dataset",
+            "storageId": storage_id,
+            "name": dataset_name,
+            "base_path": base_path,
+            "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
+            **manifest.write(files)})
+        return
+
+    ds = datasets[0]
+    old_files = manifest.load(ds)
+    added, modified, removed = manifest.diff(old_files, files)
+    print(f"{len(added)} new, {len(modified)} modified and {len(removed)} removed files")
+    # Also rewritten when legacy entries can take their sizes and modification times from the listing
+    if added or modified or removed or any(manifest.is_legacy(f) for f in old_files):
+        db_conn.updateById(ds["id"], {**manifest.write(files), "base_path": base_path})
+        manifest.release(db_conn, ds)
+
+def pack_dataset(execution, dataset_name, dataset_path, files, shard_size):
+    """
+    Packs the dataset files into compressed shards next to the outputs on the instance
+    """
+    from veda_cli import ssh
+    from veda_cli.datasets import packing
+    pack_dir = packing.get_pack_dir(execution["outputDir"], dataset_name)
+    packed = packing.pack_remote(ssh.connect_execution(execution), dataset_path,
+                                 [(f["path"], f["size"]) for f in files], pack_dir, shard_size)
+    return {**packed, "storageId": execution["storageId"]}
 
 @app.command("register")
-def register_dataset(execution_id, dataset_name, dataset_path):
+def register_dataset(execution_id, dataset_name, dataset_path,
+                     incremental: bool = typer.Option(False, "--incremental",
+                                                      help="Only record what changed since the last registration"),
+                     pack: bool = typer.Option(False, "--pack",
+                                               help="Pack the files into compressed tar shards on the instance for faster transfers"),
+                     shard_size_mb: int = typer.Option(1024, help="Uncompressed size of each packed shard")):
     print("Registring the dataset")
+    if pack and incremental:
+        raise typer.BadParameter("--pack can not be combined with --incremental")
 
     db_conn = get_exec_db()
     executions = db_conn.getBy({"type":"Execution", "executionId": execution_id})
@@ -71,16 +98,26 @@ def register_dataset(execution_id, dataset_name, dataset_path):
     storage_id = execution["storageId"]
     output_dir = execution["outputDir"]
 
-    dataset_path = output_dir + "/" + dataset_path
+    dataset_path = output_dir + "/" + dataset_path if dataset_path else output_dir
 
     db_conn = get_db()
+    if incremental:
+        sync_dataset(db_conn, storage_id, dataset_name, dataset_path, list(get_file_list(storage_id, dataset_path)))
+        return
+
+    files = get_file_list(storage_id, dataset_path)
+    packed = None
+    if pack:
+        files = list(files)
+        packed = pack_dataset(execution, dataset_name, dataset_path, files, shard_size_mb * 1024 * 1024)
+
     db_conn.add({
         "type": "Dataset",
         "storageId": storage_id,
         "name": dataset_name, 
         "base_path": dataset_path, 
         "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
-        "files": get_file_list(storage_id, dataset_path)})
+        **manifest.write(files, packed)})
     
 def register_custom_dataset(execution_id, dataset_name, dataset_base_path, dataset_paths):
     print("Registring custom datasets")
@@ -90,6 +127,10 @@ def register_custom_dataset(execution_id, dataset_name, dataset_base_path, datas
     execution = executions[0]
     storage_id = execution["storageId"]
 
+    selected = set(p.strip("/") for p in dataset_paths)
+    def is_selected(path):
+        return any(path == p or path.startswith(p + "/") for p in selected)
+
     db_conn = get_db()
     db_conn.add({
         "type": "Dataset",
@@ -97,44 +138,157 @@ def register_custom_dataset(execution_id, dataset_name, dataset_base_path, datas
         "name": dataset_name, 
         "base_path": dataset_base_path, 
         "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
-        "files": dataset_paths})
+        **manifest.write(f for f in get_file_list(storage_id, dataset_base_path) if is_selected(f["path"]))})
     
 @app.command("register-local")
-def register_local_dataset(dataset_name, dataset_path):
+def register_local_dataset(dataset_name, dataset_path,
+                           incremental: bool = typer.Option(False, "--incremental",
+                                                            help="Only record what changed since the last registration")):
     print("Registring the dataset")
 
     db_conn = get_db()
+    if incremental:
+        sync_dataset(db_conn, "local-agent", dataset_name, dataset_path, list(get_file_list("local-agent", dataset_path)))
+        return
+
     db_conn.add({
         "type": "Dataset",
         "storageId": "local-agent",
         "name": dataset_name, 
         "base_path": dataset_path, 
         "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
-        "files": get_file_list("local-agent", dataset_path)})
+        **manifest.write(get_file_list("local-agent", dataset_path))})
     
 @app.command("copy")
-def copy_dataset(dataset_name, target_storage):
+def copy_dataset(dataset_name, target_storage,
+                 incremental: bool = typer.Option(False, "--incremental",
+                                                  help="Only copy files that are new or modified since the last copy"),
+                 background: bool = typer.Option(False, "--background", help="Queue the copy as a background job"),
+                 concurrency: int = typer.Option(4, help="Parallel MFT transfers")):
+    from veda_cli import jobs
+    if background:
+        job_id = jobs.submit("dataset-copy", {"dataset_name": dataset_name, "target_storage": target_storage,
+                                              "incremental": incremental, "confirm": False},
+                             label="copy " + dataset_name + " to " + target_storage, transfers=concurrency)
+        print("Queued job " + job_id + ". Follow it with veda job status " + job_id)
+        return
+    publish_dataset(dataset_name, target_storage, incremental, concurrency)
+
+def publish_dataset(dataset_name, target_storage, incremental=False, concurrency=4, confirm=True):
+    from veda_cli import transfers
     print("Publishing the Dataset to storage " + target_storage)
     db_conn = get_db()
     datasets = db_conn.getBy({"type":"Dataset",  "name": dataset_name})
-    if len(datasets) > 0:
-        ds = datasets[0]
-        ops.copy(ds["storageId"] + "/" + ds["base_path"], target_storage + "/" + ds["name"] + "/")
+    sources = [d for d in datasets if d["storageId"] != target_storage]
+    if len(sources) > 0:
+        ds = sources[0]
+        copies = db_conn.getBy({"type":"Dataset", "name": dataset_name, "storageId": target_storage})
+        if incremental and len(copies) > 0:
+            copy_changed_files(ds, copies[0], target_storage, concurrency)
+            db_conn.updateById(copies[0]["id"], manifest.write(manifest.load(ds)))
+            manifest.release(db_conn, copies[0])
+            return
+
+        transfers.copy_path(ds["storageId"] + "/" + ds["base_path"], target_storage + "/" + ds["name"] + "/", confirm)
         ds["storageId"] = target_storage
+        ds["base_path"] = ds["name"]
         db_conn.add(ds)
 
-def get_dataset(dataset_name, destination_path):
+def copy_changed_files(ds, target_ds, target_storage, concurrency=4):
+    from veda_cli import transfers
+    added, modified, removed = manifest.diff(manifest.load(target_ds), manifest.load(ds))
+    print(f"{len(added)} new, {len(modified)} modified files to copy. {len(removed)} files only exist in the target")
+
+    changed = added + modified
+    if len(changed) == 0:
+        return
+
+    endpoint_paths = []
+    for entry in changed:
+        endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
+            sourcePath = ds["base_path"] + "/" + entry["path"],
+            destinationPath = ds["name"] + "/" + entry["path"]))
+
+    transfers.copy_sharded(ds["storageId"], target_storage, endpoint_paths, sizes=[e["size"] for e in changed],
+                           concurrency=concurrency)
+
+def get_packed_dataset(ds, packed, destination_path, concurrency=4):
+    """
+    Transfers the packed shards of a dataset and unpacks each one as soon as it has arrived, while the
+    remaining shards are still being transferred
+    """
+    from veda_cli import transfers
+    from veda_cli.datasets import packing
+    staging_dir = os.path.join(destination_path, ".veda-pack")
+    os.makedirs(staging_dir, exist_ok=True)
+
+    endpoint_paths = []
+    for shard in packed["shards"]:
+        endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
+            sourcePath = posixpath.join(packed["path"], shard["name"]),
+            destinationPath = os.path.join(staging_dir, shard["name"])))
+
+    unpacker = packing.Unpacker(packed["codec"], destination_path)
+    def on_shard_done(shard):
+        for endpoint_path in shard.endpoint_paths:
+            unpacker.submit(endpoint_path.destinationPath)
+
+    try:
+        transfers.copy_sharded(ds["storageId"], "local-agent", endpoint_paths, sizes=[s["size"] for s in packed["shards"]],
+                               concurrency=concurrency, files_per_shard=1, on_shard_done=on_shard_done)
+    finally:
+        unpacker.wait()
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+@app.command("get")
+def get_dataset_command(dataset_name, destination_path,
+                        background: bool = typer.Option(False, "--background", help="Queue the download as a background job"),
+                        concurrency: int = typer.Option(4, help="Parallel MFT transfers"),
+                        use_cache: bool = typer.Option(True, "--cache/--no-cache", help="Use the local dataset cache")):
+    from veda_cli import jobs
+    destination_path = os.path.abspath(destination_path)
+    if background:
+        job_id = jobs.submit("dataset-get", {"dataset_name": dataset_name, "destination_path": destination_path,
+                                             "use_cache": use_cache},
+                             label="get " + dataset_name + " to " + destination_path, transfers=concurrency)
+        print("Queued job " + job_id + ". Follow it with veda job status " + job_id)
+        return
+    get_dataset(dataset_name, destination_path, concurrency, use_cache=use_cache)
+
+def get_dataset(dataset_name, destination_path, concurrency=4, files_per_shard=500, use_cache=True):
+    from veda_cli.datasets import cache
     db_conn = get_db()
     datasets = db_conn.getBy({"type":"Dataset",  "name": dataset_name})
     if len(datasets) > 0:
         ds = datasets[0]
-        endpoint_paths = []
-        for f in ds['files']:
-            endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
-                sourcePath = ds["base_path"] + "/" + f,
-                destinationPath = destination_path + "/" + f))
-            
-        copy(ds["storageId"], "local-agent", endpoint_paths)
+        files = manifest.load(ds)
+        missing = cache.checkout(dataset_name, files, destination_path) if use_cache else files
+        if len(missing) == 0:
+            return
+
+        packed = manifest.load_packing(ds)
+        # Shards only exist in the storage the dataset was packed in, copies in other storages are fetched file
+        # by file. Shards are also skipped when the cache already has part of the dataset
+        if packed and packed.get("storageId") == ds["storageId"] and len(missing) == len(files):
+            get_packed_dataset(ds, packed, destination_path, concurrency)
+        else:
+            fetch_files(ds, missing, destination_path, concurrency, files_per_shard)
+
+        if use_cache:
+            cache.ingest(dataset_name, missing, destination_path)
+
+def fetch_files(ds, files, destination_path, concurrency=4, files_per_shard=500):
+    from veda_cli import transfers
+    endpoint_paths = []
+    sizes = []
+    for entry in files:
+        endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
+            sourcePath = ds["base_path"] + "/" + entry["path"],
+            destinationPath = destination_path + "/" + entry["path"]))
+        sizes.append(entry["size"])
+
+    transfers.copy_sharded(ds["storageId"], "local-agent", endpoint_paths, sizes=sizes,
+                           concurrency=concurrency, files_per_shard=files_per_shard)
 
 @app.command("delete")
 def delete_dataset(dataset_name):
@@ -142,60 +296,4 @@ def delete_dataset(dataset_name):
     datasets = db_conn.getBy({"type":"Dataset",  "name": dataset_name})
     for ds in datasets:
         db_conn.deleteById(ds['id'])
-
-
-def copy(source_storage_id, dest_storage_id, endpoint_paths):
-
-  source_storage_id, source_secret_id = ops.fetch_storage_and_secret_ids(source_storage_id)
-  dest_storage_id, dest_secret_id = ops.fetch_storage_and_secret_ids(dest_storage_id)
-
-  ## TODO : Check agent availability and deploy cloud agents if required
-
-  total_volume = 0
-
-  transfer_request = ops.MFTTransferApi_pb2.TransferApiRequest(sourceStorageId = source_storage_id,
-                                                           sourceSecretId = source_secret_id,
-                                                           destinationStorageId = dest_storage_id,
-                                                           destinationSecretId = dest_secret_id,
-                                                           optimizeTransferPath = False)
-
-  transfer_request.endpointPaths.extend(endpoint_paths)
-
-  client = mft_client.MFTClient(transfer_api_port = configcli.transfer_api_port,
-                                transfer_api_secured = configcli.transfer_api_secured,
-                                resource_service_host = configcli.resource_service_host,
-                                resource_service_port = configcli.resource_service_port,
-                                resource_service_secured = configcli.resource_service_secured,
-                                secret_service_host = configcli.secret_service_host,
-                                secret_service_port = configcli.secret_service_port)
-
-  transfer_resp = client.transfer_api.submitTransfer(transfer_request)
-
-  transfer_id = transfer_resp.transferId
-
-  state_request = MFTTransferApi_pb2.TransferStateApiRequest(transferId=transfer_id)
-
-  ## TODO: This has to be optimized and avoid frequent polling of all transfer ids in each iteration
-  ## Possible fix is to introduce a parent batch transfer id at the API level and fetch child trnasfer id
-  # summaries in a single API call
-
-  completed = 0
-  failed = 0
-
-  with typer.progressbar(length=100) as progress:
-
-    while 1:
-      state_resp = client.transfer_api.getTransferStateSummary(state_request)
-
-      progress.update(int(state_resp.percentage * 100))
-      if (state_resp.percentage == 1.0):
-        completed = len(state_resp.completed)
-        failed = len(state_resp.failed)
-        break
-
-      if (state_resp.state == "FAILED"):
-        print("Transfer failed. Reason: " + state_resp.description)
-        raise typer.Abort()
-      time.sleep(1)
-
-  print(f"Processed {completed + failed} files. Completed {completed}, Failed {failed}.")
\ No newline at end of file
+        manifest.release(db_conn, ds)
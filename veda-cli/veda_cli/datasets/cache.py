@@ -0,0 +1,237 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import typer
+from rich import print
+from veda_cli import store
+
+DEFAULT_CACHE_SIZE = 50 * 1024 ** 3
+
+app = typer.Typer()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache_dir():
+    return os.path.join(store.VEDA_HOME, "cache")
+
+
+def get_cache_size():
+    return int(float(os.environ.get("VEDA_CACHE_SIZE", DEFAULT_CACHE_SIZE)))
+
+
+def cache_key(dataset_name, entry):
+    """
+    Files with a checksum are addressed by content, so the same file is stored once even when several
+    datasets contain it. Files without one are keyed by dataset, path, size and modification time.
+    """
+    if entry.get("md5"):
+        return "md5-" + entry["md5"] + "-" + str(entry.get("size", 0))
+    identity = "\0".join([dataset_name, entry["path"], str(entry.get("size", 0)), str(entry.get("mtime"))])
+    return "sha256-" + hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(entry):
+    """
+    Entries without a checksum or a modification time can not be told apart from a changed file. MFT reports
+    an unknown modification time as 0
+    """
+    return bool(entry.get("md5")) or bool(entry.get("mtime"))
+
+
+def link_or_copy(source, destination):
+    """
+    Hardlinks source to destination, copying when they are on different file systems
+    """
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class DatasetCache:
+    """
+    Local content addressed store of dataset files with LRU eviction. Objects are hardlinked to and from the
+    destinations and permissions are left alone, so the modification time of every object is recorded and an
+    object whose file was modified in place through a link is dropped instead of being handed out again.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                              "last_used REAL NOT NULL, mtime INTEGER)")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+            if "mtime" not in columns:
+                self.conn.execute("ALTER TABLE entries ADD COLUMN mtime INTEGER")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+
+    def object_path(self, key):
+        return os.path.join(self.path, "objects", key.split("-")[1][:2], key)
+
+    def lookup(self, keys):
+        """
+        Returns the subset of keys that are cached
+        """
+        found = set()
+        keys = list(keys)
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute("SELECT key FROM entries WHERE key IN (" + ",".join("?" * len(chunk)) + ")",
+                                         chunk).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def touch(self, keys):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in keys])
+
+    def checkout(self, key, size, destination):
+        """
+        Links a cached file into destination. Returns False when the cached object is missing, damaged or was
+        modified through one of its links
+        """
+        path = self.object_path(key)
+        with self.lock:
+            row = self.conn.execute("SELECT mtime FROM entries WHERE key = ?", (key,)).fetchone()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        # Objects cached before modification times were recorded have none to compare against
+        if st is None or st.st_size != size or (row and row[0] is not None and st.st_mtime_ns != row[0]):
+            self.forget([key])
+            return False
+        link_or_copy(path, destination)
+        return True
+
+    def ingest(self, key, source):
+        """
+        Adds a downloaded file to the cache by hardlinking it, so caching a file costs no extra space
+        """
+        path = self.object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            link_or_copy(source, path)
+        st = os.stat(path)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, size, last_used, mtime) VALUES (?, ?, ?, ?)",
+                              (key, st.st_size, time.time(), st.st_mtime_ns))
+
+    def forget(self, keys):
+        with self.lock, self.conn:
+            for key in keys:
+                path = self.object_path(key)
+                if os.path.exists(path):
+                    os.remove(path)
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def total_size(self):
+        """
+        Returns the bytes of all cached files, whether or not they are still linked from a checkout, and their
+        number
+        """
+        with self.lock:
+            total, count = self.conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries").fetchone()
+        return total, count
+
+    def evict(self, max_size=None):
+        """
+        Removes least recently used files until the cache fits in max_size. Returns the number of bytes freed
+        """
+        max_size = self.max_size if max_size is None else max_size
+        with self.lock:
+            total, count = self.total_size()
+            if total <= max_size:
+                return 0
+            victims = []
+            freed = 0
+            for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+                if total - freed <= max_size:
+                    break
+                victims.append(key)
+                freed += size
+            self.forget(victims)
+            return freed
+
+    def clear(self):
+        """
+        Removes every file from the cache, including those still linked from a checkout. Returns the number of
+        bytes freed
+        """
+        with self.lock:
+            freed, count = self.total_size()
+            self.forget([row[0] for row in self.conn.execute("SELECT key FROM entries").fetchall()])
+            return freed
+
+
+def get_cache(path=None, max_size=None):
+    path = path or get_cache_dir()
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = DatasetCache(path, get_cache_size() if max_size is None else max_size)
+        return _caches[path]
+
+
+def checkout(dataset_name, files, destination_path, cache=None):
+    """
+    Links every cached file of the dataset into destination_path. Returns the entries that still have to be
+    fetched
+    """
+    cache = cache or get_cache()
+    keys = [cache_key(dataset_name, f) if is_cacheable(f) else None for f in files]
+    cached = cache.lookup(key for key in keys if key is not None)
+
+    missing = []
+    hits = []
+    for key, entry in zip(keys, files):
+        if key is not None and key in cached and cache.checkout(key, entry.get("size", 0), os.path.join(destination_path, entry["path"])):
+            hits.append(key)
+        else:
+            missing.append(entry)
+    cache.touch(hits)
+    print(f"{len(hits)} files from the local cache, {len(missing)} to fetch")
+    return missing
+
+
+def ingest(dataset_name, files, destination_path, cache=None):
+    """
+    Adds files that were just fetched into destination_path to the cache and evicts old entries if it grew
+    past its size limit
+    """
+    cache = cache or get_cache()
+    for entry in files:
+        path = os.path.join(destination_path, entry["path"])
+        if is_cacheable(entry) and os.path.exists(path):
+            cache.ingest(cache_key(dataset_name, entry), path)
+    freed = cache.evict()
+    if freed:
+        print(f"Evicted {freed / 1e6:.1f} MB of least recently used files from the local cache")
+
+
+@app.command("info")
+def cache_info():
+    cache = get_cache()
+    total, count = cache.total_size()
+    print(f"{count} files, {total / 1e6:.1f} MB of {cache.max_size / 1e6:.1f} MB in {cache.path}")
+
+
+@app.command("clear")
+def cache_clear(max_size_mb: int = typer.Option(0, help="Only evict down to this size instead of clearing everything")):
+    cache = get_cache()
+    freed = cache.evict(max_size_mb * 1024 * 1024) if max_size_mb else cache.clear()
+    print(f"Freed {freed / 1e6:.1f} MB")
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from airavata_mft_sdk import MFTTransferApi_pb2
+from veda_cli import trace
+
+
+def _file_entry(relative_path, file):
+    entry = {"path": relative_path, "size": file.resourceSize, "mtime": file.updateTime}
+    if file.md5sum:
+        entry["md5"] = file.md5sum
+    return entry
+
+
+def file_entry(f):
+    """
+    Datasets registered before sizes were recorded only store the relative path of each file
+    """
+    if isinstance(f, str):
+        return {"path": f, "size": 0}
+    return f
+
+
+def error_name(metadata):
+    """
+    Name of the error code of a failed metadata response, the number itself if the code is unknown
+    """
+    value = metadata.DESCRIPTOR.fields_by_name["error"].enum_type.values_by_number.get(metadata.error)
+    return value.name if value else str(metadata.error)
+
+
+def walk(storage_id, root_dir, workers=8):
+    """
+    Lists every file under root_dir, descending into subdirectories. Directories are fetched one level
+    at a time by a bounded pool of workers and file entries are yielded as soon as their directory has
+    been listed, so the whole tree is never held in memory at once.
+    """
+    # Imported here so the manifest code, which only needs file_entry, does not load grpc
+    from veda_cli import mft
+    storage_id, secret_id = mft.fetch_storage_and_secret_ids(storage_id)
+    client = mft.get_client()
+
+    def list_dir(resource_path):
+        trace.count("listed directories")
+        id_req = MFTTransferApi_pb2.GetResourceMetadataFromIDsRequest(storageId=storage_id,
+                                                                      secretId=secret_id,
+                                                                      resourcePath=resource_path)
+        return client.transfer_api.resourceMetadata(MFTTransferApi_pb2.FetchResourceMetadataRequest(idRequest=id_req))
+
+    root = list_dir(root_dir)
+    if root.WhichOneof('metadata') == 'file':
+        yield _file_entry(root.file.friendlyName, root.file)
+        return
+    if root.WhichOneof('metadata') == 'error':
+        raise RuntimeError("Failed to list " + root_dir + ": " + error_name(root))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        queued = []
+        in_flight = {}
+
+        def visit(directory, relative_dir):
+            for dir in directory.directories:
+                queued.append((dir.resourcePath, relative_dir + dir.friendlyName + "/"))
+            for file in directory.files:
+                yield _file_entry(relative_dir + file.friendlyName, file)
+
+        yield from visit(root.directory, "")
+
+        while queued or in_flight:
+            while queued and len(in_flight) < workers:
+                resource_path, relative_dir = queued.pop()
+                in_flight[pool.submit(list_dir, resource_path)] = (resource_path, relative_dir)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                resource_path, relative_dir = in_flight.pop(future)
+                metadata = future.result()
+                if metadata.WhichOneof('metadata') == 'error':
+                    raise RuntimeError("Failed to list " + resource_path + ": " + error_name(metadata))
+                yield from visit(metadata.directory, relative_dir)
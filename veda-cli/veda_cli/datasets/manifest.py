@@ -0,0 +1,186 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+from veda_cli import store
+from veda_cli.datasets import listing
+
+# Manifests are stored as gzipped columnar json. Directory prefixes are written once and each file only
+# refers to its directory by index, which keeps deep MITgcm trees with thousands of files per directory small.
+# The file name is the sha256 of the content, so datasets with identical file lists share one manifest.
+MANIFEST_VERSION = 1
+
+_cache = {}
+
+
+def get_manifest_dir():
+    return os.path.join(store.VEDA_HOME, "manifests")
+
+
+def encode(files, packing=None):
+    """
+    Encodes a file list, which may be a generator, in a single pass. Entries are sorted by path so the same
+    files always produce the same bytes, whatever order they were listed in. packing describes the shards
+    the files were packed into, if any. Returns the encoded bytes, the file count and the total size
+    """
+    rows = []
+    for f in files:
+        entry = listing.file_entry(f)
+        dir_name, _, name = entry["path"].rpartition("/")
+        rows.append((dir_name, name, entry.get("size", 0), entry.get("mtime"), entry.get("md5")))
+    rows.sort()
+
+    dirs = {}
+    columns = {"dir": [], "name": [], "size": [], "mtime": [], "md5": []}
+    for dir_name, name, size, mtime, md5 in rows:
+        columns["dir"].append(dirs.setdefault(dir_name, len(dirs)))
+        columns["name"].append(name)
+        columns["size"].append(size)
+        columns["mtime"].append(mtime)
+        columns["md5"].append(md5)
+
+    content = {"version": MANIFEST_VERSION, "dirs": list(dirs), **columns}
+    if packing:
+        content["packing"] = packing
+    data = json.dumps(content, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(data, mtime=0), len(rows), sum(columns["size"])
+
+
+def decode(data):
+    """
+    Returns the file list and the packing of an encoded manifest
+    """
+    content = json.loads(gzip.decompress(data))
+    dirs = content["dirs"]
+    files = []
+    for dir_index, name, size, mtime, md5 in zip(content["dir"], content["name"], content["size"],
+                                                content["mtime"], content["md5"]):
+        dir_name = dirs[dir_index]
+        entry = {"path": dir_name + "/" + name if dir_name else name, "size": size, "mtime": mtime}
+        if md5:
+            entry["md5"] = md5
+        files.append(entry)
+    return files, content.get("packing")
+
+
+def manifest_path(manifest_hash):
+    return os.path.join(get_manifest_dir(), manifest_hash[:2], manifest_hash + ".json.gz")
+
+
+def write(files, packing=None):
+    """
+    Stores the file list and returns the record fields that reference it
+    """
+    data, file_count, total_size = encode(files, packing)
+    manifest_hash = hashlib.sha256(data).hexdigest()
+    path = manifest_path(manifest_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+    return {"manifest": manifest_hash, "fileCount": file_count, "totalSize": total_size}
+
+
+def _read(manifest_hash):
+    if manifest_hash not in _cache:
+        with open(manifest_path(manifest_hash), "rb") as f:
+            _cache[manifest_hash] = decode(f.read())
+    return _cache[manifest_hash]
+
+
+def read(manifest_hash):
+    return _read(manifest_hash)[0]
+
+
+def load(ds):
+    """
+    Returns the file list of a dataset record. Only reads the manifest when it is asked for
+    """
+    if ds.get("manifest"):
+        return read(ds["manifest"])
+    return [listing.file_entry(f) for f in ds.get("files", [])]
+
+
+def load_packing(ds):
+    """
+    Returns how the files of a dataset record were packed into shards, or None when they were not
+    """
+    if ds.get("manifest"):
+        return _read(ds["manifest"])[1]
+    return None
+
+
+def release(db_conn, ds):
+    """
+    Removes the manifest of a deleted dataset record unless another record still refers to it
+    """
+    manifest_hash = ds.get("manifest")
+    if not manifest_hash:
+        return
+    if any(d.get("manifest") == manifest_hash for d in db_conn.getBy({"type": "Dataset"}) if d["id"] != ds["id"]):
+        return
+    if os.path.exists(manifest_path(manifest_hash)):
+        os.remove(manifest_path(manifest_hash))
+    _cache.pop(manifest_hash, None)
+
+
+def externalize(db_conn):
+    """
+    Moves file lists that are still stored inline in dataset records into manifests. Runs once per store.
+    """
+    if not hasattr(db_conn, "replaceById") or db_conn.get_meta("manifests_externalized"):
+        return
+
+    for ds in db_conn.getBy({"type": "Dataset"}):
+        if "files" in ds:
+            files = ds.pop("files")
+            ds.update(write(files))
+            db_conn.replaceById(ds["id"], ds)
+
+    db_conn.set_meta("manifests_externalized", "1")
+
+
+def is_legacy(entry):
+    """
+    Entries of datasets registered before sizes were recorded have neither a modification time nor a checksum,
+    and their size of 0 is a placeholder
+    """
+    return entry.get("mtime") is None and not entry.get("md5")
+
+
+def is_modified(old, new):
+    # Nothing was recorded to compare against, the listing only fills in the missing fields
+    if is_legacy(old) or is_legacy(new):
+        return False
+    if old.get("size") != new.get("size"):
+        return True
+    if old.get("md5") and new.get("md5"):
+        return old["md5"] != new["md5"]
+    return old.get("mtime") != new.get("mtime")
+
+
+def diff(old_files, new_files):
+    """
+    Compares two file lists by path, size and checksum (or mtime when either side has no checksum). Legacy
+    entries without a size are only compared by path. Returns the added, modified and removed entries.
+    """
+    old_entries = {}
+    for f in old_files:
+        entry = listing.file_entry(f)
+        old_entries[entry["path"]] = entry
+
+    added = []
+    modified = []
+    for f in new_files:
+        entry = listing.file_entry(f)
+        old = old_entries.pop(entry["path"], None)
+        if old is None:
+            added.append(entry)
+        elif is_modified(old, entry):
+            modified.append(entry)
+
+    return added, modified, list(old_entries.values())
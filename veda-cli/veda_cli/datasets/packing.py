@@ -0,0 +1,175 @@
+import os
+import shlex
+import shutil
+import tarfile
+import posixpath
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from veda_cli import ssh
+
+# Files are packed into tar shards of about this many uncompressed bytes. Paths are packed in sorted
+# order so the .data and .meta files of a diagnostic always end up in the same shard.
+DEFAULT_SHARD_SIZE = 1024 * 1024 * 1024
+
+SHARD_EXTENSIONS = {"zstd": ".tar.zst", "gzip": ".tar.gz"}
+
+
+def get_pack_dir(output_dir, name):
+    """
+    Shards are kept next to the output directory so they never show up in listings of the outputs
+    """
+    return posixpath.join(posixpath.dirname(output_dir.rstrip("/")), ".veda-pack", name)
+
+
+def plan_shards(files, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Groups (relative path, size) entries into consecutive shards of at most shard_size bytes. A file larger
+    than shard_size gets a shard of its own.
+    """
+    shards = []
+    current = []
+    current_size = 0
+    for path, size in sorted(files):
+        if current and current_size + size > shard_size:
+            shards.append(current)
+            current = []
+            current_size = 0
+        current.append((path, size))
+        current_size += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def remote_compressor(client):
+    """
+    Returns the codec and compress command available on the instance. Prefers zstd and falls back to gzip
+    """
+    exit_status, stdout, stderr = ssh.run_on(client, "if command -v zstd >/dev/null; then echo zstd; "
+                                                     "elif command -v pigz >/dev/null; then echo pigz; else echo gzip; fi")
+    tool = stdout.strip()
+    if tool == "zstd":
+        return "zstd", "zstd -q -3 -T1"
+    if tool == "pigz":
+        return "gzip", "pigz -p 1 -1"
+    return "gzip", "gzip -1"
+
+
+def pack_remote(client, root, files, pack_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Packs the given (relative path, size) entries under root into compressed tar shards in pack_dir on the
+    instance. Shards are compressed in parallel on all cores of the instance. Returns the packing record that
+    is stored with the dataset manifest.
+    """
+    codec, compress = remote_compressor(client)
+    extension = SHARD_EXTENSIONS[codec]
+    shards = plan_shards(files, shard_size)
+
+    exit_status, stdout, stderr = ssh.run_on(client, "rm -rf {0} && mkdir -p {0}".format(shlex.quote(pack_dir)))
+    if exit_status != 0:
+        raise RuntimeError("Failed to create " + pack_dir + ": " + stderr.strip())
+
+    sftp = client.open_sftp()
+    try:
+        for i, shard in enumerate(shards):
+            with sftp.open(posixpath.join(pack_dir, f"shard-{i:05d}.list"), "wb") as f:
+                f.write(b"\0".join(path.encode("utf-8") for path, size in shard))
+    finally:
+        sftp.close()
+
+    pack_command = ("export VEDA_PACK_ROOT={1}; cd {0} && ls shard-*.list | xargs -P $(nproc) -I{{}} sh -c "
+                    "'tar -C \"$VEDA_PACK_ROOT\" --null -T {{}} -cf - | {2} > $(basename {{}} .list){3} && rm {{}}'").format(
+        shlex.quote(pack_dir), shlex.quote(root), compress, extension)
+    print(f"Packing {len(files)} files into {len(shards)} {codec} shards on the instance")
+    exit_status, stdout, stderr = ssh.run_on(client, pack_command)
+    if exit_status != 0:
+        raise RuntimeError("Packing failed: " + stderr.strip())
+
+    sftp = client.open_sftp()
+    try:
+        packed = []
+        for i, shard in enumerate(shards):
+            name = f"shard-{i:05d}{extension}"
+            packed.append({"name": name, "size": sftp.stat(posixpath.join(pack_dir, name)).st_size,
+                           "files": len(shard), "bytes": sum(size for path, size in shard)})
+    finally:
+        sftp.close()
+
+    raw = sum(s["bytes"] for s in packed)
+    compressed = sum(s["size"] for s in packed)
+    print(f"Packed {raw / 1e6:.1f} MB into {compressed / 1e6:.1f} MB")
+    return {"codec": codec, "path": pack_dir, "shards": packed}
+
+
+def remove_remote(client, pack_dir):
+    ssh.run_on(client, "rm -rf " + shlex.quote(pack_dir))
+
+
+def _extract(tar, destination):
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(destination, filter="data")
+    else:
+        tar.extractall(destination)
+
+
+def unpack(shard_path, codec, destination):
+    """
+    Extracts one shard into destination while decompressing it as a stream. The uncompressed tar is never
+    written to disk.
+    """
+    os.makedirs(destination, exist_ok=True)
+    if codec == "gzip":
+        with tarfile.open(shard_path, "r|gz") as tar:
+            _extract(tar, destination)
+        return
+
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+    if zstandard is not None:
+        with open(shard_path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as stream:
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                _extract(tar, destination)
+        return
+
+    if shutil.which("zstd") is None:
+        raise RuntimeError("Unpacking zstd shards needs the zstandard python package or the zstd command")
+    process = subprocess.Popen(["zstd", "-dcq", shard_path], stdout=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+            _extract(tar, destination)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError("zstd failed to decompress " + shard_path)
+
+
+class Unpacker:
+    """
+    Unpacks shards in the background as soon as they have been transferred, and removes each shard file
+    once it has been extracted
+    """
+
+    def __init__(self, codec, destination, workers=2):
+        self.codec = codec
+        self.destination = destination
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def submit(self, shard_path):
+        def run():
+            unpack(shard_path, self.codec, self.destination)
+            os.remove(shard_path)
+        with self.lock:
+            self.futures.append(self.pool.submit(run))
+
+    def wait(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.pool.shutdown()
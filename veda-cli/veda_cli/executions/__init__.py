@@ -1,62 +1,122 @@
 import typer
-from rich.table import Table
-from rich.console import Console
-from pysondb import db
-import os
+from veda_cli import store
 from rich import print
-import boto3
-import veda_cli.executions.ouput as op
+from veda_cli import lazy
+from veda_cli import output
+from typing import List, Optional
+from datetime import datetime, timedelta
 
 
-app = typer.Typer()
-
-app.add_typer(op.app, name="output")
+app = lazy.Typer({
+    "output": ("veda_cli.executions.ouput:app", "List and download execution outputs"),
+    "monitor": ("veda_cli.executions.monitor:monitor", "Follow a running execution and record its throughput"),
+    "metrics": ("veda_cli.executions.monitor:metrics", "Show recorded throughput metrics of an execution"),
+    "reconcile": ("veda_cli.executions.reconcile:reconcile_command", "Terminate instances of finished executions"),
+    "supervise": ("veda_cli.applications.ecco.spot:supervise_command", "Checkpoint and relaunch a spot execution"),
+})
 
 def get_db():
-    return db.getDb(os.path.join(os.path.expanduser('~'), ".veda", "db.json"))
+    return store.get_execution_db()
 
-@app.command("list")
-def list_executions():
-    console = Console()
-    table = Table()
+EXECUTION_COLUMNS = [("executionId", "Execution Id"), ("application", "Application"), ("runtime", "Runtime"),
+                     ("createdTime", "Created Time")]
 
-    table.add_column('Execution Id', justify='left')
-    table.add_column('Application', justify='left')
-    table.add_column('Runtime', justify='left')
-    table.add_column('Created Time', justify='left')
+@app.command("list")
+def list_executions(format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    db_conn = get_db()
+    output.emit(db_conn.iterBy({"type":"Execution"}), format, fields, EXECUTION_COLUMNS)
 
+@app.command("info")
+def execution_info(executionid: str, format: str = output.format_option(),
+                   fields: Optional[str] = output.fields_option()):
     db_conn = get_db()
-    executions = db_conn.getBy({"type":"Execution"})
+    output.emit(db_conn.iterBy({"type":"Execution", "executionId": executionid}), format, fields)
 
-    for execution in executions:
-        table.add_row(execution['executionId'], execution['application'], execution['runtime'], execution['createdTime'])
+def parse_created_time(execution):
+    return datetime.strptime(execution["createdTime"], "%m/%d/%Y, %H:%M:%S")
 
-    console.print(table)
+def select_executions(db_conn, execution_ids=None, application=None, older_than=None, ensemble=None):
+    """
+    Returns the executions matching all of the given filters. older_than is in hours
+    """
+    query = {"type": "Execution"}
+    if application:
+        query["application"] = application
+    cutoff = datetime.now() - timedelta(hours=older_than) if older_than is not None else None
+    selected = []
+    for execution in db_conn.iterBy(query):
+        if execution_ids and execution["executionId"] not in execution_ids:
+            continue
+        if ensemble and execution.get("ensembleId") != ensemble:
+            continue
+        if cutoff and parse_created_time(execution) > cutoff:
+            continue
+        selected.append(execution)
+    return selected
 
-@app.command("info")
-def execution_info(executionid: str):
-    db_conn = get_db()
-    executions = db_conn.getBy({"type":"Execution", "executionId": executionid})
-    print(executions)
+STATUS_COLUMNS = [("executionId", "Execution Id"), ("application", "Application"), ("runtime", "Runtime"),
+                  ("instanceId", "Instance Id"), ("instanceState", "Instance"), ("createdTime", "Created Time")]
+
+@app.command("status")
+def execution_status(executionids: Optional[List[str]] = typer.Argument(None),
+                     application: Optional[str] = typer.Option(None, help="Only executions of this application"),
+                     older_than: Optional[float] = typer.Option(None, help="Only executions started this many hours ago or earlier"),
+                     ensemble: Optional[str] = typer.Option(None, help="Only members of this ensemble"),
+                     format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    """
+    Shows the instance state of the selected executions, all of them by default
+    """
+    from veda_cli import runtimes
+
+    executions = select_executions(get_db(), executionids, application, older_than, ensemble)
+    states = runtimes.get_states(executions)
+    for execution in executions:
+        execution["instanceState"] = states.get(execution.get("instanceId"), "-")
+    output.emit(executions, format, fields, STATUS_COLUMNS)
 
 @app.command("kill")
-def kill_execution(executionid):
+def kill_execution(executionids: Optional[List[str]] = typer.Argument(None),
+                   application: Optional[str] = typer.Option(None, help="Only executions of this application"),
+                   older_than: Optional[float] = typer.Option(None, help="Only executions started this many hours ago or earlier"),
+                   ensemble: Optional[str] = typer.Option(None, help="Only members of this ensemble"),
+                   all: bool = typer.Option(False, "--all", help="Kill every execution"),
+                   yes: bool = typer.Option(False, "--yes", help="Do not ask for confirmation")):
+    """
+    Terminates the instances of the selected executions, deregisters their storage and deletes them
+    """
+    if not (executionids or application or older_than is not None or ensemble or all):
+        raise typer.BadParameter("Give execution ids, a filter or --all")
+
+    from veda_cli import runtimes
+
     db_conn = get_db()
-    executions = db_conn.getBy({"type":"Execution", "executionId": executionid})
-    if len(executions) > 0:
-        for execution in executions:
-            if execution['runtime'] == 'EC2':
-
-                continue_termination = typer.confirm("This will terminate the EC2 instance " + execution['instanceId'] 
-                    + ". Do you want to continue?", False)
-
-                if continue_termination:
-                    ec2_client = boto3.client(
-                        'ec2', 
-                        aws_access_key_id=execution['accessKey'], 
-                        aws_secret_access_key=execution['secretKey'],
-                        region_name=execution['region'])
-
-                    ec2_client.terminate_instances(InstanceIds=[execution['instanceId']])
-                    print("Terminated EC2 instance :", execution['instanceId'])
-                    db_conn.deleteById(execution['id'])
+    executions = [e for e in select_executions(db_conn, executionids, application, older_than, ensemble)
+                  if e.get("runtime") in runtimes.RUNTIMES]
+    if len(executions) == 0:
+        print("No executions selected")
+        return
+
+    live = [e for e in executions if e.get("instanceId") and e.get("state") != "TERMINATED"]
+    continue_termination = yes or typer.confirm("This will terminate " + str(len(live)) + " instances of "
+                                                + str(len(executions)) + " executions ("
+                                                + ", ".join(e["executionId"] for e in executions[:5])
+                                                + (", ..." if len(executions) > 5 else "")
+                                                + "). Do you want to continue?", False)
+    if not continue_termination:
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from veda_cli.applications.ecco import ecco_app
+
+    runtimes.terminate(live)
+    print("Terminated " + str(len(live)) + " instances")
+
+    def deregister(execution):
+        try:
+            ecco_app.deregister_execution_endpoint(execution["storageId"])
+        except Exception as e:
+            print("Could not deregister storage of " + execution["executionId"] + ": " + str(e))
+
+    with ThreadPoolExecutor(max_workers=min(16, len(live) or 1)) as pool:
+        list(pool.map(deregister, [e for e in live if e.get("storageId")]))
+    db_conn.deleteMany([execution["id"] for execution in executions])
@@ -0,0 +1,81 @@
+import boto3
+import botocore.exceptions
+
+# describe_instances takes at most 200 values per filter, terminate_instances at most 1000 ids
+DESCRIBE_BATCH = 200
+TERMINATE_BATCH = 1000
+
+GONE_STATES = ["shutting-down", "terminated"]
+
+
+def create_ec2_client(account):
+    access_key, secret_key, region = account
+    return boto3.client('ec2', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
+
+
+def group_by_account(executions):
+    """
+    Groups EC2 executions by (access key, secret key, region) so each group needs one client
+    """
+    groups = {}
+    for execution in executions:
+        key = (execution["accessKey"], execution["secretKey"], execution["region"])
+        groups.setdefault(key, []).append(execution)
+    return groups
+
+
+def describe_states(ec2_client, instance_ids):
+    """
+    Returns the state of every instance with one describe_instances call per 200 ids. Instances EC2 no
+    longer knows about are reported as terminated
+    """
+    states = {instance_id: "terminated" for instance_id in instance_ids}
+    paginator = ec2_client.get_paginator("describe_instances")
+    for start in range(0, len(instance_ids), DESCRIBE_BATCH):
+        batch = instance_ids[start:start + DESCRIBE_BATCH]
+        for page in paginator.paginate(Filters=[{"Name": "instance-id", "Values": batch}]):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    states[instance["InstanceId"]] = instance["State"]["Name"]
+    return states
+
+
+def get_states(executions):
+    """
+    Instance state of every EC2 execution, keyed by instance id, with one client per account and region
+    """
+    states = {}
+    for account, members in group_by_account(executions).items():
+        states.update(describe_states(create_ec2_client(account), [e["instanceId"] for e in members]))
+    return states
+
+
+def terminate_batch(ec2_client, instance_ids):
+    """
+    Terminates the instances in one call. EC2 rejects the whole call with InvalidInstanceID.NotFound if any
+    id is unknown, so those ids are dropped and the call is repeated for the rest
+    """
+    while instance_ids:
+        try:
+            ec2_client.terminate_instances(InstanceIds=instance_ids)
+            return
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+            states = describe_states(ec2_client, instance_ids)
+            known = [instance_id for instance_id in instance_ids if states[instance_id] != "terminated"]
+            if len(known) == len(instance_ids):
+                raise
+            instance_ids = known
+
+
+def terminate(executions):
+    """
+    Terminates the instances of the executions with one terminate_instances call per account and region.
+    Instances EC2 no longer knows about are skipped
+    """
+    for account, members in group_by_account(executions).items():
+        ec2_client = create_ec2_client(account)
+        instance_ids = [e["instanceId"] for e in members]
+        for start in range(0, len(instance_ids), TERMINATE_BATCH):
+            terminate_batch(ec2_client, instance_ids[start:start + TERMINATE_BATCH])
@@ -0,0 +1,213 @@
+import re
+import time
+import typer
+from datetime import datetime
+from collections import deque
+from rich import print
+from rich.table import Table
+from rich.console import Console
+from veda_cli import store
+from veda_cli import ssh
+from veda_cli.applications.ecco import ecco_app
+
+STAT_MARKER = "%VEDA_STAT"
+LIVE_MARKER = "%VEDA_LIVE"
+
+# MITgcm monitor output, e.g. "(PID.TID 0000.0001) %MON time_tsnumber = 240"
+MON_PATTERN = re.compile(r"%MON\s+(\w+)\s*=\s*(\S+)")
+
+DEFAULT_TIME_STEP = 3600
+DEFAULT_TOTAL_TIME_STEPS = 227903
+
+
+def get_db():
+    return store.get_execution_db()
+
+
+def tail_command(run_dir, interval):
+    """
+    Remote command that prints the recent model log, then follows the logs and emits host cpu and memory
+    counters every interval seconds, all on one channel
+    """
+    return ("cd " + run_dir + "; tail -q -n 200 mpi.out STDOUT.0000 2>/dev/null; echo " + LIVE_MARKER + "; "
+            "tail -n 0 -F mpi.out STDOUT.0000 2>/dev/null & "
+            "while true; do echo \"" + STAT_MARKER + " $(head -1 /proc/stat | cut -d' ' -f2-) "
+            "$(grep -E '^(MemTotal|MemAvailable):' /proc/meminfo | tr -s ' ' | cut -d' ' -f2 | tr '\\n' ' ')\"; "
+            "sleep " + str(interval) + "; done")
+
+
+class ModelProgress:
+    """
+    Tracks time step progress and host load parsed from the tailed log lines
+    """
+
+    def __init__(self, time_step, total_time_steps, window=20):
+        self.time_step = time_step
+        self.total_time_steps = total_time_steps
+        self.samples = deque(maxlen=window)
+        self.current_step = None
+        self.cpu_percent = None
+        self.memory_percent = None
+        self.last_cpu = None
+        self.errors = []
+        self.live = False
+
+    def feed(self, line, now=None):
+        """
+        Parses one log line. Returns True when it changed the progress or host load
+        """
+        now = time.monotonic() if now is None else now
+        line = line.strip()
+        if line == LIVE_MARKER:
+            # Steps read from the log history only set the starting point, their timing is unknown
+            self.live = True
+            if self.current_step is not None:
+                self.samples.append((now, self.current_step))
+            return False
+        if line.startswith(STAT_MARKER):
+            return self.feed_stat(line[len(STAT_MARKER):].split())
+
+        match = MON_PATTERN.search(line)
+        if match and match.group(1) == "time_tsnumber":
+            step = int(float(match.group(2)))
+            if step != self.current_step:
+                self.current_step = step
+                if self.live:
+                    self.samples.append((now, step))
+                return True
+            return False
+
+        if "ERROR" in line or "ABNORMAL END" in line:
+            self.errors.append(line)
+            return True
+        return False
+
+    def feed_stat(self, fields):
+        if len(fields) < 6:
+            return False
+        counters = [int(v) for v in fields[:-2]]
+        mem_total, mem_available = int(fields[-2]), int(fields[-1])
+        idle = counters[3] + counters[4]
+        total = sum(counters[:8])
+        if self.last_cpu is not None and total > self.last_cpu[1]:
+            self.cpu_percent = 100.0 * (1 - (idle - self.last_cpu[0]) / (total - self.last_cpu[1]))
+        self.last_cpu = (idle, total)
+        if mem_total > 0:
+            self.memory_percent = 100.0 * (mem_total - mem_available) / mem_total
+        return True
+
+    @property
+    def steps_per_second(self):
+        if len(self.samples) < 2:
+            return None
+        (t0, s0), (t1, s1) = self.samples[0], self.samples[-1]
+        if t1 <= t0:
+            return None
+        return (s1 - s0) / (t1 - t0)
+
+    @property
+    def sim_days_per_hour(self):
+        rate = self.steps_per_second
+        if rate is None:
+            return None
+        return rate * self.time_step * 3600 / 86400
+
+    @property
+    def eta(self):
+        rate = self.steps_per_second
+        if not rate or self.current_step is None:
+            return None
+        return max(self.total_time_steps - self.current_step, 0) / rate
+
+    def metric(self):
+        return {
+            "time": time.time(),
+            "timeStep": self.current_step,
+            "stepsPerSecond": self.steps_per_second,
+            "simDaysPerHour": self.sim_days_per_hour,
+            "eta": self.eta,
+            "cpuPercent": self.cpu_percent,
+            "memoryPercent": self.memory_percent,
+        }
+
+    def summary(self):
+        def fmt(value, pattern):
+            return "-" if value is None else pattern.format(value)
+        return (f"step {fmt(self.current_step, '{}')}/{self.total_time_steps}"
+                f"  {fmt(self.steps_per_second, '{:.2f}')} steps/s"
+                f"  {fmt(self.sim_days_per_hour, '{:.1f}')} sim days/h"
+                f"  eta {fmt(self.eta, '{:.0f}')}s"
+                f"  cpu {fmt(self.cpu_percent, '{:.0f}')}%"
+                f"  mem {fmt(self.memory_percent, '{:.0f}')}%")
+
+
+def progress_for(execution):
+    configs = execution.get("eccoConfigs") or {}
+    total = execution.get("testSteps") or configs.get("total_time_steps", DEFAULT_TOTAL_TIME_STEPS)
+    return ModelProgress(float(configs.get("time_step", DEFAULT_TIME_STEP)), int(total))
+
+
+def metric_record(execution, progress):
+    return {"type": "ExecutionMetric", "executionId": execution["executionId"],
+            "instanceType": execution.get("instanceType"), "ranks": execution.get("ranks"), **progress.metric()}
+
+
+def monitor(executionid: str,
+            interval: int = typer.Option(10, help="Seconds between host samples and stored metrics"),
+            duration: int = typer.Option(0, help="Stop after this many seconds. Runs until interrupted when 0")):
+    """
+    Streams model progress, throughput and host load of a running execution and records them as metrics
+    """
+    db_conn = get_db()
+    executions = db_conn.getBy({"type": "Execution", "executionId": executionid})
+    if len(executions) == 0:
+        print("No execution with id " + executionid)
+        raise typer.Exit(1)
+    execution = executions[0]
+
+    progress = progress_for(execution)
+    channel = ssh.connect_execution(execution).get_transport().open_session()
+    # The pty makes the remote tail and sampling loop exit when the channel is closed
+    channel.get_pty()
+    channel.exec_command(tail_command(ecco_app.RUN_DIR, interval))
+
+    started = time.monotonic()
+    last_stored = 0
+    try:
+        for line in channel.makefile("r"):
+            progress.feed(line)
+            for error in progress.errors:
+                print("[bold red]" + error + "[/bold red]")
+            progress.errors.clear()
+
+            now = time.monotonic()
+            if now - last_stored >= interval:
+                last_stored = now
+                db_conn.add(metric_record(execution, progress))
+                print(datetime.now().strftime("%H:%M:%S") + "  " + progress.summary())
+
+            if duration and now - started >= duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        channel.close()
+
+
+def metrics(executionid: str):
+    """
+    Prints the recorded metrics time series of an execution
+    """
+    table = Table()
+    for column in ["Time", "Instance", "Step", "Steps/s", "Sim days/h", "CPU %", "Mem %"]:
+        table.add_column(column, justify='left')
+
+    def fmt(value, pattern="{:.2f}"):
+        return "-" if value is None else pattern.format(value)
+
+    for m in get_db().iterBy({"type": "ExecutionMetric", "executionId": executionid}):
+        table.add_row(datetime.fromtimestamp(m["time"]).strftime("%m/%d/%Y, %H:%M:%S"), str(m.get("instanceType")),
+                      fmt(m["timeStep"], "{}"), fmt(m["stepsPerSecond"]), fmt(m["simDaysPerHour"], "{:.1f}"),
+                      fmt(m["cpuPercent"], "{:.0f}"), fmt(m["memoryPercent"], "{:.0f}"))
+
+    Console().print(table)
@@ -1,30 +1,120 @@
 import typer
 from rich.table import Table
 from rich.console import Console
-from pysondb import db
+from veda_cli import store
 import os
+import posixpath
 from rich import print
-import boto3
-from airavata_mft_cli import operations as ops
+from veda_cli import mft
+from veda_cli import transfers
+from veda_cli import ssh
+from veda_cli.executions import sftp
+from veda_cli.datasets import packing
 from typing import Optional
 
 
 app = typer.Typer()
 
 def get_db():
-    return db.getDb(os.path.join(os.path.expanduser('~'), ".veda", "db.json"))
+    return store.get_execution_db()
+
+def find_execution(executionid):
+    executions = get_db().getBy({"type":"Execution", "executionId": executionid})
+    if len(executions) == 0:
+        print("No execution with id " + executionid)
+        raise typer.Exit(1)
+    return executions[0]
+
+def output_path(execution, path):
+    return posixpath.join(execution["outputDir"], path) if path else execution["outputDir"]
 
 @app.command("list")
-def list_outputs(executionid: str, prefix :Optional[str] = typer.Argument("")):
-    db_conn = get_db()
-    executions = db_conn.getBy({"type":"Execution", "executionId": executionid})
-    ops.list(executions[0]["storageId"] + "/" + executions[0]["outputDir"] + "/" + prefix )
-    #print(executions)
+def list_outputs(executionid: str, prefix :Optional[str] = typer.Argument(""),
+                 engine: str = typer.Option("auto", help="auto, direct (SFTP) or mft")):
+    execution = find_execution(executionid)
+
+    console = Console()
+    table = Table()
+
+    table.add_column('Name', justify='left')
+    table.add_column('Type', justify='center')
+    table.add_column('Size', justify='center')
+
+    if engine == "direct" or (engine == "auto" and sftp.has_direct_access(execution)):
+        for name, is_dir, size, mtime in sftp.list_dir(ssh.connect_execution(execution), output_path(execution, prefix)):
+            if is_dir:
+                table.add_row('[bold]' + name + '[/bold]', 'DIR', '')
+            else:
+                table.add_row('[bold]' + name + '[/bold]', 'FILE', str(size))
+        console.print(table)
+        return
+
+    metadata_resp = mft.get_resource_metadata(execution["storageId"] + "/" + execution["outputDir"] + "/" + prefix)
+
+    if (metadata_resp.WhichOneof('metadata') == 'directory'):
+        for dir in metadata_resp.directory.directories:
+            table.add_row('[bold]' + dir.friendlyName + '[/bold]', 'DIR', '')
+
+        for file in metadata_resp.directory.files:
+            table.add_row('[bold]' + file.friendlyName + '[/bold]', 'FILE', str(file.resourceSize))
+
+    elif (metadata_resp.WhichOneof('metadata') == 'file'):
+        table.add_row('[bold]' + metadata_resp.file.friendlyName + '[/bold]', 'FILE', str(metadata_resp.file.resourceSize))
+
+    elif (metadata_resp.WhichOneof('metadata') == 'error'):
+        print(metadata_resp.error)
+
+    console.print(table)
 
 
 @app.command("download")
-def download_outputs(executionid: str, output: str, destination: str ):
-    db_conn = get_db()
-    executions = db_conn.getBy({"type":"Execution", "executionId": executionid})
-    ops.copy(executions[0]["storageId"] + "/" + executions[0]["outputDir"] + "/" + output, "local-agent/" + destination)
-    #print(executions)
\ No newline at end of file
+def download_outputs(executionid: str, output: str, destination: str,
+                     engine: str = typer.Option("auto", help="auto, direct (SFTP) or mft. auto picks by file count and size"),
+                     streams: int = typer.Option(8, help="Parallel SFTP streams for direct downloads"),
+                     compress: bool = typer.Option(False, "--compress", help="Compress direct downloads on the wire"),
+                     pack: bool = typer.Option(False, "--pack", help="Pack the outputs into compressed tar shards on the instance first"),
+                     shard_size_mb: int = typer.Option(256, help="Uncompressed size of each packed shard")):
+    execution = find_execution(executionid)
+
+    if pack:
+        download_packed(execution, output_path(execution, output), destination, streams, shard_size_mb * 1024 * 1024)
+        return
+
+    files = None
+    if engine == "auto" and sftp.has_direct_access(execution):
+        files = sftp.walk(ssh.connect_execution(execution), output_path(execution, output))
+        engine = sftp.choose_engine(execution, files)
+    elif engine == "auto":
+        engine = "mft"
+
+    if engine == "mft":
+        transfers.copy_path(execution["storageId"] + "/" + execution["outputDir"] + "/" + output, "local-agent/" + destination)
+        return
+
+    client = ssh.connect_execution(execution, compress=compress)
+    if files is None:
+        files = sftp.walk(client, output_path(execution, output))
+    print(f"Downloading {len(files)} files over {streams} SFTP streams")
+    progress = sftp.download(client, output_path(execution, output), files, destination, streams)
+    print("[bold blue]Downloaded " + progress.summary() + "[/bold blue]")
+
+def download_packed(execution, root, destination, streams, shard_size):
+    """
+    Packs the outputs on the instance, fetches the shards over SFTP and unpacks each shard while the others
+    are still downloading
+    """
+    client = ssh.connect_execution(execution)
+    files = sftp.walk(client, root)
+    pack_dir = packing.get_pack_dir(execution["outputDir"], "download-" + posixpath.basename(root.rstrip("/")))
+    packed = packing.pack_remote(client, root, [(path, size) for path, size, mtime in files], pack_dir, shard_size)
+
+    staging_dir = os.path.join(destination, ".veda-pack")
+    unpacker = packing.Unpacker(packed["codec"], destination)
+    try:
+        shards = [(s["name"], s["size"], 0) for s in packed["shards"]]
+        progress = sftp.download(client, pack_dir, shards, staging_dir, streams, on_file=unpacker.submit)
+    finally:
+        unpacker.wait()
+        packing.remove_remote(client, pack_dir)
+    os.rmdir(staging_dir)
+    print("[bold blue]Downloaded " + str(len(files)) + " files as " + progress.summary() + "[/bold blue]")
@@ -0,0 +1,160 @@
+import time
+import typer
+import paramiko
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from rich import print
+from veda_cli import store
+from veda_cli import ssh
+from veda_cli import output
+from veda_cli import runtimes
+from veda_cli.executions import instances
+from veda_cli.applications.ecco import ecco_app
+from veda_cli.applications.ecco import spot
+
+DEFAULT_IDLE_MINUTES = 30
+DEFAULT_PARALLELISM = 16
+
+# Executions in these states are either torn down already or being relaunched by their spot supervisor
+SKIPPED_STATES = ["TERMINATED", "INTERRUPTED"]
+
+RECONCILE_COLUMNS = [("executionId", "Execution Id"), ("instanceId", "Instance Id"),
+                     ("instanceState", "Instance"), ("model", "Model"), ("action", "Action")]
+
+
+def get_db():
+    return store.get_execution_db()
+
+
+def probe(execution):
+    """
+    Returns RUNNING while MPI ranks of the model are alive, COMPLETED or STOPPED once they are gone and
+    UNREACHABLE if the instance did not answer over SSH
+    """
+    try:
+        # Reconcile probes every instance once, a control socket daemon per instance would outlive it
+        return spot.model_status(execution, persist=False) or "UNREACHABLE"
+    except (OSError, EOFError, paramiko.SSHException):
+        return "UNREACHABLE"
+
+
+def decide(execution, instance_state, model, now, idle_seconds):
+    """
+    Returns what to do with an execution: keep it, wait until it has been idle long enough, tear it down or
+    only forget it because its instance is already gone
+    """
+    if instance_state in instances.GONE_STATES:
+        # A running spot execution gets a new instance from its supervisor
+        return "keep" if execution.get("spot") and execution.get("state") == "RUNNING" else "forget"
+    if instance_state != "running" or model not in ("COMPLETED", "STOPPED"):
+        return "keep"
+    idle_since = execution.get("idleSince") or now
+    return "teardown" if now - idle_since >= idle_seconds else "wait"
+
+
+def publish_outputs(execution, target_storage):
+    """
+    Registers the output directory of the execution as a dataset and copies it to the target storage
+    before the instance goes away
+    """
+    from veda_cli import datasets
+
+    dataset_name = execution["executionId"] + "-output"
+    db_conn = datasets.get_db()
+    if len(db_conn.getBy({"type": "Dataset", "name": dataset_name, "storageId": target_storage})) > 0:
+        return dataset_name
+    if len(db_conn.getBy({"type": "Dataset", "name": dataset_name})) == 0:
+        datasets.register_dataset(execution["executionId"], dataset_name, "", incremental=False, pack=False,
+                                  shard_size_mb=1024)
+    datasets.publish_dataset(dataset_name, target_storage, confirm=False)
+    return dataset_name
+
+
+def forget(db_conn, execution, model=None):
+    """
+    Deregisters the MFT storage of an execution whose instance is gone and marks its record terminated
+    """
+    ssh.stop_daemon(execution["executionId"])
+    try:
+        if execution.get("storageId"):
+            ecco_app.deregister_execution_endpoint(execution["storageId"])
+    except Exception as e:
+        print(f"Could not deregister storage {execution['storageId']} of {execution['executionId']}: {e}")
+    fields = {"state": "TERMINATED", "terminatedTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S")}
+    if model in ("COMPLETED", "STOPPED"):
+        fields["modelStatus"] = model
+    db_conn.updateById(execution["id"], fields)
+
+
+def reconcile(idle_minutes=DEFAULT_IDLE_MINUTES, publish_storage=None, dry_run=False,
+              parallelism=DEFAULT_PARALLELISM):
+    """
+    Checks every execution with an instance and terminates the instances whose model has not been running for
+    idle_minutes, after copying their outputs to publish_storage if one is given. Returns one report row
+    per execution
+    """
+    db_conn = get_db()
+    executions = [e for e in db_conn.getBy({"type": "Execution"})
+                  if e.get("runtime") in runtimes.RUNTIMES and e.get("instanceId") and e.get("state") not in SKIPPED_STATES]
+
+    states = runtimes.get_states(executions)
+
+    running = [e for e in executions if states[e["instanceId"]] == "running"]
+    models = {}
+    if running:
+        with ThreadPoolExecutor(max_workers=min(parallelism, len(running))) as pool:
+            models = dict(zip([e["executionId"] for e in running], pool.map(probe, running)))
+
+    now = time.time()
+    report = []
+    teardown = []
+    for execution in executions:
+        model = models.get(execution["executionId"], "-")
+        action = decide(execution, states[execution["instanceId"]], model, now, idle_minutes * 60)
+        report.append({"executionId": execution["executionId"], "instanceId": execution["instanceId"],
+                       "instanceState": states[execution["instanceId"]], "model": model, "action": action})
+        if dry_run:
+            continue
+
+        if action == "keep" and execution.get("idleSince"):
+            db_conn.updateById(execution["id"], {"idleSince": None})
+        elif action == "wait" and not execution.get("idleSince"):
+            db_conn.updateById(execution["id"], {"idleSince": now})
+        elif action == "forget":
+            forget(db_conn, execution)
+        elif action == "teardown":
+            teardown.append((execution, report[-1]))
+
+    if publish_storage:
+        for execution, row in teardown:
+            try:
+                row["dataset"] = publish_outputs(execution, publish_storage)
+            except Exception as e:
+                print(f"Keeping {execution['instanceId']}, publishing the outputs of {execution['executionId']} "
+                      f"failed: {e}")
+                row["action"] = "publish failed"
+        teardown = [(execution, row) for execution, row in teardown if row["action"] == "teardown"]
+
+    runtimes.terminate([execution for execution, row in teardown])
+    for execution, row in teardown:
+        forget(db_conn, execution, models[execution["executionId"]])
+        print("Terminated instance :", execution["instanceId"])
+
+    return report
+
+
+def reconcile_command(dry_run: bool = typer.Option(False, "--dry-run", help="Only report what would be done"),
+                      idle_minutes: int = typer.Option(DEFAULT_IDLE_MINUTES,
+                                                       help="Minutes an instance has to be idle before it is terminated"),
+                      publish: Optional[str] = typer.Option(None, help="Copy the outputs to this storage before terminating"),
+                      interval: int = typer.Option(0, help="Keep reconciling every this many seconds. 0 runs once"),
+                      format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    """
+    Terminates the instances of executions whose model has finished and deregisters their MFT storage
+    """
+    while True:
+        output.emit(reconcile(idle_minutes, publish, dry_run), format, fields, RECONCILE_COLUMNS)
+        if interval <= 0:
+            break
+        time.sleep(interval)
@@ -0,0 +1,171 @@
+import os
+import shlex
+import stat
+import time
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from veda_cli import ssh
+from veda_cli import trace
+
+# Few large files go through the MFT agent, everything else is fetched directly over SFTP. The agent pays a
+# fixed cost per file that dominates for the many small diagnostic files a run writes.
+MFT_MAX_FILES = 16
+MFT_MIN_AVERAGE_SIZE = 512 * 1024 * 1024
+
+PART_SUFFIX = ".part"
+
+
+def has_direct_access(execution):
+    return bool(execution.get("keyPath")) and os.path.exists(execution["keyPath"]) and bool(execution.get("publicIp"))
+
+
+def choose_engine(execution, files):
+    """
+    Picks "direct" or "mft" for a download of the given (relative path, size, mtime) entries
+    """
+    if not has_direct_access(execution):
+        return "mft"
+    if not execution.get("storageId"):
+        return "direct"
+    total_size = sum(f[1] for f in files)
+    if 0 < len(files) <= MFT_MAX_FILES and total_size / len(files) >= MFT_MIN_AVERAGE_SIZE:
+        return "mft"
+    return "direct"
+
+
+def list_dir(client, path):
+    """
+    Lists one remote directory as (name, is directory, size, mtime) entries. A file path lists just that file
+    """
+    sftp = client.open_sftp()
+    try:
+        attr = sftp.stat(path)
+        if not stat.S_ISDIR(attr.st_mode):
+            return [(posixpath.basename(path), False, attr.st_size, attr.st_mtime)]
+        return sorted((a.filename, stat.S_ISDIR(a.st_mode), a.st_size, a.st_mtime) for a in sftp.listdir_attr(path))
+    finally:
+        sftp.close()
+
+
+def walk(client, root):
+    """
+    Lists every file under root as (relative path, size, mtime) with a single remote find instead of one
+    SFTP round trip per directory. A file root is listed with an empty relative path.
+    """
+    command = ("if [ -d {0} ]; then cd {0} && find . -type f -printf '%s %T@ %P\\n'; "
+               "else find {0} -maxdepth 0 -type f -printf '%s %T@ \\n'; fi").format(shlex.quote(root))
+    exit_status, stdout, stderr = ssh.run_on(client, command)
+    if exit_status != 0:
+        raise RuntimeError("Failed to list " + root + ": " + stderr.strip())
+
+    files = []
+    for line in stdout.splitlines():
+        size, mtime, path = line.split(" ", 2)
+        files.append((path, int(size), int(float(mtime))))
+    return files
+
+
+class DownloadProgress:
+
+    def __init__(self, files):
+        self.total_files = len(files)
+        self.total_bytes = sum(f[1] for f in files)
+        self.files = 0
+        self.bytes = 0
+        self.transferred = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, size, transferred):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            self.transferred += transferred
+            if transferred == 0 and size > 0:
+                self.skipped += 1
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (f"{self.files}/{self.total_files} files, {self.bytes / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB"
+                f" in {elapsed:.1f}s ({self.transferred / 1e6 / elapsed:.1f} MB/s, {self.skipped} already present)")
+
+
+def fetch_file(sftp, remote_path, local_path, size, mtime):
+    """
+    Downloads one file through a .part file with pipelined reads. An interrupted download resumes from the
+    end of its .part file. Returns the number of bytes transferred.
+    """
+    if os.path.exists(local_path) and os.path.getsize(local_path) == size:
+        return 0
+
+    part_path = local_path + PART_SUFFIX
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > size:
+        offset = 0
+
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    with sftp.open(remote_path, "rb") as remote, open(part_path, "ab" if offset else "wb") as local:
+        remote.seek(offset)
+        remote.prefetch(size)
+        remaining = size - offset
+        while remaining > 0:
+            data = remote.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            local.write(data)
+            remaining -= len(data)
+
+    if os.path.getsize(part_path) != size:
+        raise IOError("Incomplete download of " + remote_path)
+    os.replace(part_path, local_path)
+    os.utime(local_path, (mtime, mtime))
+    return size - offset
+
+
+def download(client, root, files, destination, streams=8, on_progress=None, on_file=None):
+    """
+    Fetches (relative path, size, mtime) entries under the remote root into destination with streams
+    parallel SFTP sessions on the one connection. Files already present with the same size are skipped.
+    on_file is called with the local path of every file as soon as it is complete.
+    """
+    progress = DownloadProgress(files)
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def get_sftp():
+        if not hasattr(local, "sftp"):
+            local.sftp = client.open_sftp()
+            with sessions_lock:
+                sessions.append(local.sftp)
+        return local.sftp
+
+    def fetch(entry):
+        path, size, mtime = entry
+        remote_path = posixpath.join(root, path) if path else root
+        if path:
+            local_path = os.path.join(destination, *path.split("/"))
+        elif os.path.isdir(destination):
+            local_path = os.path.join(destination, posixpath.basename(root))
+        else:
+            local_path = destination
+        transferred = fetch_file(get_sftp(), remote_path, local_path, size, mtime)
+        progress.add(size, transferred)
+        if on_file is not None:
+            on_file(local_path)
+        if on_progress is not None:
+            on_progress(progress)
+
+    # Largest files first so a big file does not start last and hold up the end of the download
+    ordered = sorted(files, key=lambda f: -f[1])
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(streams, len(ordered)))) as pool:
+            for _ in pool.map(fetch, ordered):
+                pass
+    finally:
+        for sftp in sessions:
+            sftp.close()
+        trace.count("sftp bytes", progress.bytes)
+    return progress
@@ -0,0 +1,371 @@
+import os
+import sys
+import time
+import uuid
+import fcntl
+import signal
+import argparse
+import importlib
+import traceback
+import subprocess
+from datetime import datetime
+from typing import Optional
+import typer
+from rich import print
+from rich.markup import escape
+from veda_cli import store
+from veda_cli import output
+
+# Functions a job can run. They are only imported in the process that runs the job and are called with the
+# job arguments plus concurrency, the number of MFT transfers the worker granted the job
+JOB_KINDS = {
+    "dataset-copy": "veda_cli.datasets:publish_dataset",
+    "dataset-get": "veda_cli.datasets:get_dataset",
+    "execution-supervise": "veda_cli.applications.ecco.spot:supervise",
+}
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+FINAL_STATES = [SUCCEEDED, FAILED, CANCELLED]
+
+# The worker keeps at most this many MFT transfers in flight across all running jobs, so queuing many jobs
+# keeps the agents busy without overloading them
+DEFAULT_MAX_TRANSFERS = 16
+DEFAULT_JOB_TRANSFERS = 4
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 30
+WORKER_IDLE_SECONDS = 300
+POLL_INTERVAL = 1.0
+
+JOB_COLUMNS = [("jobId", "Job Id"), ("kind", "Kind"), ("label", "Description"), ("state", "State"),
+               ("attempts", "Attempts"), ("createdTime", "Created Time")]
+
+app = typer.Typer()
+
+
+def get_db():
+    return store.open_store("jobs")
+
+
+def get_jobs_dir():
+    return os.path.join(store.VEDA_HOME, "jobs")
+
+
+def log_path(job_id):
+    return os.path.join(get_jobs_dir(), job_id + ".log")
+
+
+def cancel_path(job_id):
+    return os.path.join(get_jobs_dir(), job_id + ".cancel")
+
+
+def get_max_transfers():
+    return int(os.environ.get("VEDA_MAX_TRANSFERS", DEFAULT_MAX_TRANSFERS))
+
+
+def submit(kind, args, label=None, transfers=DEFAULT_JOB_TRANSFERS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Queues a job and makes sure the worker is running. Returns the job id
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError("Unknown job kind " + kind)
+    job_id = uuid.uuid4().hex[:12]
+    get_db().add({
+        "type": "Job",
+        "jobId": job_id,
+        "kind": kind,
+        "args": args,
+        "label": label or kind,
+        "transfers": transfers,
+        "state": QUEUED,
+        "attempts": 0,
+        "maxAttempts": max_attempts,
+        "notBefore": 0,
+        "submittedAt": time.time(),
+        "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S")})
+    ensure_worker()
+    return job_id
+
+
+def find_job(job_id):
+    jobs = [job for job in get_db().iterBy({"type": "Job"}) if job["jobId"].startswith(job_id)]
+    if len(jobs) != 1:
+        print(("No job" if not jobs else "More than one job") + " with id " + job_id)
+        raise typer.Exit(1)
+    return jobs[0]
+
+
+def open_lock():
+    os.makedirs(get_jobs_dir(), exist_ok=True)
+    lock = open(os.path.join(get_jobs_dir(), "worker.lock"), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def ensure_worker():
+    """
+    Starts the background worker unless one is already running
+    """
+    lock = open_lock()
+    if lock is None:
+        return
+    lock.close()
+    log = open(os.path.join(get_jobs_dir(), "worker.log"), "ab")
+    subprocess.Popen([sys.executable, "-u", "-m", "veda_cli.jobs", "--worker"],
+                     stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    log.close()
+
+
+def job_alive(job):
+    """
+    True while the process recorded for a running job still exists. Where /proc is available the command line
+    is checked too, so a recycled pid is not mistaken for the job
+    """
+    pid = job.get("pid")
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            # An exited job nobody reaped yet is a zombie
+            if f.read().rsplit(b")", 1)[-1].split()[0] == b"Z":
+                return False
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except OSError:
+        return True
+    # The command line reads empty for a moment while a process starts
+    return not cmdline or job["jobId"].encode("utf-8") in cmdline
+
+
+class AdoptedProcess:
+    """
+    Job process left running by a worker that died. It is not a child of this worker, so it is polled by pid
+    and its exit code is taken from the last line of its log
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not job_alive(self.job):
+            self.returncode = 0 if last_line(self.job["jobId"]) == "Job completed" else 1
+        return self.returncode
+
+    def terminate(self):
+        try:
+            os.kill(self.job["pid"], signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class Worker:
+    """
+    Runs queued jobs in child processes, oldest first, as long as their transfers fit in max_transfers.
+    Failed jobs are retried with a growing delay. Exits after being idle for idle_seconds.
+    """
+
+    def __init__(self, max_transfers, idle_seconds=WORKER_IDLE_SECONDS):
+        self.db = get_db()
+        self.max_transfers = max_transfers
+        self.idle_seconds = idle_seconds
+        self.running = {}
+        os.makedirs(get_jobs_dir(), exist_ok=True)
+
+    def update(self, job, **fields):
+        job.update(fields)
+        self.db.updateById(job["id"], fields)
+
+    def granted(self, job):
+        # Jobs that do not transfer anything, like supervisors, ask for 0 and never wait for a slot
+        return max(0, min(job.get("transfers", DEFAULT_JOB_TRANSFERS), self.max_transfers))
+
+    def start(self, job):
+        log = open(log_path(job["jobId"]), "ab")
+        process = subprocess.Popen([sys.executable, "-u", "-m", "veda_cli.jobs", "--run", job["jobId"],
+                                    "--transfers", str(self.granted(job))],
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        self.update(job, state=RUNNING, attempts=job["attempts"] + 1, pid=process.pid,
+                    startedTime=datetime.now().strftime("%m/%d/%Y, %H:%M:%S"))
+        self.running[job["jobId"]] = (process, job)
+        print(f"Started job {job['jobId']} ({job['label']}), attempt {job['attempts']}")
+
+    def finish(self, job, exit_code):
+        finished = datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
+        if os.path.exists(cancel_path(job["jobId"])):
+            os.remove(cancel_path(job["jobId"]))
+            self.update(job, state=CANCELLED, finishedTime=finished)
+        elif exit_code == 0:
+            self.update(job, state=SUCCEEDED, finishedTime=finished)
+        elif job["attempts"] < job["maxAttempts"]:
+            self.update(job, state=QUEUED, notBefore=time.time() + RETRY_DELAY_SECONDS * job["attempts"])
+        else:
+            self.update(job, state=FAILED, finishedTime=finished, error=last_line(job["jobId"]))
+        print(f"Job {job['jobId']} exited with {exit_code}, now {job['state']}")
+
+    def step(self):
+        for job_id, (process, job) in list(self.running.items()):
+            if os.path.exists(cancel_path(job_id)) and process.poll() is None:
+                process.terminate()
+            exit_code = process.poll()
+            if exit_code is not None:
+                del self.running[job_id]
+                self.finish(job, exit_code)
+
+        queued = sorted((job for job in self.db.iterBy({"type": "Job"}) if job["state"] == QUEUED),
+                        key=lambda job: job["submittedAt"])
+        for job in queued:
+            if os.path.exists(cancel_path(job["jobId"])):
+                os.remove(cancel_path(job["jobId"]))
+                self.update(job, state=CANCELLED, finishedTime=datetime.now().strftime("%m/%d/%Y, %H:%M:%S"))
+
+        in_use = sum(self.granted(job) for process, job in self.running.values())
+        for job in queued:
+            if job["state"] != QUEUED or job["notBefore"] > time.time():
+                continue
+            # Jobs start in order, so a large job is not starved by smaller ones queued after it
+            if self.running and in_use + self.granted(job) > self.max_transfers:
+                break
+            self.start(job)
+            in_use += self.granted(job)
+
+        return bool(self.running) or any(job["state"] == QUEUED for job in queued)
+
+    def run(self):
+        # No other worker holds the lock, so jobs still marked running were left behind by one that died. Their
+        # processes may have outlived it, those are watched until they exit and only dead ones are queued again
+        for job in self.db.getBy({"type": "Job"}):
+            if job["state"] != RUNNING:
+                continue
+            if job_alive(job):
+                self.running[job["jobId"]] = (AdoptedProcess(job), job)
+                print(f"Adopted job {job['jobId']} ({job['label']}), pid {job['pid']}")
+            else:
+                self.update(job, state=QUEUED)
+
+        idle_since = time.monotonic()
+        while True:
+            if self.step():
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > self.idle_seconds:
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def run_worker(max_transfers, idle_seconds=WORKER_IDLE_SECONDS):
+    lock = open_lock()
+    if lock is None:
+        return
+    try:
+        Worker(max_transfers, idle_seconds).run()
+    finally:
+        lock.close()
+
+
+def run_job(job_id, transfers):
+    """
+    Runs one job in the current process. Returns the exit code
+    """
+    job = find_job(job_id)
+
+    def terminate(signum, frame):
+        # Unwinds through the transfer code so in flight MFT transfers are removed before exiting
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, terminate)
+
+    module_name, attribute = JOB_KINDS[job["kind"]].split(":")
+    print(f"Running job {job_id} ({job['label']}) with {transfers} transfers")
+    try:
+        getattr(importlib.import_module(module_name), attribute)(**job["args"], concurrency=transfers)
+    except KeyboardInterrupt:
+        print("Job interrupted")
+        return 1
+    except Exception as e:
+        # typer.Exit and typer.Abort are exceptions too
+        if isinstance(e, typer.Exit) and e.exit_code == 0:
+            return 0
+        traceback.print_exc()
+        print("Job failed: " + (str(e) or type(e).__name__))
+        return 1
+    print("Job completed")
+    return 0
+
+
+def last_line(job_id):
+    lines = tail(job_id, 1)
+    return lines[0] if lines else ""
+
+
+def tail(job_id, count):
+    if not os.path.exists(log_path(job_id)):
+        return []
+    with open(log_path(job_id), "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 64 * 1024))
+        lines = f.read().decode("utf-8", "replace").replace("\r", "\n").splitlines()
+    return [line for line in lines if line.strip()][-count:]
+
+
+@app.command("list")
+def list_jobs(state: Optional[str] = typer.Option(None, help="Only jobs in this state"),
+              format: str = output.format_option(), fields: Optional[str] = output.fields_option()):
+    jobs = get_db().iterBy({"type": "Job"})
+    if state:
+        jobs = (job for job in jobs if job["state"] == state.upper())
+    output.emit(jobs, format, fields, JOB_COLUMNS)
+
+
+@app.command("status")
+def job_status(job_id: str, lines: int = typer.Option(10, help="Lines of the job log to show")):
+    job = find_job(job_id)
+    print(f"[bold]{job['jobId']}[/bold] {job['label']}: {job['state']}, attempt {job['attempts']}/{job['maxAttempts']}")
+    if job.get("error"):
+        print("Error: " + job["error"])
+    for line in tail(job["jobId"], lines):
+        print("  " + escape(line))
+
+
+@app.command("cancel")
+def cancel_job(job_id: str):
+    job = find_job(job_id)
+    if job["state"] in FINAL_STATES:
+        print(f"Job {job['jobId']} already {job['state']}")
+        return
+    os.makedirs(get_jobs_dir(), exist_ok=True)
+    open(cancel_path(job["jobId"]), "w").close()
+    ensure_worker()
+    print(f"Cancelling job {job['jobId']}")
+
+
+@app.command("worker")
+def worker(max_transfers: int = typer.Option(None, help="MFT transfers in flight across all jobs"),
+           idle: int = typer.Option(WORKER_IDLE_SECONDS, help="Exit after this many idle seconds")):
+    """
+    Runs the job worker in the foreground
+    """
+    run_worker(max_transfers or get_max_transfers(), idle)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background worker of the veda job queue")
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--run")
+    parser.add_argument("--transfers", type=int, default=DEFAULT_JOB_TRANSFERS)
+    args = parser.parse_args()
+    if args.run:
+        sys.exit(run_job(args.run, args.transfers))
+    run_worker(get_max_transfers())
@@ -0,0 +1,53 @@
+import importlib
+import click
+import typer
+from typer.core import TyperGroup
+
+
+class LazyGroup(TyperGroup):
+    """
+    Typer group whose sub apps and commands are imported on first use. lazy_commands maps a command name to
+    ("module:attribute", help), where the attribute is a typer app or a command function. Help output lists
+    them from that table without importing anything.
+    """
+
+    lazy_commands = {}
+    listing = False
+
+    def list_commands(self, ctx):
+        return sorted(set(self.lazy_commands) | set(super().list_commands(ctx)))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands and name not in self.commands:
+            target, help = self.lazy_commands[name]
+            if self.listing:
+                return click.Command(name, help=help)
+            self.commands[name] = load_command(name, target)
+        return super().get_command(ctx, name)
+
+    def format_help(self, ctx, formatter):
+        self.listing = True
+        try:
+            return super().format_help(ctx, formatter)
+        finally:
+            self.listing = False
+
+
+def load_command(name, target):
+    module_name, attribute = target.split(":")
+    obj = getattr(importlib.import_module(module_name), attribute)
+    if not isinstance(obj, typer.Typer):
+        single = typer.Typer(add_completion=False)
+        single.command(name)(obj)
+        obj = single
+    command = typer.main.get_command(obj)
+    command.name = name
+    return command
+
+
+def Typer(lazy_commands, **kwargs):
+    """
+    Creates a typer app that loads the given commands lazily
+    """
+    group = type("LazyGroup", (LazyGroup,), {"lazy_commands": lazy_commands})
+    return typer.Typer(cls=group, **kwargs)
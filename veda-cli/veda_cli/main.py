@@ -17,16 +17,29 @@
 # under the License.
 #
 import typer
-import veda_cli.applications
-import veda_cli.datasets
-import veda_cli.executions
-import airavata_mft_cli.storage
+from veda_cli import lazy
+from veda_cli import trace
+
+# Sub apps are only imported when one of their commands runs. Between them they pull in boto3, paramiko,
+# grpc and the MFT stubs, which used to be most of the wall time of every veda call, --help included.
+app = lazy.Typer({
+    "application": ("veda_cli.applications:app", "Run applications on cloud runtimes"),
+    "dataset": ("veda_cli.datasets:app", "Register, list and download datasets"),
+    "execution": ("veda_cli.executions:app", "Track, monitor and download executions"),
+    "job": ("veda_cli.jobs:app", "List, follow and cancel background jobs"),
+    "storage": ("airavata_mft_cli.storage:app", "Manage MFT storages"),
+})
+
+
+@app.callback()
+def main(profile: bool = typer.Option(False, "--profile",
+                                      help="Print per phase timings, RPC counts and bytes moved when the command exits")):
+    """
+    Command line client for the VEDA research playground
+    """
+    if profile:
+        trace.enable()
 
-app = typer.Typer()
-app.add_typer(veda_cli.applications.app, name="application")
-app.add_typer(veda_cli.datasets.app, name="dataset")
-app.add_typer(veda_cli.executions.app, name="execution")
-app.add_typer(airavata_mft_cli.storage.app, name="storage")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
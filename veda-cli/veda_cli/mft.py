@@ -0,0 +1,174 @@
+import threading
+import grpc
+import typer
+from airavata_mft_cli import config as configcli
+from airavata_mft_sdk import MFTTransferApi_pb2
+from airavata_mft_sdk import MFTTransferApi_pb2_grpc as transfer_grpc
+from airavata_mft_sdk.common import StorageCommon_pb2
+from airavata_mft_sdk.common import StorageCommon_pb2_grpc
+from airavata_mft_sdk.local import LocalStorageService_pb2_grpc
+from airavata_mft_sdk.s3 import S3StorageService_pb2_grpc
+from airavata_mft_sdk.s3 import S3SecretService_pb2_grpc
+from airavata_mft_sdk.scp import SCPStorageService_pb2_grpc
+from airavata_mft_sdk.scp import SCPSecretService_pb2_grpc
+from veda_cli import trace
+
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+_lock = threading.Lock()
+_channels = {}
+_channel_states = {}
+_client = None
+
+
+def _track_state(key):
+    def on_change(state):
+        _channel_states[key] = state
+    return on_change
+
+
+def _is_broken(key):
+    return _channel_states.get(key) in (grpc.ChannelConnectivity.SHUTDOWN,
+                                        grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+
+
+def _get_channel(host, port, secured=False):
+    """
+    Returns the shared channel for host:port. Channels connect lazily on the first RPC and are rebuilt
+    if they were shut down or are stuck in transient failure.
+    """
+    key = (host, int(port), secured)
+    channel = _channels.get(key)
+    if channel is not None and not _is_broken(key):
+        return key, channel
+
+    if channel is not None:
+        channel.close()
+
+    target = '{}:{}'.format(host, port)
+    if secured:
+        channel = grpc.secure_channel(target, grpc.ssl_channel_credentials(), options=KEEPALIVE_OPTIONS)
+    else:
+        channel = grpc.insecure_channel(target, options=KEEPALIVE_OPTIONS)
+    channel = trace.intercept(channel)
+    _channels[key] = channel
+    _channel_states[key] = None
+    channel.subscribe(_track_state(key))
+    return key, channel
+
+
+class PooledMFTClient:
+    """
+    Drop in for mft_client.MFTClient that builds its stubs on the process wide channel pool. The transfer,
+    resource and secret services share a single channel when they run on the same host and port.
+    """
+
+    def __init__(self):
+        transfer_key, self.transfer_api_channel = _get_channel(getattr(configcli, "transfer_api_host", "localhost"),
+                                                               configcli.transfer_api_port,
+                                                               configcli.transfer_api_secured)
+        resource_key, self.resource_channel = _get_channel(configcli.resource_service_host,
+                                                           configcli.resource_service_port,
+                                                           configcli.resource_service_secured)
+        secret_key, self.secret_channel = _get_channel(configcli.secret_service_host,
+                                                       configcli.secret_service_port,
+                                                       getattr(configcli, "secret_service_secured", False))
+        self.channel_keys = {transfer_key, resource_key, secret_key}
+
+        self.transfer_api = transfer_grpc.MFTTransferServiceStub(self.transfer_api_channel)
+
+        self.local_storage_api = LocalStorageService_pb2_grpc.LocalStorageServiceStub(self.resource_channel)
+        self.s3_storage_api = S3StorageService_pb2_grpc.S3StorageServiceStub(self.resource_channel)
+        self.scp_storage_api = SCPStorageService_pb2_grpc.SCPStorageServiceStub(self.resource_channel)
+        self.common_api = StorageCommon_pb2_grpc.StorageCommonServiceStub(self.resource_channel)
+
+        self.s3_secret_api = S3SecretService_pb2_grpc.S3SecretServiceStub(self.secret_channel)
+        self.scp_secret_api = SCPSecretService_pb2_grpc.SCPSecretServiceStub(self.secret_channel)
+
+    def channels(self):
+        return {self.transfer_api_channel, self.resource_channel, self.secret_channel}
+
+    def is_stale(self):
+        return any(key not in _channels or _is_broken(key) for key in self.channel_keys)
+
+
+def get_client():
+    """
+    Returns the process wide MFT client, reconnecting if one of its channels has failed.
+    """
+    global _client
+    with _lock:
+        if _client is None or _client.is_stale():
+            _client = PooledMFTClient()
+        return _client
+
+
+def check_health(timeout=5):
+    """
+    Blocks until every pooled channel is connected. Returns False if any of them could not connect in time.
+    """
+    client = get_client()
+    for channel in client.channels():
+        try:
+            grpc.channel_ready_future(channel).result(timeout=timeout)
+        except grpc.FutureTimeoutError:
+            return False
+    return True
+
+
+def close():
+    global _client
+    with _lock:
+        for channel in _channels.values():
+            channel.close()
+        _channels.clear()
+        _channel_states.clear()
+        _client = None
+
+
+def fetch_storage_and_secret_ids(storage_name):
+    client = get_client()
+    search_req = StorageCommon_pb2.StorageSearchRequest(storageName=storage_name)
+    storages = client.common_api.searchStorages(search_req)
+
+    if len(storages.storageList) == 0:
+        search_req = StorageCommon_pb2.StorageSearchRequest(storageId=storage_name)
+        storages = client.common_api.searchStorages(search_req)
+
+    if len(storages.storageList) == 0:
+        print("No storage with name or id " + storage_name + " was found. Please register the storage with command veda storage add")
+        raise typer.Abort()
+
+    if len(storages.storageList) > 1:
+        print("More than one storage with name " + storage_name + " was found. Please use the storage id. You can fetch it from veda storage list")
+        raise typer.Abort()
+
+    storage = storages.storageList[0]
+    if storage.storageType == StorageCommon_pb2.StorageType.LOCAL:
+        return storage.storageId, ''
+
+    sec_req = StorageCommon_pb2.SecretForStorageGetRequest(storageId=storage.storageId)
+    sec_resp = client.common_api.getSecretForStorage(sec_req)
+    if sec_resp.error != 0:
+        print("Could not fetch the secret for storage " + storage.storageId)
+
+    return sec_resp.storageId, sec_resp.secretId
+
+
+def get_resource_metadata(storage_path, recursive_search=False):
+    storage_name = storage_path.split("/")[0]
+    resource_path = storage_path[len(storage_name) + 1:]
+
+    storage_id, secret_id = fetch_storage_and_secret_ids(storage_name)
+
+    id_req = MFTTransferApi_pb2.GetResourceMetadataFromIDsRequest(storageId=storage_id,
+                                                                  secretId=secret_id,
+                                                                  resourcePath=resource_path,
+                                                                  recursiveSearch=recursive_search)
+    resource_medata_req = MFTTransferApi_pb2.FetchResourceMetadataRequest(idRequest=id_req)
+    return get_client().transfer_api.resourceMetadata(resource_medata_req)
@@ -0,0 +1,101 @@
+import os
+import sys
+import csv
+import json
+import typer
+from rich import print
+from rich.table import Table
+from rich.console import Console
+
+FORMATS = ["table", "json", "ndjson", "csv"]
+
+ALL_FIELDS = "*"
+
+
+def format_option():
+    return typer.Option("table", "--format", help="table, json, ndjson or csv")
+
+
+def fields_option():
+    return typer.Option(None, "--fields", help="Comma separated record fields to output, * for all of them")
+
+
+def parse_fields(fields, default):
+    if not fields:
+        return default
+    if fields.strip() == ALL_FIELDS:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+def project(record, fields):
+    if fields is None:
+        return record
+    return {f: record.get(f) for f in fields}
+
+
+def to_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def emit(records, format="table", fields=None, columns=None):
+    """
+    Writes records to stdout as they are produced. columns are the (field, header) pairs of the table format
+    and the default projection of the others. json, ndjson and csv never hold more than one record, so
+    commands can stream registries of any size into other tools. A table without columns prints each record.
+    """
+    if format not in FORMATS:
+        raise typer.BadParameter("Unknown format " + format + ", expected one of " + ", ".join(FORMATS))
+
+    default = [field for field, header in columns] if columns else None
+    fields = parse_fields(fields, default)
+    try:
+        if format == "table":
+            write_table(records, fields, columns)
+        elif format == "ndjson":
+            for record in records:
+                sys.stdout.write(json.dumps(project(record, fields), default=str) + "\n")
+        elif format == "json":
+            sys.stdout.write("[")
+            for i, record in enumerate(records):
+                sys.stdout.write(("," if i else "") + "\n" + json.dumps(project(record, fields), default=str))
+            sys.stdout.write("\n]\n")
+        else:
+            write_csv(records, fields)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away, e.g. piped into head. Point stdout at devnull so the interpreter does not
+        # fail again when it flushes on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        raise typer.Exit(1)
+
+
+def write_table(records, fields, columns):
+    if columns is None and fields is None:
+        for record in records:
+            print(record)
+        return
+
+    headers = dict(columns or [])
+    table = Table()
+    for field in fields:
+        table.add_column(headers.get(field, field), justify='left')
+    for record in records:
+        table.add_row(*[to_cell(record.get(f)) for f in fields])
+    Console().print(table)
+
+
+def write_csv(records, fields):
+    writer = None
+    for record in records:
+        if writer is None:
+            # Without a projection the columns are the fields of the first record
+            writer = csv.DictWriter(sys.stdout, fieldnames=fields or list(record), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow({f: to_cell(v) for f, v in project(record, fields).items()})
+    if writer is None and fields:
+        csv.DictWriter(sys.stdout, fieldnames=fields).writeheader()
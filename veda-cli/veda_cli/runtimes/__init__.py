@@ -0,0 +1,126 @@
+import importlib
+from abc import ABC, abstractmethod
+
+# Runtime backends by name as "module:class". Backends are only imported when they are used, and new ones
+# plug in with register()
+RUNTIMES = {
+    "EC2": "veda_cli.runtimes.ec2:EC2Runtime",
+    "Jetstream2": "veda_cli.runtimes.jetstream2:Jetstream2Runtime",
+}
+
+_runtimes = {}
+
+
+class Runtime(ABC):
+    """
+    A cloud or allocation ECCO runs on. Subclasses list the instance types they offer with their price and the
+    relative speed of one MPI rank on them, and launch runs on one of those instance types.
+    """
+
+    name = None
+    label = None
+
+    @abstractmethod
+    def instance_types(self):
+        """
+        Instance types as name -> (vCPUs, physical cores)
+        """
+
+    @abstractmethod
+    def price_per_hour(self, instance_type):
+        pass
+
+    def speed(self, instance_type):
+        """
+        Speed of one MPI rank on a physical core of the instance type relative to a c5 core
+        """
+        return 1.0
+
+    def offers(self, ranks):
+        """
+        Returns an offer for every instance type with enough vCPUs for ranks MPI ranks
+        """
+        offers = []
+        for instance_type, (vcpus, cores) in self.instance_types().items():
+            if vcpus < ranks:
+                continue
+            offers.append({"runtime": self.name, "instanceType": instance_type, "vcpus": vcpus, "cores": cores,
+                           "hyperthreads": ranks > cores, "speed": self.speed(instance_type),
+                           "pricePerHour": self.price_per_hour(instance_type)})
+        return offers
+
+    def build(self, ecco_configs, ranks=None, instance_type=None, test_steps=None):
+        # Imported here, the applications package imports the placement engine which imports this module
+        from veda_cli.applications.ecco import run_config
+        return run_config.build(ecco_configs, ranks, instance_type, test_steps, self.instance_types())
+
+    @abstractmethod
+    def launch(self, execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None, **options):
+        """
+        Starts an ECCO run and returns its execution id
+        """
+
+    @abstractmethod
+    def get_states(self, executions):
+        """
+        State of the instance of every execution keyed by instance id, in EC2 terms (pending, running, stopped,
+        terminated, ...). Instances the runtime no longer knows about are terminated
+        """
+
+    @abstractmethod
+    def terminate(self, executions):
+        """
+        Shuts down the instances of the executions
+        """
+
+
+def register(name, target):
+    """
+    Adds a runtime backend given as "module:class" or as a Runtime subclass
+    """
+    RUNTIMES[name] = target
+    _runtimes.pop(name, None)
+
+
+def get_runtime(name, simulate=False):
+    if name not in RUNTIMES:
+        raise ValueError("Unknown runtime " + name + ". Expected one of " + ", ".join(RUNTIMES))
+    if name not in _runtimes:
+        target = RUNTIMES[name]
+        if isinstance(target, str):
+            module_name, attribute = target.split(":")
+            target = getattr(importlib.import_module(module_name), attribute)
+        _runtimes[name] = target()
+    runtime = _runtimes[name]
+    if simulate:
+        from veda_cli.runtimes import simulated
+        return simulated.SimulatedRuntime(runtime)
+    return runtime
+
+
+def get_runtimes(names=None, simulate=False):
+    return [get_runtime(name, simulate) for name in (names or RUNTIMES)]
+
+
+def group_by_runtime(executions):
+    """
+    Groups executions with an instance by the runtime they were launched on. Executions of runtimes that are
+    not registered, like simulated runs, are left out
+    """
+    groups = {}
+    for execution in executions:
+        if execution.get("runtime") in RUNTIMES and execution.get("instanceId"):
+            groups.setdefault(execution["runtime"], []).append(execution)
+    return groups
+
+
+def get_states(executions):
+    states = {}
+    for name, members in group_by_runtime(executions).items():
+        states.update(get_runtime(name).get_states(members))
+    return states
+
+
+def terminate(executions):
+    for name, members in group_by_runtime(executions).items():
+        get_runtime(name).terminate(members)
@@ -0,0 +1,48 @@
+from veda_cli.applications.ecco import run_config
+from veda_cli.runtimes import Runtime
+
+# On demand Linux prices in USD per hour. They are the same in us-east-1, us-east-2 and us-west-2
+PRICES = {
+    "c5.4xlarge": 0.68,
+    "c5.9xlarge": 1.53,
+    "c5.12xlarge": 2.04,
+    "c5.18xlarge": 3.06,
+    "c5.24xlarge": 4.08,
+    "c6i.16xlarge": 2.72,
+    "c6i.24xlarge": 4.08,
+    "c6i.32xlarge": 5.44,
+    "c6a.32xlarge": 4.896,
+    "c6a.48xlarge": 7.344,
+}
+
+# Per core speed of each instance family relative to c5 (Cascade Lake) on the MITgcm ECCO setup
+FAMILY_SPEED = {"c5": 1.0, "c6i": 1.15, "c6a": 1.1}
+
+
+class EC2Runtime(Runtime):
+
+    name = "EC2"
+    label = "Amazon EC2"
+
+    def instance_types(self):
+        return run_config.INSTANCE_TYPES
+
+    def price_per_hour(self, instance_type):
+        return PRICES[instance_type]
+
+    def speed(self, instance_type):
+        return FAMILY_SPEED.get(instance_type.split(".")[0], 1.0)
+
+    def launch(self, execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None, region=None,
+               spot=False, checkpoint_interval=None, **options):
+        from veda_cli.applications.ecco import ecco_app
+        return ecco_app.run_ecco_on_ec2(execution_name, ecco_configs, ranks, instance_type, test_steps,
+                                        region or ecco_app.DEFAULT_REGION, spot, checkpoint_interval)
+
+    def get_states(self, executions):
+        from veda_cli.executions import instances
+        return instances.get_states(executions)
+
+    def terminate(self, executions):
+        from veda_cli.executions import instances
+        instances.terminate(executions)
@@ -0,0 +1,87 @@
+import os
+from veda_cli.runtimes import Runtime
+
+# CPU flavors as (vCPUs, cores). Jetstream 2 does not expose hyperthreads, every vCPU is a core of an
+# AMD Milan 7713. Only the large memory r3.xl has enough cores for the 96 tiles of the ECCO build, it needs an
+# allocation on Jetstream2-LM
+FLAVORS = {
+    "m3.quad": (4, 4),
+    "m3.medium": (8, 8),
+    "m3.large": (16, 16),
+    "m3.xl": (32, 32),
+    "m3.2xl": (64, 64),
+    "r3.large": (64, 64),
+    "r3.xl": (128, 128),
+}
+
+# Service units charged per vCPU hour by flavor family. Large memory flavors are charged at twice the rate
+SU_PER_VCPU_HOUR = {"m3": 1, "r3": 2}
+
+# OpenStack server statuses in the EC2 instance states the execution commands work with
+SERVER_STATES = {
+    "BUILD": "pending",
+    "ACTIVE": "running",
+    "REBOOT": "running",
+    "HARD_REBOOT": "running",
+    "SHUTOFF": "stopped",
+    "SUSPENDED": "stopped",
+    "PAUSED": "stopped",
+    "SHELVED": "stopped",
+    "SHELVED_OFFLOADED": "stopped",
+    "SOFT_DELETED": "terminated",
+    "DELETED": "terminated",
+}
+
+MILAN_SPEED = 0.95
+
+
+def get_su_price():
+    """
+    Jetstream 2 charges allocation service units per vCPU hour. They are priced at 0 USD by default, set
+    VEDA_JETSTREAM2_SU_PRICE to weigh them against EC2 spending
+    """
+    return float(os.environ.get("VEDA_JETSTREAM2_SU_PRICE", 0.0))
+
+
+class Jetstream2Runtime(Runtime):
+
+    name = "Jetstream2"
+    label = "Jetstream 2"
+
+    def instance_types(self):
+        return FLAVORS
+
+    def price_per_hour(self, instance_type):
+        return FLAVORS[instance_type][0] * SU_PER_VCPU_HOUR[instance_type.split(".")[0]] * get_su_price()
+
+    def speed(self, instance_type):
+        return MILAN_SPEED
+
+    def launch(self, execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None, **options):
+        from veda_cli.applications.ecco import ecco_app
+        return ecco_app.run_ecco_on_jetstream2(execution_name, ecco_configs, ranks, instance_type, test_steps)
+
+    def get_states(self, executions):
+        from veda_cli.applications.ecco import ecco_app
+        states = {}
+        for cloud, members in group_by_cloud(executions).items():
+            # One listing per cloud instead of a lookup per server
+            servers = {server.id: server.status for server in ecco_app.create_openstack_connection(cloud).list_servers()}
+            for execution in members:
+                status = servers.get(execution["instanceId"], "DELETED")
+                states[execution["instanceId"]] = SERVER_STATES.get(status, status.lower())
+        return states
+
+    def terminate(self, executions):
+        from veda_cli.applications.ecco import ecco_app
+        for cloud, members in group_by_cloud(executions).items():
+            conn = ecco_app.create_openstack_connection(cloud)
+            for execution in members:
+                conn.delete_server(execution["instanceId"])
+
+
+def group_by_cloud(executions):
+    groups = {}
+    for execution in executions:
+        groups.setdefault(execution.get("cloud"), []).append(execution)
+    return groups
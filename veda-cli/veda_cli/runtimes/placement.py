@@ -0,0 +1,99 @@
+import statistics
+from veda_cli import store
+from veda_cli.runtimes import get_runtimes
+
+# Steps per second of one MPI rank on a c5 core. Only used until runs have recorded throughput metrics
+DEFAULT_RANK_STEPS_PER_SECOND = 0.025
+
+# A rank that shares a physical core with another one runs at about this fraction of its speed
+HYPERTHREAD_EFFICIENCY = 0.6
+
+# Boot, SSH and model setup time that is paid before the first time step
+STARTUP_SECONDS = 600
+
+OBJECTIVES = ["time", "cost"]
+
+PLAN_COLUMNS = [("runtime", "Runtime"), ("instanceType", "Instance Type"), ("stepsPerSecond", "Steps/s"),
+                ("basis", "Estimate From"), ("hours", "Hours"), ("cost", "Cost (USD)"), ("feasible", "Feasible")]
+
+
+def rank_factor(offer):
+    return offer["speed"] * (HYPERTHREAD_EFFICIENCY if offer["hyperthreads"] else 1.0)
+
+
+def observed_rates(db_conn=None, simulated=False):
+    """
+    Median recorded steps per second per (instance type, ranks). Metrics of simulated runs are only used
+    when planning simulated runs and the other way round
+    """
+    db_conn = db_conn or store.get_execution_db()
+    samples = {}
+    for metric in db_conn.iterBy({"type": "ExecutionMetric"}):
+        if bool(metric.get("simulated")) != simulated or not metric.get("stepsPerSecond") or not metric.get("ranks"):
+            continue
+        samples.setdefault((metric["instanceType"], metric["ranks"]), []).append(metric["stepsPerSecond"])
+    return {key: statistics.median(values) for key, values in samples.items()}
+
+
+def estimate_rate(offer, ranks, observed, catalog):
+    """
+    Returns the expected steps per second of a run with ranks MPI ranks on the offer and what the estimate is
+    based on. Uses the recorded throughput of the same instance type and rank count when there is one.
+    Otherwise every recorded run is scaled to the offer by rank count and relative core speed.
+    """
+    key = (offer["instanceType"], ranks)
+    if key in observed:
+        return observed[key], "measured"
+
+    per_rank = []
+    for (instance_type, observed_ranks), rate in observed.items():
+        if instance_type not in catalog:
+            continue
+        vcpus, cores, speed = catalog[instance_type]
+        measured = {"speed": speed, "hyperthreads": observed_ranks > cores}
+        per_rank.append(rate / (observed_ranks * rank_factor(measured)))
+    if per_rank:
+        return statistics.median(per_rank) * ranks * rank_factor(offer), "scaled"
+    return DEFAULT_RANK_STEPS_PER_SECOND * ranks * rank_factor(offer), "default"
+
+
+def plan(ranks, total_time_steps, objective="time", deadline_hours=None, budget=None, runtimes=None,
+         simulate=False):
+    """
+    Estimates time to solution and cost of the run on every instance type of every runtime that fits the
+    rank count. Returns the plans best first: feasible ones before the ones that miss the deadline or the
+    budget, then by the objective.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError("Unknown objective " + objective + ". Expected one of " + ", ".join(OBJECTIVES))
+
+    runtimes = get_runtimes(runtimes, simulate)
+    catalog = {}
+    for runtime in runtimes:
+        for instance_type, (vcpus, cores) in runtime.instance_types().items():
+            catalog[instance_type] = (vcpus, cores, runtime.speed(instance_type))
+    observed = observed_rates(simulated=simulate)
+
+    plans = []
+    for runtime in runtimes:
+        for offer in runtime.offers(ranks):
+            rate, basis = estimate_rate(offer, ranks, observed, catalog)
+            hours = (STARTUP_SECONDS + total_time_steps / rate) / 3600
+            cost = hours * offer["pricePerHour"]
+            feasible = (deadline_hours is None or hours <= deadline_hours) and (budget is None or cost <= budget)
+            plans.append({**offer, "ranks": ranks, "stepsPerSecond": round(rate, 3), "basis": basis,
+                          "hours": round(hours, 2), "cost": round(cost, 2), "feasible": feasible})
+
+    if objective == "time":
+        plans.sort(key=lambda p: (not p["feasible"], p["hours"], p["cost"]))
+    else:
+        plans.sort(key=lambda p: (not p["feasible"], p["cost"], p["hours"]))
+    return plans
+
+
+def best(ranks, total_time_steps, objective="time", deadline_hours=None, budget=None, runtimes=None,
+         simulate=False):
+    plans = plan(ranks, total_time_steps, objective, deadline_hours, budget, runtimes, simulate)
+    if not plans or not plans[0]["feasible"]:
+        return None
+    return plans[0]
@@ -0,0 +1,87 @@
+import time
+import random
+import hashlib
+from datetime import datetime
+from veda_cli import store
+from veda_cli.runtimes import Runtime
+
+# Steps per second of one rank on a c5 core in the simulated runs. Matches the placement prior on purpose,
+# the per instance type bias below is what the placement engine has to learn from recorded metrics
+BASE_RANK_STEPS_PER_SECOND = 0.025
+HYPERTHREAD_EFFICIENCY = 0.6
+METRIC_SAMPLES = 5
+
+
+def instance_bias(instance_type):
+    """
+    Stable pseudo random factor between 0.8 and 1.2 per instance type standing in for everything the
+    published per core speeds miss, like memory bandwidth and network
+    """
+    digest = hashlib.sha256(instance_type.encode("utf-8")).digest()
+    return 0.8 + 0.4 * digest[0] / 255
+
+
+class SimulatedRuntime(Runtime):
+    """
+    Offers the instance types of another runtime at its prices, but launching only records an execution and
+    the throughput metrics a run would have produced. Lets placement be exercised without any cloud account.
+    """
+
+    def __init__(self, runtime, seed=None):
+        self.runtime = runtime
+        self.name = runtime.name
+        self.label = "Simulated " + runtime.label
+        self.random = random.Random(seed)
+
+    def instance_types(self):
+        return self.runtime.instance_types()
+
+    def price_per_hour(self, instance_type):
+        return self.runtime.price_per_hour(instance_type)
+
+    def speed(self, instance_type):
+        return self.runtime.speed(instance_type)
+
+    def get_states(self, executions):
+        # Simulated runs never have an instance
+        return {execution["instanceId"]: "terminated" for execution in executions if execution.get("instanceId")}
+
+    def terminate(self, executions):
+        pass
+
+    def steps_per_second(self, instance_type, ranks):
+        vcpus, cores = self.instance_types()[instance_type]
+        efficiency = HYPERTHREAD_EFFICIENCY if ranks > cores else 1.0
+        return (ranks * BASE_RANK_STEPS_PER_SECOND * self.speed(instance_type) * efficiency
+                * instance_bias(instance_type))
+
+    def launch(self, execution_name, ecco_configs, ranks=None, instance_type=None, test_steps=None, **options):
+        run_cfg = self.build(ecco_configs, ranks, instance_type, test_steps)
+        execution_id = "sim" + "".join(self.random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=5))
+        rate = self.steps_per_second(run_cfg["instanceType"], run_cfg["ranks"])
+
+        db_conn = store.get_execution_db()
+        db_conn.add({
+            "type": "Execution",
+            "runtime": "Simulated",
+            "simulatedRuntime": self.name,
+            "application": "ECCO",
+            "executionId": execution_id,
+            "name": execution_name,
+            "createdTime": datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),
+            "eccoConfigs": run_cfg["eccoConfigs"],
+            "instanceType": run_cfg["instanceType"],
+            "ranks": run_cfg["ranks"],
+            "testSteps": run_cfg["testSteps"]})
+
+        now = time.time()
+        db_conn.addMany([{
+            "type": "ExecutionMetric",
+            "executionId": execution_id,
+            "instanceType": run_cfg["instanceType"],
+            "ranks": run_cfg["ranks"],
+            "simulated": True,
+            "time": now + i,
+            "stepsPerSecond": rate * self.random.gauss(1.0, 0.03)} for i in range(METRIC_SAMPLES)])
+        print(f"Simulated ECCO run {execution_id} on {self.label} {run_cfg['instanceType']}: {rate:.2f} steps/s")
+        return execution_id
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import socketserver
+import paramiko
+from veda_cli import store
+from veda_cli import trace
+
+KEEPALIVE_SECONDS = 30
+DAEMON_IDLE_SECONDS = 600
+
+_connections = {}
+_connections_lock = threading.Lock()
+_connect_locks = {}
+
+
+def get_socket_dir():
+    return os.path.join(store.VEDA_HOME, "ssh")
+
+
+def socket_path(name):
+    return os.path.join(get_socket_dir(), name + ".sock")
+
+
+def probe_banner(host, port=22, timeout=5.0):
+    """
+    True when the host accepts a TCP connection and sends an SSH identification string. An open port
+    alone is not enough, sshd may still be starting and drop the connection.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            return sock.recv(256).startswith(b"SSH-")
+    except OSError:
+        return False
+
+
+def wait_for_ssh(host, port=22, timeout=300.0, initial_delay=0.5, max_delay=8.0):
+    """
+    Waits until sshd answers with its banner. Probes back off exponentially from initial_delay to max_delay.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while not probe_banner(host, port, timeout=min(5.0, timeout)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("SSH on " + host + " did not come up in " + str(timeout) + " seconds")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def _is_active(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+def _open(user, host, key_file, port, wait, compress):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    pkey = paramiko.RSAKey.from_private_key_file(key_file)
+    try:
+        client.connect(hostname=host, port=port, username=user, pkey=pkey, allow_agent=False, look_for_keys=False,
+                       compress=compress)
+    except (OSError, paramiko.SSHException):
+        # Only probe when the host is not ready yet, a running host connects on the first try
+        if not wait:
+            raise
+        wait_for_ssh(host, port)
+        client.connect(hostname=host, port=port, username=user, pkey=pkey, allow_agent=False, look_for_keys=False,
+                       compress=compress)
+    trace.count("ssh connections")
+    transport = client.get_transport()
+    transport.set_keepalive(KEEPALIVE_SECONDS)
+    # Channel requests are small packets, without this each one can wait on a delayed ACK
+    transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return client
+
+
+def connect(user, host, key_file, port=22, wait=True, compress=False):
+    """
+    Returns a shared SSH connection to host. Commands and SFTP sessions opened on it are multiplexed as
+    channels over one transport, so only the first call per host pays for the handshake. Compressed
+    connections are kept separately from uncompressed ones.
+    """
+    key = (user, host, port, key_file, compress)
+    with _connections_lock:
+        client = _connections.get(key)
+        if client is not None and _is_active(client):
+            return client
+        key_lock = _connect_locks.setdefault(key, threading.Lock())
+
+    # Waiting for a booting host can take minutes, so only callers for the same host wait on each other
+    with key_lock:
+        with _connections_lock:
+            client = _connections.get(key)
+            if client is not None and _is_active(client):
+                return client
+        client = _open(user, host, key_file, port, wait, compress)
+        with _connections_lock:
+            _connections[key] = client
+        return client
+
+
+def connect_execution(execution, wait=True, compress=False):
+    return connect(execution["loginUser"], execution["publicIp"], execution["keyPath"], execution.get("sshPort", 22), wait,
+                   compress)
+
+
+def close(client=None):
+    with _connections_lock:
+        for key, c in list(_connections.items()):
+            if client is None or c is client:
+                c.close()
+                del _connections[key]
+
+
+def run_on(client, command, timeout=None):
+    """
+    Runs a command on its own channel of the connection and returns (exit status, stdout, stderr)
+    """
+    trace.count("ssh commands")
+    channel = client.get_transport().open_session(timeout=timeout)
+    try:
+        channel.settimeout(timeout)
+        channel.exec_command(command)
+        stdout = channel.makefile("rb").read().decode("utf-8", "replace")
+        stderr = channel.makefile_stderr("rb").read().decode("utf-8", "replace")
+        return channel.recv_exit_status(), stdout, stderr
+    finally:
+        channel.close()
+
+
+def _send(path, request, timeout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        return json.loads(sock.makefile("rb").readline())
+
+
+def start_daemon(execution):
+    """
+    Starts a background process that keeps the SSH session of an execution open and serves commands on a
+    local control socket
+    """
+    os.makedirs(get_socket_dir(), mode=0o700, exist_ok=True)
+    log = open(os.path.join(get_socket_dir(), execution["executionId"] + ".log"), "ab")
+    subprocess.Popen([sys.executable, "-m", "veda_cli.ssh",
+                      "--socket", socket_path(execution["executionId"]),
+                      "--user", execution["loginUser"], "--host", execution["publicIp"],
+                      "--port", str(execution.get("sshPort", 22)), "--key", execution["keyPath"]],
+                     stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    log.close()
+
+
+def run(execution, command, timeout=None, persist=True, wait=True):
+    """
+    Runs a command on the instance of an execution and returns (exit status, stdout, stderr). Goes through
+    the control socket of the execution when a daemon is serving it, which skips the SSH handshake. Otherwise
+    the command runs on a direct connection and, with persist, a daemon is started for later invocations.
+    One-off probes of many executions should pass persist=False so they do not leave a daemon per instance.
+    """
+    path = socket_path(execution["executionId"])
+    if os.path.exists(path):
+        try:
+            # The daemon refuses the command if it serves another host, e.g. after a spot relaunch
+            response = _send(path, {"command": command, "timeout": timeout, "host": execution["publicIp"]}, timeout)
+        except socket.timeout:
+            # The daemon took the command, it is still running remotely
+            raise
+        except (OSError, ValueError):
+            response = None
+            # Stale socket left behind by a daemon that is gone
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if response is not None and "refused" not in response:
+            # The command went through the daemon. Running it again directly could repeat its side effects
+            if "error" in response:
+                raise paramiko.SSHException(response["error"])
+            return response["exitStatus"], response["stdout"], response["stderr"]
+
+    result = run_on(connect_execution(execution, wait), command, timeout)
+    if persist and not os.path.exists(path):
+        start_daemon(execution)
+    return result
+
+
+def stop_daemon(execution_id):
+    path = socket_path(execution_id)
+    if not os.path.exists(path):
+        return False
+    try:
+        _send(path, {"shutdown": True}, 5)
+    except (OSError, ValueError):
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.server.last_used = time.monotonic()
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("shutdown") or request.get("host", self.server.host) != self.server.host:
+                stopped = {"stopped": True} if request.get("shutdown") else {"refused": "Serving " + self.server.host}
+                self.wfile.write(json.dumps(stopped).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            else:
+                exit_status, stdout, stderr = run_on(self.server.connect(), request["command"], request.get("timeout"))
+                response = {"exitStatus": exit_status, "stdout": stdout, "stderr": stderr}
+        except Exception as e:
+            response = {"error": str(e)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.server.last_used = time.monotonic()
+
+
+class _ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path, user, host, key_file, port=22, idle_timeout=DAEMON_IDLE_SECONDS):
+    """
+    Serves commands for one host on a unix socket until it has been idle for idle_timeout seconds
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = _ControlServer(path, _Handler)
+    os.chmod(path, 0o600)
+    server.last_used = time.monotonic()
+    server.host = host
+    server.connect = lambda: connect(user, host, key_file, port)
+
+    def watch_idle():
+        while time.monotonic() - server.last_used < idle_timeout:
+            time.sleep(min(5.0, idle_timeout))
+        server.shutdown()
+
+    threading.Thread(target=watch_idle, daemon=True).start()
+    try:
+        server.connect()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps an SSH session open behind a local control socket")
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--host", required=True)
+    parser.add_argument("--port", type=int, default=22)
+    parser.add_argument("--key", required=True)
+    parser.add_argument("--idle", type=float, default=float(os.environ.get("VEDA_SSH_IDLE", DAEMON_IDLE_SECONDS)))
+    args = parser.parse_args()
+    serve(args.socket, args.user, args.host, args.key, args.port, args.idle)
@@ -0,0 +1,300 @@
+import os
+import json
+import sqlite3
+import threading
+import uuid
+from veda_cli import trace
+
+VEDA_HOME = os.path.join(os.path.expanduser('~'), ".veda")
+
+# Fields promoted to their own indexed columns. Every other field only lives in the json blob
+# and is matched in python after the indexed columns have narrowed down the candidate rows
+INDEXED_FIELDS = ["type", "name", "executionId", "storageId"]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def new_id():
+    # Same id format pysondb uses so records keep their ids across backends
+    return int(str(uuid.uuid4().int)[:18])
+
+
+class JsonStore:
+    """
+    Store kept in the legacy pysondb json file ({"data": [...]}). Every call parses the whole file, so it is
+    only meant for small stores. Unlike pysondb it accepts records with differing fields, the same as the
+    sqlite store does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._save({"data": []})
+
+    def _load(self):
+        trace.count("store queries")
+        with open(self.path, "r", encoding='utf-8') as json_file:
+            content = json.load(json_file)
+        content.setdefault("data", [])
+        return content
+
+    def _save(self, content):
+        # Written to a temporary file first so a crash never leaves a truncated store behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as json_file:
+            json.dump(content, json_file)
+        os.replace(tmp_path, self.path)
+
+    def iterBy(self, query):
+        with self.lock:
+            records = self._load()["data"]
+        return (record for record in records if all(record.get(k) == v for k, v in query.items()))
+
+    def getBy(self, query):
+        return list(self.iterBy(query))
+
+    def getAll(self):
+        return self.getBy({})
+
+    def getById(self, pk):
+        records = self.getBy({"id": int(pk)})
+        return records[0] if records else None
+
+    def add(self, record):
+        return self.addMany([record])[0]
+
+    def addMany(self, records):
+        for record in records:
+            record["id"] = new_id()
+        with self.lock:
+            content = self._load()
+            content["data"].extend(records)
+            self._save(content)
+        return [record["id"] for record in records]
+
+    def updateById(self, pk, new_data):
+        with self.lock:
+            record = self.getById(pk)
+            if record is None:
+                raise KeyError(pk)
+            record.update(new_data)
+            self.replaceById(pk, record)
+
+    def replaceById(self, pk, record):
+        with self.lock:
+            content = self._load()
+            content["data"] = [dict(record, id=int(pk)) if r.get("id") == int(pk) else r for r in content["data"]]
+            self._save(content)
+
+    def deleteById(self, pk):
+        with self.lock:
+            content = self._load()
+            remaining = [r for r in content["data"] if r.get("id") != int(pk)]
+            deleted = len(remaining) < len(content["data"])
+            content["data"] = remaining
+            self._save(content)
+        return deleted
+
+    def deleteMany(self, pks):
+        pks = set(int(pk) for pk in pks)
+        with self.lock:
+            content = self._load()
+            content["data"] = [r for r in content["data"] if r.get("id") not in pks]
+            self._save(content)
+
+    def get_meta(self, key):
+        with self.lock:
+            return self._load().get("meta", {}).get(key)
+
+    def set_meta(self, key, value):
+        with self.lock:
+            content = self._load()
+            content.setdefault("meta", {})[key] = value
+            self._save(content)
+
+
+class SqliteStore:
+    """
+    SQLite backed store with secondary indexes on the commonly queried record fields. Exposes the
+    same methods as JsonStore so the commands can use either backend.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(field + " TEXT" for field in INDEXED_FIELDS)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, "
+                              + columns + ", data TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            for field in INDEXED_FIELDS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_records_{field} ON records ({field})")
+
+    def _row_values(self, record):
+        data = {k: v for k, v in record.items() if k != "id"}
+        indexed = [data.get(field) for field in INDEXED_FIELDS]
+        return [None if v is None else str(v) for v in indexed] + [json.dumps(data)]
+
+    def _to_record(self, row):
+        record = json.loads(row[1])
+        record["id"] = row[0]
+        return record
+
+    def _select(self, query):
+        trace.count("store queries")
+        clauses = []
+        params = []
+        remaining = {}
+        for k, v in query.items():
+            if k in INDEXED_FIELDS:
+                clauses.append(k + " = ?")
+                params.append(str(v))
+            elif k == "id":
+                clauses.append("id = ?")
+                params.append(int(v))
+            else:
+                remaining[k] = v
+
+        sql = "SELECT id, data FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY rowid"
+        return sql, params, remaining
+
+    def iterBy(self, query):
+        sql, params, remaining = self._select(query)
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+        # Rows are fetched in batches so streaming a large store through a command keeps memory constant
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                record = self._to_record(row)
+                if all(record.get(k) == v for k, v in remaining.items()):
+                    yield record
+
+    def getBy(self, query):
+        return list(self.iterBy(query))
+
+    def getAll(self):
+        return self.getBy({})
+
+    def getById(self, pk):
+        records = self.getBy({"id": pk})
+        return records[0] if records else None
+
+    def add(self, record):
+        return self.addMany([record])[0]
+
+    def addMany(self, records):
+        # Like pysondb, every added record gets a fresh id even if it was copied from an existing one
+        for record in records:
+            record["id"] = new_id()
+        return self._insert(records)
+
+    def _insert(self, records):
+        rows = [[record["id"]] + self._row_values(record) for record in records]
+        placeholders = ", ".join(["?"] * (len(INDEXED_FIELDS) + 2))
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO records (id, " + ", ".join(INDEXED_FIELDS) + ", data) VALUES ("
+                                  + placeholders + ")", rows)
+        return [record["id"] for record in records]
+
+    def updateById(self, pk, new_data):
+        with self.lock, self.conn:
+            record = self.getById(pk)
+            if record is None:
+                raise KeyError(pk)
+            record.update(new_data)
+            self.replaceById(pk, record)
+
+    def replaceById(self, pk, record):
+        with self.lock, self.conn:
+            assignments = ", ".join(field + " = ?" for field in INDEXED_FIELDS)
+            self.conn.execute("UPDATE records SET " + assignments + ", data = ? WHERE id = ?",
+                              self._row_values(record) + [int(pk)])
+
+    def deleteById(self, pk):
+        with self.lock, self.conn:
+            deleted = self.conn.execute("DELETE FROM records WHERE id = ?", [int(pk)]).rowcount
+        return deleted > 0
+
+    def deleteMany(self, pks):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM records WHERE id = ?", [[int(pk)] for pk in pks])
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", [key]).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [key, value])
+
+
+def migrate_json(json_path, sqlite_store):
+    """
+    One time import of a pysondb json file into a sqlite store. Record ids are preserved.
+    """
+    if sqlite_store.get_meta("migrated_from") is not None:
+        return 0
+
+    records = []
+    if os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+        with open(json_path, "r", encoding='utf-8') as json_file:
+            records = json.load(json_file).get("data", [])
+
+    if records:
+        sqlite_store._insert(records)
+        print(f"Migrated {len(records)} records from {json_path}")
+
+    sqlite_store.set_meta("migrated_from", json_path)
+    return len(records)
+
+
+def get_backend():
+    return os.environ.get("VEDA_METADATA_BACKEND", "sqlite")
+
+
+def open_store(name, backend=None, home=None):
+    """
+    Returns the process wide store for the given logical database name ("ds" for datasets,
+    "db" for executions). The selected backend can be overridden with VEDA_METADATA_BACKEND=json
+    """
+    backend = backend or get_backend()
+    home = home or VEDA_HOME
+    key = (backend, home, name)
+
+    with _stores_lock:
+        if key in _stores:
+            return _stores[key]
+
+        os.makedirs(home, exist_ok=True)
+        json_path = os.path.join(home, name + ".json")
+        if backend == "json":
+            store = JsonStore(json_path)
+        elif backend == "sqlite":
+            store = SqliteStore(os.path.join(home, name + ".sqlite"))
+            migrate_json(json_path, store)
+        else:
+            raise ValueError("Unknown metadata backend " + backend)
+
+        _stores[key] = store
+        return store
+
+
+def get_dataset_db():
+    return open_store("ds")
+
+
+def get_execution_db():
+    return open_store("db")
@@ -0,0 +1,155 @@
+"""
+Opt in tracing of where a command spends its time. `veda --profile ...` and VEDA_TRACE=1 print per phase
+timings, counters such as bytes moved, and gRPC calls per method to stderr when the command exits.
+VEDA_TRACE=<file> appends the same data as one json line to the file instead, which is what the benchmark
+harness collects. When tracing is off every hook is a single flag check.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+STDERR_VALUES = ["1", "true", "yes", "stderr"]
+
+_enabled = False
+_destination = None
+_started = None
+_lock = threading.Lock()
+_local = threading.local()
+_phases = {}
+_counters = {}
+_rpcs = {}
+
+
+def enabled():
+    return _enabled
+
+
+def enable(destination=None):
+    global _enabled, _destination, _started
+    if _enabled:
+        return
+    _enabled = True
+    _destination = destination or os.environ.get("VEDA_TRACE") or "1"
+    _started = time.perf_counter()
+    atexit.register(report)
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the enclosed block. Phases nest per thread, an inner phase is recorded as outer/inner
+    """
+    if not _enabled:
+        yield
+        return
+
+    parent = getattr(_local, "path", "")
+    path = parent + "/" + name if parent else name
+    _local.path = path
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.path = parent
+        elapsed = time.perf_counter() - start
+        with _lock:
+            entry = _phases.setdefault(path, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record_rpc(method, sent, received, seconds):
+    with _lock:
+        entry = _rpcs.setdefault(method, [0, 0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += sent
+        entry[2] += received
+        entry[3] += seconds
+
+
+def _rpc_interceptor():
+    import grpc
+
+    class RPCCounter(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+
+        def intercept_unary_unary(self, continuation, client_call_details, request):
+            method = client_call_details.method.rsplit("/", 1)[-1]
+            start = time.perf_counter()
+            call = continuation(client_call_details, request)
+
+            def on_done(future):
+                received = 0 if future.exception() is not None else future.result().ByteSize()
+                record_rpc(method, request.ByteSize(), received, time.perf_counter() - start)
+
+            call.add_done_callback(on_done)
+            return call
+
+        def intercept_unary_stream(self, continuation, client_call_details, request):
+            record_rpc(client_call_details.method.rsplit("/", 1)[-1], request.ByteSize(), 0, 0.0)
+            return continuation(client_call_details, request)
+
+    return RPCCounter()
+
+
+def intercept(channel):
+    """
+    Wraps a gRPC channel so the calls made on it are counted with their payload sizes and latency
+    """
+    if not _enabled:
+        return channel
+    import grpc
+    return grpc.intercept_channel(channel, _rpc_interceptor())
+
+
+def snapshot():
+    with _lock:
+        return {
+            "command": " ".join([os.path.basename(sys.argv[0])] + sys.argv[1:]),
+            "seconds": round(time.perf_counter() - _started, 4) if _started is not None else 0.0,
+            "phases": {name: {"count": c, "seconds": round(s, 4)} for name, (c, s) in _phases.items()},
+            "counters": dict(_counters),
+            "rpcs": {method: {"calls": c, "sentBytes": sent, "receivedBytes": received, "seconds": round(s, 4)}
+                     for method, (c, sent, received, s) in _rpcs.items()},
+        }
+
+
+def format_report(data):
+    lines = [f"trace: {data['command']} took {data['seconds'] * 1000:.0f} ms"]
+    if data["phases"]:
+        lines.append(f"  {'phase':40s} {'count':>6} {'ms':>10}")
+        for name, entry in sorted(data["phases"].items()):
+            lines.append(f"  {name:40s} {entry['count']:>6} {entry['seconds'] * 1000:>10.1f}")
+    if data["rpcs"]:
+        lines.append(f"  {'rpc':40s} {'calls':>6} {'ms':>10} {'sent':>10} {'received':>10}")
+        for method, entry in sorted(data["rpcs"].items()):
+            lines.append(f"  {method:40s} {entry['calls']:>6} {entry['seconds'] * 1000:>10.1f} "
+                         f"{entry['sentBytes']:>10} {entry['receivedBytes']:>10}")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"  {name:40s} {value:>6}")
+    return "\n".join(lines)
+
+
+def report():
+    if not _enabled:
+        return
+    data = snapshot()
+    if _destination.lower() in STDERR_VALUES:
+        print(format_report(data), file=sys.stderr)
+    else:
+        with open(_destination, "a") as f:
+            f.write(json.dumps(data) + "\n")
+
+
+if os.environ.get("VEDA_TRACE"):
+    enable()
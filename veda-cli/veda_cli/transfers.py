@@ -0,0 +1,418 @@
+import heapq
+import math
+import time
+import typer
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from airavata_mft_sdk import MFTTransferApi_pb2
+from veda_cli import mft
+from veda_cli import trace
+
+
+class TransferStatus:
+
+    def __init__(self, transfer_id, total_files=0, total_bytes=0, label=None):
+        self.transfer_id = transfer_id
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.label = label or transfer_id
+        self.started = time.monotonic()
+        self.last_change = self.started
+        self.finished = None
+        self.percentage = 0.0
+        self.state = ""
+        self.description = ""
+        self.completed = []
+        self.failed = []
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def succeeded(self):
+        return self.done and self.state != "FAILED"
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def files_per_second(self):
+        elapsed = self.elapsed()
+        return self.total_files * self.percentage / elapsed if elapsed > 0 else 0.0
+
+    def bytes_per_second(self):
+        elapsed = self.elapsed()
+        return self.total_bytes * self.percentage / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        if self.done:
+            return 0.0
+        if self.percentage <= 0:
+            return None
+        return self.elapsed() * (1 - self.percentage) / self.percentage
+
+    def update(self, state_resp):
+        changed = state_resp.percentage != self.percentage or state_resp.state != self.state
+        if changed:
+            self.last_change = time.monotonic()
+        self.percentage = state_resp.percentage
+        self.state = state_resp.state
+        self.description = state_resp.description
+        # Kept while the transfer runs too, so a stalled transfer can be resumed with the files it did not copy
+        self.completed = list(state_resp.completed)
+        self.failed = list(state_resp.failed)
+
+        if state_resp.percentage == 1.0 or state_resp.state == "FAILED":
+            self.finished = time.monotonic()
+        return changed
+
+    def summary(self):
+        line = f"{self.label}: {self.percentage * 100:.0f}% {self.state}"
+        if self.total_files:
+            line += f", {self.files_per_second():.1f} files/s"
+        if self.total_bytes:
+            line += f", {self.bytes_per_second() / (1024 * 1024):.2f} MB/s"
+        eta = self.eta()
+        if eta is not None and not self.done:
+            line += f", ETA {eta:.0f}s"
+        return line
+
+
+class TransferMonitor:
+    """
+    Tracks the state of many transfers over a single MFT client. Instead of polling every transfer once a
+    second, the poll interval starts small so short transfers return quickly, backs off for long running
+    ones and is cut short when a transfer is expected to finish. Finished transfers are not polled again.
+    """
+
+    def __init__(self, client, min_interval=0.2, max_interval=5.0, backoff=1.5):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.transfers = {}
+        self.rpc_count = 0
+
+    def add(self, transfer_id, total_files=0, total_bytes=0, label=None):
+        status = TransferStatus(transfer_id, total_files, total_bytes, label)
+        self.transfers[transfer_id] = status
+        self.interval = self.min_interval
+        return status
+
+    def remove(self, transfer_id):
+        return self.transfers.pop(transfer_id, None)
+
+    def active(self):
+        return [t for t in self.transfers.values() if not t.done]
+
+    def percentage(self):
+        if not self.transfers:
+            return 1.0
+        total_files = sum(t.total_files for t in self.transfers.values())
+        if total_files:
+            return sum(t.percentage * t.total_files for t in self.transfers.values()) / total_files
+        return sum(t.percentage for t in self.transfers.values()) / len(self.transfers)
+
+    def poll(self):
+        """
+        Fetches the state of every active transfer once. Returns True if any transfer made progress
+        """
+        changed = False
+        for status in self.active():
+            state_request = MFTTransferApi_pb2.TransferStateApiRequest(transferId=status.transfer_id)
+            state_resp = self.client.transfer_api.getTransferStateSummary(state_request)
+            self.rpc_count += 1
+            changed = status.update(state_resp) or changed
+        return changed
+
+    def next_interval(self):
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        # Do not oversleep a transfer that is about to finish
+        etas = [t.eta() for t in self.active() if t.eta() is not None]
+        if etas:
+            return max(self.min_interval, min(self.interval, min(etas)))
+        return self.interval
+
+    def wait(self, on_update=None, fail_fast=False):
+        while self.active():
+            self.poll()
+            if on_update is not None:
+                on_update(self)
+            if fail_fast and any(t.state == "FAILED" for t in self.transfers.values()):
+                break
+            if not self.active():
+                break
+            time.sleep(self.next_interval())
+        return self.transfers
+
+    def wait_with_progress(self, fail_fast=False):
+        with typer.progressbar(length=100) as progress:
+            reported = [0]
+
+            def on_update(monitor):
+                current = int(monitor.percentage() * 100)
+                progress.update(current - reported[0])
+                reported[0] = current
+
+            return self.wait(on_update, fail_fast)
+
+
+def build_request(source_storage_id, dest_storage_id):
+    """
+    Resolves the storage and secret ids once and returns a transfer request without any endpoint paths.
+    """
+    source_storage_id, source_secret_id = mft.fetch_storage_and_secret_ids(source_storage_id)
+    dest_storage_id, dest_secret_id = mft.fetch_storage_and_secret_ids(dest_storage_id)
+
+    return MFTTransferApi_pb2.TransferApiRequest(sourceStorageId = source_storage_id,
+                                                 sourceSecretId = source_secret_id,
+                                                 destinationStorageId = dest_storage_id,
+                                                 destinationSecretId = dest_secret_id,
+                                                 optimizeTransferPath = False)
+
+
+def submit_request(template_request, endpoint_paths):
+    transfer_request = MFTTransferApi_pb2.TransferApiRequest()
+    transfer_request.CopyFrom(template_request)
+    transfer_request.endpointPaths.extend(endpoint_paths)
+    return mft.get_client().transfer_api.submitTransfer(transfer_request).transferId
+
+
+def submit(source_storage_id, dest_storage_id, endpoint_paths):
+    """
+    Submits a transfer between two storages (names or ids) and returns the transfer id without waiting.
+    """
+    return submit_request(build_request(source_storage_id, dest_storage_id), endpoint_paths)
+
+
+def copy(source_storage_id, dest_storage_id, endpoint_paths, total_bytes=0):
+
+    transfer_id = submit(source_storage_id, dest_storage_id, endpoint_paths)
+
+    monitor = TransferMonitor(mft.get_client())
+    status = monitor.add(transfer_id, total_files=len(endpoint_paths), total_bytes=total_bytes)
+    try:
+        monitor.wait_with_progress(fail_fast=True)
+    except KeyboardInterrupt:
+        remove_transfers(mft.get_client(), [transfer_id])
+        raise
+
+    if (status.state == "FAILED"):
+        print("Transfer failed. Reason: " + status.description)
+        raise typer.Abort()
+
+    completed = len(status.completed)
+    failed = len(status.failed)
+    trace.count("transferred files", completed)
+    if not failed:
+        trace.count("transferred bytes", total_bytes)
+    print(f"Processed {completed + failed} files. Completed {completed}, Failed {failed}.")
+    print(status.summary())
+
+
+def remove_transfers(client, transfer_ids):
+    """
+    Stops transfers that are still running on the agents, e.g. when the copy waiting for them is interrupted
+    """
+    for transfer_id in transfer_ids:
+        try:
+            client.transfer_api.removeTransfer(MFTTransferApi_pb2.TransferRemoveRequest(transferId=transfer_id))
+        except Exception as e:
+            print("Failed to remove transfer " + transfer_id + ": " + str(e))
+
+
+def flatten_directories(directory, parent_path, file_list):
+    for dir in directory.directories:
+        flatten_directories(dir, parent_path + dir.friendlyName + "/", file_list)
+
+    for file in directory.files:
+        file_list.append((file, parent_path + file.friendlyName))
+
+
+def copy_path(source, destination, confirm=True):
+    """
+    Copies a file or directory given as <storage>/<path> to <storage>/<path>. Same behaviour as
+    mft-cli copy but over the pooled MFT client. Without confirm the transfer starts without asking.
+    """
+    source_metadata = mft.get_resource_metadata(source, recursive_search=True)
+    destination_path = destination[len(destination.split("/")[0]) + 1:]
+    endpoint_paths = []
+    total_volume = 0
+
+    if (source_metadata.WhichOneof('metadata') == 'directory'):
+        if (destination[-1] != "/"):
+            print("Source is a directory path so destination path should end with /")
+            raise typer.Abort()
+
+        file_list = []
+        flatten_directories(source_metadata.directory, "", file_list)
+        for file, relative_path in file_list:
+            endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
+                sourcePath = file.resourcePath,
+                destinationPath = destination_path + relative_path))
+            total_volume += file.resourceSize
+
+    elif (source_metadata.WhichOneof('metadata') == 'file'):
+        if destination[-1] == "/":
+            destination_path = destination_path + source_metadata.file.friendlyName
+
+        endpoint_paths.append(MFTTransferApi_pb2.EndpointPaths(
+            sourcePath = source_metadata.file.resourcePath,
+            destinationPath = destination_path))
+        total_volume += source_metadata.file.resourceSize
+
+    elif (source_metadata.WhichOneof('metadata') == 'error'):
+        print("Failed while fetching source details")
+        print(source_metadata.error)
+        raise typer.Abort()
+
+    if confirm and not typer.confirm("Total number of " + str(len(endpoint_paths)) +
+                                     " files to be transferred. Total volume is " + str(total_volume)
+                                     + " bytes. Do you want to start the transfer? ", True):
+        raise typer.Abort()
+
+    copy(source.split("/")[0], destination.split("/")[0], endpoint_paths, total_volume)
+
+
+class Shard:
+
+    def __init__(self, index):
+        self.index = index
+        self.endpoint_paths = []
+        self.sizes = []
+        self.total_bytes = 0
+        self.attempts = 0
+        self.status = None
+
+    def add(self, endpoint_path, size):
+        self.endpoint_paths.append(endpoint_path)
+        self.sizes.append(size)
+        self.total_bytes += size
+
+    def split(self, completed):
+        """
+        Moves the files MFT reported as completed into a new shard and keeps the others in this one, so a
+        retry only transfers what is still missing
+        """
+        done = Shard(self.index)
+        endpoint_paths, sizes = self.endpoint_paths, self.sizes
+        self.endpoint_paths, self.sizes, self.total_bytes = [], [], 0
+        for endpoint_path, size in zip(endpoint_paths, sizes):
+            if endpoint_path.sourcePath in completed or endpoint_path.destinationPath in completed:
+                done.add(endpoint_path, size)
+            else:
+                self.add(endpoint_path, size)
+        return done
+
+
+def make_shards(endpoint_paths, sizes, shard_count):
+    """
+    Splits the endpoint paths into shard_count shards of roughly equal total size by always adding the
+    next largest file to the currently lightest shard.
+    """
+    shards = [Shard(i) for i in range(shard_count)]
+    heap = [(0, i) for i in range(shard_count)]
+    for size, endpoint_path in sorted(zip(sizes, endpoint_paths), key=lambda e: e[0], reverse=True):
+        total, i = heapq.heappop(heap)
+        shards[i].add(endpoint_path, size)
+        # Files of unknown size still count, otherwise they would all land in the same shard
+        heapq.heappush(heap, (total + max(size, 1), i))
+    return [shard for shard in shards if shard.endpoint_paths]
+
+
+def copy_sharded(source_storage_id, dest_storage_id, endpoint_paths, sizes=None, concurrency=4,
+                 files_per_shard=500, max_attempts=3, stall_timeout=600, on_shard_done=None):
+    """
+    Copies a large file list as several size balanced transfers. At most `concurrency` shards run at a
+    time. When a shard fails or makes no progress for `stall_timeout` seconds, the files it did not copy are
+    resubmitted on their own, up to `max_attempts` times. on_shard_done is called with the files of each shard
+    that completed, as a shard.
+    """
+    if sizes is None or len(sizes) != len(endpoint_paths):
+        sizes = [1] * len(endpoint_paths)
+
+    shards = make_shards(endpoint_paths, sizes, max(1, math.ceil(len(endpoint_paths) / files_per_shard)))
+    template_request = build_request(source_storage_id, dest_storage_id)
+    client = mft.get_client()
+    monitor = TransferMonitor(client)
+
+    pending = deque(shards)
+    running = {}
+    failed_shards = []
+    completed_files = 0
+    reported = 0
+
+    print(f"Transferring {len(endpoint_paths)} files as {len(shards)} shards, {concurrency} at a time")
+
+    def shard_done(shard):
+        trace.count("transferred files", len(shard.endpoint_paths))
+        trace.count("transferred bytes", shard.total_bytes)
+        if on_shard_done is not None:
+            on_shard_done(shard)
+        return len(shard.endpoint_paths)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, typer.progressbar(length=100) as progress:
+        try:
+            while pending or running:
+                to_submit = []
+                while pending and len(running) + len(to_submit) < concurrency:
+                    to_submit.append(pending.popleft())
+
+                transfer_ids = pool.map(lambda shard: submit_request(template_request, shard.endpoint_paths), to_submit)
+                for shard, transfer_id in zip(to_submit, transfer_ids):
+                    shard.attempts += 1
+                    shard.status = monitor.add(transfer_id, total_files=len(shard.endpoint_paths),
+                                               total_bytes=shard.total_bytes, label=f"shard {shard.index}")
+                    running[transfer_id] = shard
+
+                monitor.poll()
+
+                finished_any = False
+                for transfer_id, shard in list(running.items()):
+                    status = shard.status
+                    stalled = not status.done and time.monotonic() - status.last_change > stall_timeout
+                    if not status.done and not stalled:
+                        continue
+
+                    finished_any = True
+                    del running[transfer_id]
+                    monitor.remove(transfer_id)
+
+                    if stalled:
+                        remove_transfers(client, [transfer_id])
+
+                    if stalled or status.state == "FAILED" or status.failed:
+                        done = shard.split(set(status.completed))
+                        if done.endpoint_paths:
+                            completed_files += shard_done(done)
+                        if not shard.endpoint_paths:
+                            continue
+                        reason = "stalled" if stalled else status.description or "failed"
+                        if shard.attempts < max_attempts:
+                            print(f"\nShard {shard.index} {reason}. Retrying {len(shard.endpoint_paths)} files "
+                                  f"({shard.attempts}/{max_attempts})")
+                            pending.append(shard)
+                        else:
+                            failed_shards.append(shard)
+                    else:
+                        completed_files += shard_done(shard)
+
+                in_flight = sum(shard.status.percentage * len(shard.endpoint_paths) for shard in running.values())
+                current = int((completed_files + in_flight) * 100 / max(1, len(endpoint_paths)))
+                progress.update(current - reported)
+                reported = current
+
+                if running and not finished_any:
+                    time.sleep(monitor.next_interval())
+        except KeyboardInterrupt:
+            remove_transfers(client, list(running))
+            raise
+
+    failed_files = sum(len(shard.endpoint_paths) for shard in failed_shards)
+    print(f"Processed {len(endpoint_paths)} files. Completed {completed_files}, Failed {failed_files}.")
+    if failed_shards:
+        print("Shards " + ", ".join(str(shard.index) for shard in failed_shards) + " failed after "
+              + str(max_attempts) + " attempts")
+        raise typer.Abort()